@@ -0,0 +1,40 @@
+"""
+Worker dedicado da fila durável de jobs de LLM (tabela llm_jobs).
+
+Processa os jobs gravados pela API (ex.: /ai/generate-email-admin com "durable": true)
+sem servir HTTP. Qualquer número de processos ou containers pode rodar ao mesmo tempo,
+junto ou no lugar do worker embutido na API (JOB_WORKER_ENABLED=false nos containers da
+API): os jobs são repartidos com SELECT ... FOR UPDATE SKIP LOCKED. SIGTERM (deploy)
+devolve à fila os jobs que não terminarem em JOB_SHUTDOWN_GRACE_SECONDS.
+
+Uso (a partir de backend/):
+    python -m app.job_worker
+"""
+import asyncio
+import logging
+import signal
+
+from app.database import Base, engine
+from app.models.all_models import *  # Registra todos os modelos (relacionamentos do ORM)
+from app.models.llm_job import LLMJob
+from app.services.ai_service import ai_service
+from app.services.job_queue import job_queue
+
+logger = logging.getLogger("Orga.AI.job_worker")
+
+async def main():
+    Base.metadata.create_all(bind=engine, tables=[LLMJob.__table__])
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    await job_queue.start()
+    await stop.wait()
+    logger.info("Encerrando worker da fila durável")
+    await job_queue.stop()
+    await ai_service.aclose()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    asyncio.run(main())
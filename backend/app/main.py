@@ -3,12 +3,20 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
 from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.exceptions import RequestValidationError
+from fastapi.responses import JSONResponse
 from app.routers import tasks, auth, chat, projects, events, webui, tags, admin, ai
 from app.core.middleware import error_handler, validation_exception_handler, retry_exception_handler
 from app.utils.retry import RetryException
+from app.services.embedding_worker import embedding_worker
+from app.services.ai_service import ai_service
+from app.services.stream_service import stream_service
+from app.services.job_queue import job_queue
+from app.services.vector_store_service import vector_store_service
+from app.services.vector_store_events import vector_store_change_capture
 from app.database import Base, engine
 from app.models.all_models import *  # This imports all models and ensures they are registered
 from typing import Union
+import asyncio
 import datetime
 import logging
 import os
@@ -101,6 +109,43 @@ app.include_router(ai.router)  # Nova rota para geração de email com AI
 # Create database tables for all models
 Base.metadata.create_all(bind=engine)
 
+# Alterações em tarefas/projetos/conversas atualizam o vectorstore logo após o commit
+if vector_store_service.change_capture:
+    vector_store_change_capture.register()
+
+@app.on_event("startup")
+async def warmup_embedding_model():
+    """Carrega o modelo de embedding em segundo plano; a API responde enquanto ele carrega"""
+    if os.getenv("EMBEDDING_WARMUP", "true").lower() != "false":
+        vector_store_service.start_warmup()
+
+@app.on_event("shutdown")
+async def shutdown_embedding_worker():
+    """Encerra o pool de threads do worker de embeddings"""
+    embedding_worker.shutdown()
+
+@app.on_event("startup")
+async def start_job_worker():
+    """Inicia o worker da fila durável de jobs de LLM (desative com JOB_WORKER_ENABLED=false)"""
+    if os.getenv("JOB_WORKER_ENABLED", "true").lower() != "false":
+        await job_queue.start()
+
+@app.on_event("shutdown")
+async def stop_job_worker():
+    """Conclui ou devolve à fila os jobs duráveis em execução antes de encerrar"""
+    await job_queue.stop()
+
+@app.on_event("startup")
+async def open_stream_session():
+    """Cria a sessão HTTP compartilhada (pool de conexões) do streaming com o Ollama"""
+    await stream_service.start()
+
+@app.on_event("shutdown")
+async def close_ollama_client():
+    """Fecha os pools de conexões keep-alive com o Ollama (cliente assíncrono e streaming)"""
+    await ai_service.aclose()
+    await stream_service.close()
+
 @app.get("/api/v1/health")
 async def health_check_api():
     """Health check endpoint for API"""
@@ -109,6 +154,13 @@ async def health_check_api():
         "timestamp": datetime.datetime.now().isoformat()
     }
 
+@app.get("/api/v1/health/rag")
+async def rag_readiness():
+    """Readiness do RAG: 200 quando o modelo de embedding está carregado, 503 enquanto não está"""
+    # Com VECTOR_STORE_URL a sonda faz HTTP bloqueante aos shards: fora do event loop
+    readiness = await asyncio.to_thread(vector_store_service.readiness)
+    return JSONResponse(status_code=200 if readiness["ready"] else 503, content=readiness)
+
 @app.get("/health")
 async def health_check_root():
     """Health check endpoint at root for container checks"""
@@ -4,6 +4,7 @@ from .project_model import Project
 from .task_model import Task
 from .chat import ChatHistory, ChatPrompt
 from .log import SystemLog
+from .llm_job import LLMJob
 
 __all__ = [
     'Base',
@@ -12,5 +13,6 @@ __all__ = [
     'Task',
     'ChatHistory',
     'ChatPrompt',
-    'SystemLog'
+    'SystemLog',
+    'LLMJob'
 ]
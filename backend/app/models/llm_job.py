@@ -0,0 +1,36 @@
+from sqlalchemy import Column, String, Text, DateTime, Integer, JSON, ForeignKey, Index
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.sql import func
+import uuid
+
+from app.database import Base
+
+class LLMJob(Base):
+    """
+    Job durável de geração no LLM (fila em Postgres consumida com FOR UPDATE SKIP LOCKED).
+
+    Estados: queued -> running -> done; uma falha volta para queued com run_after no futuro
+    (backoff) até max_attempts, e então vai para dead (dead-letter). Um job running cujo
+    locked_until venceu (worker reiniciado) é retomado por outro worker.
+    """
+    __tablename__ = "llm_jobs"
+    __table_args__ = (
+        # Busca dos jobs prontos (status + horário) pelos workers
+        Index("ix_llm_jobs_status_run_after", "status", "run_after"),
+    )
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    user_id = Column(UUID(as_uuid=True), ForeignKey("auth.users.id", ondelete="SET NULL"), nullable=True)
+    kind = Column(String, nullable=False)  # Handler registrado no DurableJobQueue
+    payload = Column(JSON, nullable=False)
+    status = Column(String, nullable=False, server_default="queued")  # queued, running, done, dead, cancelled
+    attempts = Column(Integer, nullable=False, server_default="0")
+    max_attempts = Column(Integer, nullable=False, server_default="5")
+    run_after = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    locked_by = Column(String, nullable=True)  # Worker que detém o job
+    locked_until = Column(DateTime(timezone=True), nullable=True)  # Fim do visibility timeout
+    result = Column(JSON, nullable=True)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    finished_at = Column(DateTime(timezone=True), nullable=True)
@@ -14,6 +14,14 @@ from app.schemas.task import TaskResponse
 from app.schemas.user import UserResponse
 from app.services.auth_service import get_current_user
 from app.utils.email import send_email
+from app.services.vector_store_service import vector_store_service
+from app.services.embedding_worker import embedding_worker
+from app.services.vector_store_events import vector_store_change_capture
+from app.services.stream_service import stream_service
+from app.services.ai_service import ai_service
+from app.services.queue_service import queue_service
+from app.services.job_queue import job_queue
+import asyncio
 import logging
 import os
 from types import SimpleNamespace
@@ -214,3 +222,125 @@ async def send_email_api(
     db.commit()
     
     return {"success": True, "message": f"E-mail enviado para {to_email}"}
+
+@router.get("/vector-store/stats", status_code=status.HTTP_200_OK)
+async def vector_store_stats(
+    request: Request,
+    db: Session = Depends(get_db),
+):
+    """
+    Retorna estatísticas do vectorstore (RAG): usuários residentes em memória,
+    bytes ocupados, evicções, cache de embeddings, fila do worker de embeddings e
+    eventos da captura de alterações.
+    Requer autenticação como administrador.
+    """
+    await get_admin_user(request, db)
+    # Com VECTOR_STORE_URL as estatísticas vêm dos shards por HTTP bloqueante: fora do event loop
+    stats = await asyncio.to_thread(vector_store_service.get_stats)
+    return {
+        **stats,
+        "embedding_worker": embedding_worker.stats(),
+        "change_capture": vector_store_change_capture.stats()
+    }
+
+@router.get("/stream/pool", status_code=status.HTTP_200_OK)
+async def stream_pool_stats(
+    request: Request,
+    db: Session = Depends(get_db),
+):
+    """
+    Retorna a utilização do pool de conexões do streaming com o Ollama: conexões em uso
+    e ociosas, conexões criadas/reutilizadas, esperas por conexão e streams ativos.
+    Requer autenticação como administrador.
+    """
+    await get_admin_user(request, db)
+    return stream_service.pool_stats()
+
+@router.get("/llm/coalescing", status_code=status.HTTP_200_OK)
+async def llm_coalescing_stats(
+    request: Request,
+    db: Session = Depends(get_db),
+):
+    """
+    Retorna a coalescência de gerações idênticas em andamento (single-flight): requisições,
+    gerações executadas no Ollama, gerações economizadas e gerações abandonadas, separadas
+    entre as respostas completas (ai_service) e os streams (stream_service).
+    Requer autenticação como administrador.
+    """
+    await get_admin_user(request, db)
+    return {
+        "generate": ai_service.single_flight.stats(),
+        "stream": stream_service.single_flight.stats()
+    }
+
+@router.get("/queue/stats", status_code=status.HTTP_200_OK)
+async def queue_stats(
+    request: Request,
+    db: Session = Depends(get_db),
+):
+    """
+    Retorna o estado da fila de requisições ao LLM: slots em uso, profundidade por classe
+    de prioridade, rejeições (429) e histogramas de espera e de execução.
+    Requer autenticação como administrador.
+    """
+    await get_admin_user(request, db)
+    return queue_service.stats()
+
+@router.get("/jobs/stats", status_code=status.HTTP_200_OK)
+async def durable_jobs_stats(
+    request: Request,
+    db: Session = Depends(get_db),
+):
+    """
+    Retorna o estado da fila durável de jobs de LLM: jobs por estado (queued, running,
+    done, dead, cancelled) e contadores do worker deste processo.
+    Requer autenticação como administrador.
+    """
+    await get_admin_user(request, db)
+    return job_queue.stats(db)
+
+@router.get("/jobs/dead", status_code=status.HTTP_200_OK)
+async def durable_jobs_dead_letter(
+    request: Request,
+    limit: int = 50,
+    db: Session = Depends(get_db),
+):
+    """
+    Lista os jobs no dead-letter (tentativas esgotadas) com o último erro.
+    Requer autenticação como administrador.
+    """
+    await get_admin_user(request, db)
+    return job_queue.list_dead(db, limit=limit)
+
+@router.get("/jobs/{job_id}", status_code=status.HTTP_200_OK)
+async def durable_job_status(
+    job_id: str,
+    request: Request,
+    db: Session = Depends(get_db),
+):
+    """
+    Consulta um job durável (ex.: gerado por /ai/generate-email-admin com "durable": true).
+    Requer autenticação como administrador (aceita o ADMIN_TOKEN do N8N).
+    """
+    await get_admin_user(request, db)
+    job = job_queue.get(db, job_id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job não encontrado")
+    return job
+
+@router.post("/jobs/{job_id}/retry", status_code=status.HTTP_200_OK)
+async def durable_job_retry(
+    job_id: str,
+    request: Request,
+    db: Session = Depends(get_db),
+):
+    """
+    Reenfileira um job do dead-letter com as tentativas zeradas.
+    Requer autenticação como administrador.
+    """
+    await get_admin_user(request, db)
+    if job_queue.get(db, job_id) is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job não encontrado")
+    if not job_queue.retry_dead(db, job_id):
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Job não está no dead-letter")
+    return {"job_id": job_id, "status": "queued"}
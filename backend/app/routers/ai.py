@@ -2,6 +2,8 @@ from fastapi import APIRouter, HTTPException, status, Request, Depends
 from fastapi.responses import JSONResponse
 from sqlalchemy.orm import Session
 from app.services.ai_service import ai_service
+from app.services.queue_service import queue_service, QueueFullError
+from app.services.job_queue import job_queue
 from app.utils.llm_cleaner import clean_llm_response
 from app.services.auth_service import get_current_user
 from app.models.task_model import Task as TaskModel
@@ -62,7 +64,7 @@ async def generate_email(
         if any(k in data for k in ["tarefasHoje", "tarefasAmanha", "tarefasAtrasadas", "totalTarefas", "tarefasConcluidas"]):
             contexto = montar_contexto_personalizado(data)
             full_prompt = f"{contexto}\n\nSolicitação: {prompt.strip()}"
-            response, _ = ai_service.process_message(full_prompt)
+            response, _ = await queue_service.run(lambda: ai_service.aprocess_message(full_prompt), user_id=str(current_user.id), priority="batch")
             cleaned = clean_llm_response(response)
             return JSONResponse(content={"response": cleaned, "result": cleaned, "status": "ok"})
 
@@ -104,11 +106,13 @@ async def generate_email(
         full_prompt = "\n\n".join(context_parts) + f"\n\nSolicitação: {prompt.strip()}"
 
         # Gera resposta usando o modelo padrão/configurado
-        response, _ = ai_service.process_message(full_prompt)
+        response, _ = await queue_service.run(lambda: ai_service.aprocess_message(full_prompt), user_id=str(current_user.id), priority="batch")
         # Limpa a resposta (garantia extra)
         cleaned = clean_llm_response(response)
         # Retorna com formato compatível com n8n (field 'response' em vez de 'result')
         return JSONResponse(content={"response": cleaned, "result": cleaned, "status": "ok"})
+    except QueueFullError:
+        raise
     except Exception as e:
         logger.error(f"Erro ao gerar e-mail com IA: {e}")
         return JSONResponse(
@@ -116,6 +120,11 @@ async def generate_email(
             content={"status": "error", "response": "Erro interno ao gerar e-mail com IA.", "message": "Erro interno ao gerar e-mail com IA."}
         )
 
+def _enqueue_durable_generation(db: Session, prompt: str, user_id) -> JSONResponse:
+    """Grava a geração na fila durável (llm_jobs) e responde 202 com o ID do job."""
+    job_id = job_queue.enqueue(db, "generate", {"prompt": prompt}, user_id=str(user_id))
+    return JSONResponse(status_code=status.HTTP_202_ACCEPTED, content={"job_id": job_id, "status": "queued"})
+
 @router.post("/generate-email-admin")
 async def generate_email_admin(
     request: Request,
@@ -125,6 +134,8 @@ async def generate_email_admin(
     Endpoint admin: gera e-mail personalizado para qualquer usuário (via user_id ou email).
     Permite autenticação via token especial de admin (header 'X-Admin-Token' ou 'Authorization').
     Aceita contexto de tarefas/projetos diretamente no body (tarefasHoje, tarefasAmanha, tarefasAtrasadas, etc).
+    Com "durable": true, a geração vai para a fila durável (sobrevive a reinícios) e a resposta
+    é 202 com o job_id, consultado em GET /api/v1/admin/jobs/{job_id}.
     """
     import os
     ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN", "supersecrettoken")
@@ -140,6 +151,7 @@ async def generate_email_admin(
         
         prompt = data.get("prompt")
         force_prompt = data.get("force_prompt", False)
+        durable = data.get("durable", False)
         user_id = data.get("user_id") or data.get("id")
         email = data.get("email")
         
@@ -159,7 +171,9 @@ async def generate_email_admin(
             raise HTTPException(status_code=404, detail="Usuário alvo não encontrado.")
         # Se vier force_prompt, envie o prompt puro
         if force_prompt:
-            response, _ = ai_service.process_message(prompt)
+            if durable:
+                return _enqueue_durable_generation(db, prompt, user_alvo.id)
+            response, _ = await queue_service.run(lambda: ai_service.aprocess_message(prompt), user_id=str(user_alvo.id), priority="batch")
             cleaned = clean_llm_response(response)
             # Retorna com formato compatível com n8n (field 'response' em vez de 'result')
             return JSONResponse(content={"response": cleaned, "result": cleaned, "status": "ok"})
@@ -167,7 +181,9 @@ async def generate_email_admin(
         if any(k in data for k in ["tarefasHoje", "tarefasAmanha", "tarefasAtrasadas", "totalTarefas", "tarefasConcluidas"]):
             contexto = montar_contexto_personalizado(data)
             full_prompt = f"{SYSTEM_PROMPT_EMAIL}\n\n{contexto}\n\nSolicitação: {prompt.strip()}"
-            response, _ = ai_service.process_message(full_prompt)
+            if durable:
+                return _enqueue_durable_generation(db, full_prompt, user_alvo.id)
+            response, _ = await queue_service.run(lambda: ai_service.aprocess_message(full_prompt), user_id=str(user_alvo.id), priority="batch")
             cleaned = clean_llm_response(response)
             # Retorna com formato compatível com n8n (field 'response' em vez de 'result')
             return JSONResponse(content={"response": cleaned, "result": cleaned, "status": "ok"})
@@ -184,12 +200,99 @@ async def generate_email_admin(
             for p in projects
         ]
         full_prompt = f"{SYSTEM_PROMPT_EMAIL}\n\n{montar_contexto_personalizado(data)}\n\nSolicitação: {prompt.strip()}"
-        response, _ = ai_service.process_message(full_prompt)
+        if durable:
+            return _enqueue_durable_generation(db, full_prompt, user_alvo.id)
+        response, _ = await queue_service.run(lambda: ai_service.aprocess_message(full_prompt), user_id=str(user_alvo.id), priority="batch")
         cleaned = clean_llm_response(response)
         return JSONResponse(content={"response": cleaned, "result": cleaned, "status": "ok"})
+    except QueueFullError:
+        raise
     except Exception as e:
         logger.error(f"Erro ao gerar e-mail admin com IA: {e}")
         return JSONResponse(
             status_code=500,
             content={"status": "error", "response": "Erro interno ao gerar e-mail admin com IA.", "message": "Erro interno ao gerar e-mail admin com IA."}
         )
+
+async def _run_generation_job(params):
+    """
+    Executa um job de geração enfileirado por /ai/jobs (fora do ciclo da requisição).
+    Mesmo formato de resultado do job durável ("generate") e das rotas síncronas de /ai.
+    """
+    response, metadata = await ai_service.aprocess_message(params["prompt"], user_id=params["user_id"])
+    if metadata.get("error"):
+        raise RuntimeError(metadata["error"])
+    return {"response": clean_llm_response(response)}
+
+def _get_user_job(job_id: str, current_user: User, db: Session):
+    """
+    Busca um job do usuário (administradores veem todos), primeiro na fila em memória e
+    depois na fila durável; 404 se não existir ou for de outro usuário.
+
+    Returns:
+        (job, durável)
+    """
+    job, durable = queue_service.get_task(job_id), False
+    if job is None:
+        job, durable = job_queue.get(db, job_id), True
+    if job is None or (job.get("user_id") != str(current_user.id) and not current_user.is_admin):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job não encontrado.")
+    return job, durable
+
+@router.post("/jobs", status_code=status.HTTP_202_ACCEPTED)
+async def create_generation_job(
+    request: Request,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Enfileira uma geração de texto longa e retorna imediatamente o ID do job.
+    Aceita o mesmo contexto do N8N de /ai/generate-email (tarefasHoje, tarefasAmanha, ...).
+    O resultado é consultado em GET /ai/jobs/{job_id}. Por padrão o job roda neste processo
+    e o resultado fica disponível por tempo limitado (QUEUE_RESULT_TTL_SECONDS); com
+    "durable": true, vai para a fila durável no Postgres (sobrevive a reinícios e é
+    executado por qualquer worker, com retentativas).
+    """
+    data = await request.json()
+    prompt = data.get("prompt")
+    if not prompt or not prompt.strip():
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Prompt não pode ser vazio.")
+    if any(k in data for k in ["tarefasHoje", "tarefasAmanha", "tarefasAtrasadas", "totalTarefas", "tarefasConcluidas"]):
+        prompt = f"{montar_contexto_personalizado(data)}\n\nSolicitação: {prompt.strip()}"
+    if data.get("durable"):
+        job_id = job_queue.enqueue(db, "generate", {"prompt": prompt, "user_id": str(current_user.id)},
+                                   user_id=str(current_user.id))
+        return {"job_id": job_id, "status": "queued", "durable": True}
+    job_id = await queue_service.enqueue_task(
+        _run_generation_job,
+        {"prompt": prompt, "user_id": str(current_user.id)},
+        user_id=str(current_user.id),
+        priority="batch"
+    )
+    return {"job_id": job_id, "status": "queued"}
+
+@router.get("/jobs/{job_id}")
+async def get_generation_job(
+    job_id: str,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Consulta um job: queued, running, done (com result ou error), cancelled ou expired
+    (resultado já descartado); jobs duráveis também podem estar em dead (tentativas esgotadas).
+    """
+    job, _ = _get_user_job(job_id, current_user, db)
+    return job
+
+@router.delete("/jobs/{job_id}")
+async def cancel_generation_job(
+    job_id: str,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Cancela um job na fila ou em execução (a geração em andamento é abortada)."""
+    job, durable = _get_user_job(job_id, current_user, db)
+    cancelled = job_queue.cancel(db, job_id) if durable else queue_service.cancel(job_id)
+    if not cancelled:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"Job não pode ser cancelado (status: {job['status']}).")
+    return {"job_id": job_id, "status": "cancelled"}
@@ -3,9 +3,10 @@ from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.orm import Session
 from sqlalchemy import or_, text
 from app.services.ai_service import ai_service
+from app.services.queue_service import queue_service, QueueFullError
 from app.database import get_db
 from app.services.auth_service import get_current_user
-from app.services.vector_store_service import vector_store_service
+from app.services.embedding_worker import embedding_worker
 from app.services.intent_recognizer import intent_recognizer
 from app.services.action_handler import action_handler
 from app.schemas.user import User
@@ -46,10 +47,10 @@ async def chat(
         
         # Step 2: Update the user's vector store asynchronously (if it hasn't been updated recently)
         try:
-            # Atualizar apenas se o cache estiver muito velho ou se for uma mensagem longa
-            # (mensagens longas têm mais conteúdo a indexar)
-            force_update = len(message) > 200
-            vector_store_service.update_user_vectorstore(str(current_user.id), db, force=force_update)
+            # Alterações nos dados já são enviadas ao índice pela captura de alterações;
+            # aqui só garantimos a carga inicial (e o TTL de segurança). A atualização roda
+            # no worker de embeddings, sem bloquear o event loop.
+            embedding_worker.refresh_nowait(str(current_user.id))
         except Exception as ve:
             logger.warning(f"Error updating vector store: {str(ve)}")
         
@@ -122,11 +123,15 @@ async def chat(
             }
         else:
             # Se não houve ação executada ou falhou, processar normalmente com o LLM
-            reply, metadata = ai_service.process_message(
-                message=message,
-                history=history_tuples,
-                user_context=context,  # Usando o contexto completo construído acima
-                user_id=str(current_user.id)
+            reply, metadata = await queue_service.run(
+                lambda: ai_service.aprocess_message(
+                    message=message,
+                    history=history_tuples,
+                    user_context=context,  # Usando o contexto completo construído acima
+                    user_id=str(current_user.id)
+                ),
+                user_id=str(current_user.id),
+                priority="interactive"
             )
         
         # Extract suggested tags based on intent and content
@@ -176,6 +181,8 @@ async def chat(
             }
         )
         
+    except QueueFullError:
+        raise
     except Exception as e:
         logger.error(f"Error in chat endpoint: {str(e)}", exc_info=True)
         
@@ -11,6 +11,7 @@ from app.schemas.user import User
 from app.models.chat import ChatHistory
 from app.schemas.chat import ChatRequest, ChatResponse
 from app.services.stream_service import stream_service
+from app.services.queue_service import queue_service
 from app.services.context_manager import context_manager
 import logging
 import traceback
@@ -79,19 +80,24 @@ async def chat_stream(
         # Adicionar a mensagem atual
         messages = context_messages + [{"role": "user", "content": request.message}]
         
+        # Rejeitar com 429 antes de iniciar a resposta se a fila estiver cheia
+        queue_service.check_admission(str(current_user.id), "stream")
+        
         # Criar função para gerar resposta em streaming
         async def generate_response_stream():
             full_response = ""
             error_occurred = False
             
             try:
-                async for content_chunk in stream_service.generate_stream(
-                    messages, 
-                    user_id=str(current_user.id)
-                ):
-                    if content_chunk:
-                        full_response += content_chunk
-                        yield f"data: {content_chunk}\n\n"
+                # O slot de execução fica ocupado durante todo o stream
+                async with queue_service.slot(str(current_user.id), "stream"):
+                    async for content_chunk in stream_service.generate_stream(
+                        messages, 
+                        user_id=str(current_user.id)
+                    ):
+                        if content_chunk:
+                            full_response += content_chunk
+                            yield f"data: {content_chunk}\n\n"
                 
                 # Salvar no histórico apenas se não houve erros
                 try:
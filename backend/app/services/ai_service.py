@@ -1,6 +1,8 @@
 import os
 import json
+import asyncio
 import logging
+import httpx
 import requests
 import time
 import numpy as np
@@ -15,6 +17,9 @@ from langchain_ollama import ChatOllama
 from app.services.context_manager import context_manager
 from app.services.vector_store_service import vector_store_service 
 from app.services.intent_recognizer import intent_recognizer
+from app.services.queue_service import queue_service
+from app.services.concurrency_limiter import ollama_generation_metrics
+from app.services.single_flight import SingleFlight, generation_key
 
 # Configuração de logging
 logger = logging.getLogger(__name__)
@@ -65,6 +70,28 @@ class AIService:
         self.request_timeout = 120.0  # 2 minutes timeout
         self.backoff_factor = 1.5
         self.session = None
+        # Cliente assíncrono com pool de conexões keep-alive (caminho aprocess_message),
+        # criado no primeiro uso e fechado no shutdown da aplicação
+        self.async_client: Optional[httpx.AsyncClient] = None
+        self.pool_limits = httpx.Limits(
+            max_connections=int(os.environ.get("OLLAMA_MAX_CONNECTIONS", "16")),
+            max_keepalive_connections=int(os.environ.get("OLLAMA_MAX_KEEPALIVE", "8")),
+            keepalive_expiry=float(os.environ.get("OLLAMA_KEEPALIVE_SECONDS", "60"))
+        )
+        # Mesmos parâmetros de geração do ChatOllama
+        self.generation_options = {
+            "num_ctx": 2048,
+            "num_gpu": 1,
+            "num_thread": 4,
+            "temperature": 0.1,
+            "num_predict": 512,
+            "top_k": 40,
+            "top_p": 0.9,
+            "repeat_penalty": 1.1,
+            "seed": 42
+        }
+        # Identical in-flight generations (same model, prompt and options) share one call
+        self.single_flight = SingleFlight(enabled=os.environ.get("LLM_SINGLE_FLIGHT", "true").lower() == "true")
         
         # Models in order of preference (from heaviest to lightest)
         self.fallback_models = [
@@ -99,11 +126,7 @@ class AIService:
             try:
                 endpoint = "/api/tags"
                 timeout = min(10 * (self.backoff_factor ** attempt), 30)
-                response = requests.get(
-                    f"{self.ollama_api_url}{endpoint}",
-                    timeout=timeout,
-                    headers={"Connection": "close"}  # Prevent connection pooling issues
-                )
+                response = requests.get(f"{self.ollama_api_url}{endpoint}", timeout=timeout)
                 
                 if response.status_code == 200:
                     return response.json().get('models', [])
@@ -153,18 +176,9 @@ class AIService:
                 self.llm = ChatOllama(
                     model=model,
                     base_url=self.ollama_api_url,
-                    num_ctx=2048,
-                    num_gpu=1,
-                    num_thread=4,
-                    temperature=0.1,
-                    num_predict=512,
-                    top_k=40,
-                    top_p=0.9,
-                    repeat_penalty=1.1,
-                    seed=42,
+                    **self.generation_options,
                     timeout=self.request_timeout,
-                    streaming=False,  # Disable streaming to avoid timeouts
-                    headers={"Connection": "close"}  # Prevent connection pooling issues
+                    streaming=False  # Disable streaming to avoid timeouts
                 )
                 self.ollama_model = model
                 logger.info(f"LLM initialized with model: {model}")
@@ -176,12 +190,8 @@ class AIService:
         self.llm = None
         return False
 
-    def process_message(self,
-                       message: str,
-                       history: List[Tuple[str, str]] = [],
-                       user_context: Optional[Dict[str, Any]] = None,
-                       user_id: Optional[str] = None) -> Tuple[str, Dict[str, Any]]:
-        metadata = {
+    def _new_metadata(self) -> Dict[str, Any]:
+        return {
             "start_time": time.time(),
             "processing_steps": [],
             "used_model": self.ollama_model,
@@ -191,54 +201,85 @@ class AIService:
             "error": None
         }
 
+    def _intent_response(self, message: str, metadata: Dict[str, Any]) -> Optional[str]:
+        """Returns a direct reply for empty messages and recognized intents (no LLM call)."""
+        if not message.strip():
+            metadata["processing_steps"].append("empty_message")
+            return "Por favor, digite uma mensagem."
+        
+        # Check intent
+        has_intent, intent_info = intent_recognizer.process_message(message)
+        metadata["intent_detected"] = has_intent
+        
+        if has_intent and intent_info.get("response"):
+            metadata["used_intent"] = True
+            metadata["intent_type"] = intent_info["intent"]
+            metadata["processing_steps"].append("intent_response")
+            return intent_info["response"]
+        return None
+
+    def _build_prompt(self, message: str, user_context: Optional[Dict[str, Any]]) -> str:
+        """Builds the final prompt with the forced system prompt and the user's tasks/projects."""
+        # --- FORÇAR SYSTEM PROMPT E CONTEXTO ---
+        system_prompt = (
+            "Você é um assistente de produtividade. Sempre responda com base nas tarefas e projetos abaixo, "
+            "gerando um texto motivacional, prático e personalizado. Se não houver tarefas, incentive o usuário a planejar o dia. "
+            "Use listas HTML (<ul>, <li>) para tarefas e parágrafos (<p>) para mensagens. Seja sempre positivo e prático."
+        )
+        context_text = None
+        if user_context and user_context.get("tasks"):
+            tasks = user_context["tasks"]
+            if tasks:
+                context_text = "Minhas tarefas atuais:\n" + "\n".join([
+                    f"- {t['title']} (Prioridade: {t.get('priority', '-')}, Status: {t.get('status', '-')}, Vencimento: {t.get('due_date', '-')})"
+                    for t in tasks
+                ])
+        if user_context and user_context.get("projects"):
+            projects = user_context["projects"]
+            if projects:
+                if not context_text:
+                    context_text = ""
+                context_text += "\nMeus projetos ativos:\n" + "\n".join([
+                    f"- {p['title']} (Status: {p.get('status', '-')})" + (f" - {p.get('description', '')}" if p.get('description') else "")
+                    for p in projects
+                ])
+        if not context_text:
+            context_text = "Não há tarefas ou projetos cadastrados. Sugira ações úteis para organização pessoal."
+        # Prompt final
+        prompt = f"{system_prompt}\n\n{context_text}\n\nSolicitação: {message.strip()}"
+        logger.info(f"[AI SERVICE] Prompt final enviado ao modelo:\n{prompt}")
+        return prompt
+
+    def _finalize_response(self, response: str) -> str:
+        """Cleans up repeated markdown or formatting artifacts using both internal and advanced cleaner."""
+        response = self._clean_response(response)
+        
+        # Apply advanced cleaning from ollama_cleaner utility
+        from app.utils.ollama_cleaner import clean_ollama_response
+        return clean_ollama_response(response)
+
+    def process_message(self,
+                       message: str,
+                       history: List[Tuple[str, str]] = [],
+                       user_context: Optional[Dict[str, Any]] = None,
+                       user_id: Optional[str] = None) -> Tuple[str, Dict[str, Any]]:
+        """
+        Blocking version (ChatOllama.invoke + time.sleep between retries).
+        Async routes must use aprocess_message instead.
+        """
+        metadata = self._new_metadata()
+
         try:
-            if not message.strip():
-                metadata["processing_steps"].append("empty_message")
-                return "Por favor, digite uma mensagem.", metadata
-            
-            # Check intent
-            has_intent, intent_info = intent_recognizer.process_message(message)
-            metadata["intent_detected"] = has_intent
-            
-            if has_intent and intent_info.get("response"):
-                metadata["used_intent"] = True
-                metadata["intent_type"] = intent_info["intent"]
-                metadata["processing_steps"].append("intent_response")
-                return intent_info["response"], metadata
+            direct_response = self._intent_response(message, metadata)
+            if direct_response is not None:
+                return direct_response, metadata
             
             # Check LLM availability
             if not self.llm:
                 metadata["error"] = "LLM unavailable"
                 return "AI service temporarily unavailable.", metadata
             
-            # --- FORÇAR SYSTEM PROMPT E CONTEXTO ---
-            system_prompt = (
-                "Você é um assistente de produtividade. Sempre responda com base nas tarefas e projetos abaixo, "
-                "gerando um texto motivacional, prático e personalizado. Se não houver tarefas, incentive o usuário a planejar o dia. "
-                "Use listas HTML (<ul>, <li>) para tarefas e parágrafos (<p>) para mensagens. Seja sempre positivo e prático."
-            )
-            context_text = None
-            if user_context and user_context.get("tasks"):
-                tasks = user_context["tasks"]
-                if tasks:
-                    context_text = "Minhas tarefas atuais:\n" + "\n".join([
-                        f"- {t['title']} (Prioridade: {t.get('priority', '-')}, Status: {t.get('status', '-')}, Vencimento: {t.get('due_date', '-')})"
-                        for t in tasks
-                    ])
-            if user_context and user_context.get("projects"):
-                projects = user_context["projects"]
-                if projects:
-                    if not context_text:
-                        context_text = ""
-                    context_text += "\nMeus projetos ativos:\n" + "\n".join([
-                        f"- {p['title']} (Status: {p.get('status', '-')})" + (f" - {p.get('description', '')}" if p.get('description') else "")
-                        for p in projects
-                    ])
-            if not context_text:
-                context_text = "Não há tarefas ou projetos cadastrados. Sugira ações úteis para organização pessoal."
-            # Prompt final
-            prompt = f"{system_prompt}\n\n{context_text}\n\nSolicitação: {message.strip()}"
-            logger.info(f"[AI SERVICE] Prompt final enviado ao modelo:\n{prompt}")
+            prompt = self._build_prompt(message, user_context)
 
             chain_history = []
             
@@ -262,8 +303,7 @@ class AIService:
                         prompt,
                         config={
                             "message_history": chain_history,
-                            "timeout": self.request_timeout * (1 + attempt * 0.5),  # Increase timeout with each attempt
-                            "headers": {"Connection": "close"}  # Prevent connection issues
+                            "timeout": self.request_timeout * (1 + attempt * 0.5)  # Increase timeout with each attempt
                         }
                     )
                     
@@ -275,13 +315,7 @@ class AIService:
                     else:
                         response = str(ai_message)
                     
-                    # Clean up any repeated markdown or formatting artifacts using both internal and advanced cleaner
-                    response = self._clean_response(response)
-                    
-                    # Apply advanced cleaning from ollama_cleaner utility
-                    from app.utils.ollama_cleaner import clean_ollama_response
-                    response = clean_ollama_response(response)
-                    
+                    response = self._finalize_response(response)
                     break  # Success
                     
                 except Exception as e:
@@ -311,6 +345,119 @@ class AIService:
             metadata["processing_time"] = time.time() - metadata["start_time"]
             return "An error occurred while processing your message.", metadata
 
+    def _get_async_client(self) -> httpx.AsyncClient:
+        """Returns the shared async client (persistent keep-alive connection pool)."""
+        if self.async_client is None or self.async_client.is_closed:
+            self.async_client = httpx.AsyncClient(
+                base_url=self.ollama_api_url,
+                limits=self.pool_limits,
+                timeout=httpx.Timeout(self.request_timeout, connect=10.0)
+            )
+        return self.async_client
+
+    async def aclose(self):
+        """Closes the async client pool (application shutdown)."""
+        if self.async_client is not None:
+            await self.async_client.aclose()
+            self.async_client = None
+
+    async def _agenerate(self, prompt: str, timeout: float) -> str:
+        """
+        Generates the reply for a prompt, sharing the call with any identical request
+        already in flight (single-flight keyed on model, full prompt and options). The
+        generation is only cancelled once every waiting request has given up.
+        """
+        key = generation_key(self.ollama_model, prompt, self.generation_options)
+        return await self.single_flight.do(key, lambda: self._agenerate_once(prompt, timeout))
+
+    async def _agenerate_once(self, prompt: str, timeout: float) -> str:
+        """
+        Single non-streaming call to Ollama's /api/chat through the pooled client. The
+        generation metrics (tokens, decode time, time to first token) feed the queue's
+        adaptive concurrency limit.
+        """
+        start_time = time.monotonic()
+        response = await self._get_async_client().post(
+            "/api/chat",
+            json={
+                "model": self.ollama_model,
+                "messages": [{"role": "user", "content": prompt}],
+                "stream": False,
+                "options": self.generation_options
+            },
+            timeout=httpx.Timeout(timeout, connect=10.0)
+        )
+        response.raise_for_status()
+        payload = response.json()
+        metrics = ollama_generation_metrics(payload, time.monotonic() - start_time)
+        if metrics is not None:
+            queue_service.observe_generation(*metrics)
+        return payload.get("message", {}).get("content", "")
+
+    async def aprocess_message(self,
+                               message: str,
+                               history: List[Tuple[str, str]] = [],
+                               user_context: Optional[Dict[str, Any]] = None,
+                               user_id: Optional[str] = None) -> Tuple[str, Dict[str, Any]]:
+        """
+        Async version of process_message for async routes: the request goes through the
+        pooled httpx client and retries wait with asyncio.sleep, so a slow generation never
+        blocks the event loop. Cancelling the calling task (e.g. client disconnect) aborts
+        the in-flight request and releases its connection back to the pool.
+        """
+        metadata = self._new_metadata()
+
+        try:
+            direct_response = self._intent_response(message, metadata)
+            if direct_response is not None:
+                return direct_response, metadata
+            
+            # Check LLM availability
+            if not self.llm:
+                metadata["error"] = "LLM unavailable"
+                return "AI service temporarily unavailable.", metadata
+            
+            prompt = self._build_prompt(message, user_context)
+
+            # Process response with retries
+            start_time = time.time()
+            response = None
+            last_error = None
+
+            for attempt in range(self.max_retries):
+                try:
+                    metadata["retries"] = attempt
+                    # Increase timeout with each attempt
+                    response = self._finalize_response(
+                        await self._agenerate(prompt, self.request_timeout * (1 + attempt * 0.5))
+                    )
+                    break  # Success
+                    
+                except (httpx.TimeoutException, httpx.TransportError, httpx.HTTPStatusError) as e:
+                    # Client errors (4xx) are not transient
+                    if isinstance(e, httpx.HTTPStatusError) and e.response.status_code < 500:
+                        raise
+                    last_error = str(e)
+                    logger.warning(f"Attempt {attempt + 1}/{self.max_retries} failed: {e}")
+                    if attempt < self.max_retries - 1:
+                        await asyncio.sleep(min(self.backoff_factor ** attempt, 10))
+            
+            if response is None:
+                raise Exception(f"All attempts failed. Last error: {last_error}")
+            
+            # Update metadata
+            processing_time = time.time() - start_time
+            metadata["processing_time"] = processing_time
+            metadata["response_length"] = len(response.split())
+            
+            return response, metadata
+            
+        except Exception as e:
+            logger.error(f"Error processing message: {e}")
+            metadata["error"] = str(e)
+            metadata["processing_time"] = time.time() - metadata["start_time"]
+            return "An error occurred while processing your message.", metadata
+
     def _get_default_suggestions(self):
         return {
             "context": "sem contexto",
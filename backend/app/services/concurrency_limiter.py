@@ -0,0 +1,212 @@
+"""
+Limite adaptativo de concorrência das gerações no Ollama.
+
+Quantas gerações simultâneas maximizam os tokens/s depende do modelo (optimized-gemma3,
+gemma3:1b, ...), de OLLAMA_NUM_PARALLEL e dos núcleos/GPU do host. O limitador mede, em
+janelas com fila (demanda acima do limite), a vazão agregada em tokens/s e o tempo até
+o primeiro token (TTFT), e ajusta o limite do QueueService em tempo de execução:
+
+- aumento aditivo (+1) enquanto um slot a mais aumenta a vazão em pelo menos min_gain
+- volta ao limite anterior quando o slot extra não compensa (mesma vazão, mais latência)
+- redução multiplicativa quando o TTFT passa de ttft_tolerance x a linha de base sem
+  ganho de vazão (o Ollama está enfileirando internamente)
+- nova sondagem dos limites vizinhos a cada probe_every janelas, para acompanhar
+  mudanças de modelo ou de carga no host
+"""
+import logging
+import statistics
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+def ollama_generation_metrics(payload: Dict[str, Any], wall_seconds: float,
+                              ttft: Optional[float] = None) -> Optional[Tuple[float, int, float]]:
+    """
+    Extrai as métricas de uma geração da resposta final do Ollama (/api/chat ou /api/generate).
+
+    Args:
+        payload: JSON final da resposta (com eval_count e eval_duration em nanossegundos)
+        wall_seconds: Duração total observada pelo cliente
+        ttft: Tempo até o primeiro token observado pelo cliente (streaming); sem ele, é
+            estimado como a duração total menos o tempo de decodificação
+
+    Returns:
+        (ttft, tokens gerados, segundos de decodificação) ou None se a resposta não traz métricas
+    """
+    tokens = payload.get("eval_count")
+    eval_duration = payload.get("eval_duration")
+    if not tokens or not eval_duration:
+        return None
+    decode_seconds = eval_duration / 1e9
+    if ttft is None:
+        ttft = max(wall_seconds - decode_seconds, 0.0)
+    return ttft, int(tokens), decode_seconds
+
+class AdaptiveConcurrencyLimiter:
+    """
+    Ajusta o limite de concorrência por subida de encosta na vazão (tokens/s) com
+    proteção de latência pelo TTFT (AIMD).
+
+    Só janelas saturadas (com requisições aguardando na fila na maior parte do tempo)
+    são usadas nas decisões: com pouca demanda a vazão não diz nada sobre o limite.
+    A vazão da janela é estimada pela lei de Little (gerações em andamento x tokens por
+    segundo de geração), que usa a duração de todas as amostras em vez de contar só as
+    conclusões e por isso converge com poucas gerações longas. A primeira janela após
+    uma mudança de limite é descartada (mistura gerações iniciadas com os dois limites).
+    """
+
+    def __init__(self, initial_limit: int = 2, min_limit: int = 1, max_limit: int = 8,
+                 window_seconds: float = 10.0, min_samples: int = 4, min_gain: float = 0.05,
+                 ttft_tolerance: float = 2.0, backoff: float = 0.75, probe_every: int = 6,
+                 smoothing: float = 0.5):
+        """
+        Inicializa o limitador.
+
+        Args:
+            initial_limit: Limite inicial
+            min_limit: Menor limite permitido
+            max_limit: Maior limite permitido
+            window_seconds: Duração mínima de uma janela de medição
+            min_samples: Gerações concluídas necessárias para fechar uma janela
+            min_gain: Ganho relativo de vazão que justifica um slot a mais
+            ttft_tolerance: Múltiplo da linha de base do TTFT considerado sobrecarga
+            backoff: Fator da redução multiplicativa
+            probe_every: Janelas entre sondagens dos limites vizinhos
+            smoothing: Peso da janela nova na média da vazão de cada limite
+        """
+        self.min_limit = min_limit
+        self.max_limit = max(max_limit, min_limit)
+        self.limit = min(max(initial_limit, self.min_limit), self.max_limit)
+        self.window_seconds = window_seconds
+        self.min_samples = min_samples
+        self.min_gain = min_gain
+        self.ttft_tolerance = ttft_tolerance
+        self.backoff = backoff
+        self.probe_every = probe_every
+        self.smoothing = smoothing
+
+        # Vazão média (tokens/s) e janela da última medição de cada limite
+        self.throughput: Dict[int, float] = {}
+        self.measured_at: Dict[int, int] = {}
+        self.ttft_baseline: Optional[float] = None
+        self.windows = 0
+        self._settling = False
+        self.history: List[Tuple[float, int]] = [(time.monotonic(), self.limit)]
+        self.stats_counters = {"increases": 0, "decreases": 0, "backoffs": 0, "unsaturated_windows": 0}
+        self._reset_window(time.monotonic())
+
+    def _reset_window(self, now: float):
+        self._window_start = now
+        self._tokens = 0
+        self._busy_seconds = 0.0
+        self._in_flight = 0
+        self._ttfts: List[float] = []
+        self._saturated = 0
+
+    def on_sample(self, ttft: float, tokens: int, decode_seconds: float, in_flight: int,
+                  saturated: bool, now: Optional[float] = None) -> int:
+        """
+        Registra uma geração concluída e, ao fechar uma janela, recalcula o limite.
+
+        Args:
+            ttft: Tempo até o primeiro token (segundos)
+            tokens: Tokens gerados
+            decode_seconds: Tempo de decodificação (segundos)
+            in_flight: Gerações em andamento ao concluir (incluindo esta)
+            saturated: Se havia requisições aguardando na fila ao concluir
+            now: Instante da conclusão (padrão: time.monotonic())
+
+        Returns:
+            Limite a aplicar
+        """
+        now = time.monotonic() if now is None else now
+        self._tokens += tokens
+        self._busy_seconds += ttft + decode_seconds
+        self._in_flight += in_flight
+        self._ttfts.append(ttft)
+        self._saturated += int(saturated)
+        elapsed = now - self._window_start
+        if elapsed < self.window_seconds or len(self._ttfts) < self.min_samples:
+            return self.limit
+
+        throughput = self._in_flight / len(self._ttfts) * self._tokens / max(self._busy_seconds, 1e-9)
+        ttft_p50 = statistics.median(self._ttfts)
+        saturated_window = self._saturated * 2 >= len(self._ttfts)
+        self._reset_window(now)
+        if self._settling:
+            self._settling = False
+            return self.limit
+        self.windows += 1
+
+        # Linha de base do TTFT: acompanha quedas de imediato e altas lentamente
+        if self.ttft_baseline is None or ttft_p50 < self.ttft_baseline:
+            self.ttft_baseline = ttft_p50
+        else:
+            self.ttft_baseline += 0.05 * (ttft_p50 - self.ttft_baseline)
+
+        if not saturated_window:
+            self.stats_counters["unsaturated_windows"] += 1
+            return self.limit
+
+        previous = self.throughput.get(self.limit)
+        self.throughput[self.limit] = throughput if previous is None else (
+            previous + self.smoothing * (throughput - previous)
+        )
+        self.measured_at[self.limit] = self.windows
+        self._set_limit(self._decide(ttft_p50), now)
+        return self.limit
+
+    def _gain_over(self, limit: int, other: int) -> bool:
+        """Se a vazão medida em `limit` supera a de `other` em pelo menos min_gain."""
+        if other not in self.throughput:
+            return True
+        return self.throughput.get(limit, 0.0) >= self.throughput[other] * (1 + self.min_gain)
+
+    def _decide(self, ttft_p50: float) -> int:
+        """Próximo limite a partir das vazões medidas e do TTFT da janela."""
+        limit = self.limit
+        lower, upper = limit - 1, limit + 1
+        overloaded = ttft_p50 > self.ttft_tolerance * self.ttft_baseline
+
+        # Sobrecarga sem ganho de vazão: redução multiplicativa
+        if overloaded and lower >= self.min_limit and not self._gain_over(limit, lower):
+            self.stats_counters["backoffs"] += 1
+            return max(self.min_limit, min(lower, int(limit * self.backoff)))
+        # O limite seguinte já se mostrou melhor
+        if upper in self.throughput and upper <= self.max_limit and self._gain_over(upper, limit):
+            return upper
+        # O slot atual não compensa: voltar ao anterior (menos latência, mesma vazão)
+        if lower >= self.min_limit and lower in self.throughput and not self._gain_over(limit, lower):
+            return lower
+        # Sondar os limites vizinhos se nunca medidos ou se a medição é antiga
+        if upper <= self.max_limit and not overloaded and self._stale(upper):
+            return upper
+        if lower >= self.min_limit and self._stale(lower):
+            return lower
+        return limit
+
+    def _stale(self, limit: int) -> bool:
+        return self.windows - self.measured_at.get(limit, -self.probe_every) >= self.probe_every
+
+    def _set_limit(self, limit: int, now: float):
+        if limit == self.limit:
+            return
+        self.stats_counters["increases" if limit > self.limit else "decreases"] += 1
+        logger.info(f"Limite de concorrência do LLM: {self.limit} -> {limit}")
+        self.limit = limit
+        self._settling = True
+        self.history.append((now, limit))
+        del self.history[:-100]
+
+    def stats(self) -> Dict[str, Any]:
+        """Limite atual, vazão medida por limite, linha de base do TTFT e contadores."""
+        return {
+            "limit": self.limit,
+            "min_limit": self.min_limit,
+            "max_limit": self.max_limit,
+            "windows": self.windows,
+            "throughput_by_limit": {limit: round(value, 2) for limit, value in sorted(self.throughput.items())},
+            "ttft_baseline": round(self.ttft_baseline, 4) if self.ttft_baseline is not None else None,
+            **self.stats_counters
+        }
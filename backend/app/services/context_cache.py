@@ -0,0 +1,109 @@
+"""
+Cache dos blocos de contexto RAG já formatados.
+As chaves são (user_id, versão do índice do usuário, bucket da consulta, tipo): uma
+alteração nos dados do usuário muda a versão e invalida todas as entradas dele.
+"""
+import logging
+import sys
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+class ContextCache:
+    """
+    Cache LRU de strings limitado pelo tamanho em bytes.
+
+    Características:
+    - Evicção das entradas menos usadas quando o total excede max_bytes
+    - Invalidação por usuário (invalidate_user) quando a versão do índice muda
+    - Estatísticas de acertos/faltas e ocupação de memória (bytes das strings e chaves)
+    """
+
+    def __init__(self, max_bytes: int = 16 * 1024 * 1024):
+        """
+        Inicializa o cache.
+
+        Args:
+            max_bytes: Memória máxima ocupada pelas entradas
+        """
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Tuple, Tuple[str, int]]" = OrderedDict()  # chave -> (valor, bytes)
+        self._user_keys: Dict[str, Set[Tuple]] = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.stats_counters = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    @staticmethod
+    def _entry_size(key: Tuple, value: str) -> int:
+        """Bytes ocupados por uma entrada (string, tupla da chave e seus componentes)."""
+        return sys.getsizeof(value) + sys.getsizeof(key) + sum(sys.getsizeof(part) for part in key)
+
+    def get(self, key: Tuple) -> Optional[str]:
+        """
+        Busca uma entrada.
+
+        Args:
+            key: Tupla cujo primeiro elemento é o user_id
+
+        Returns:
+            Valor em cache ou None
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.stats_counters["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats_counters["hits"] += 1
+            return entry[0]
+
+    def put(self, key: Tuple, value: str):
+        """Armazena uma entrada, descartando as menos recentes se o limite de memória for excedido."""
+        size = self._entry_size(key, value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (value, size)
+            self._user_keys.setdefault(key[0], set()).add(key)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.stats_counters["evictions"] += 1
+
+    def _remove(self, key: Tuple):
+        """Remove uma entrada (chamado com o lock adquirido)."""
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self._bytes -= entry[1]
+        keys = self._user_keys.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._user_keys[key[0]]
+
+    def invalidate_user(self, user_id: str):
+        """Remove todas as entradas de um usuário."""
+        with self._lock:
+            keys = self._user_keys.pop(user_id, set())
+            for key in keys:
+                entry = self._entries.pop(key, None)
+                if entry is not None:
+                    self._bytes -= entry[1]
+            if keys:
+                self.stats_counters["invalidations"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Retorna contadores, taxa de acerto e memória ocupada."""
+        with self._lock:
+            stats = dict(self.stats_counters)
+            stats["items"] = len(self._entries)
+            stats["bytes"] = self._bytes
+        stats["max_bytes"] = self.max_bytes
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
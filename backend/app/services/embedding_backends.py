@@ -0,0 +1,162 @@
+"""
+Backends de embedding do VectorStoreService.
+
+- "sentence-transformers": modelo neural (all-MiniLM-L6-v2 por padrão), carregado sob
+  demanda; melhor qualidade semântica, mas exige torch e o modelo baixado
+- "hashed": n-gramas de caracteres com hashing (sem dependências além do NumPy),
+  vetorizado por lote; ordens de grandeza mais rápido em CPU, captura sobreposição
+  lexical e morfológica (radicais, flexões, erros de digitação), não sinônimos
+"""
+import logging
+import numpy as np
+from typing import List
+
+from app.services.lexical_index import tokenize
+
+logger = logging.getLogger(__name__)
+
+class EmbeddingBackend:
+    """
+    Interface comum dos backends de embedding.
+
+    `name` identifica o espaço vetorial: vetores gerados com nomes diferentes não são
+    comparáveis (o nome entra nas chaves dos caches e no sidecar dos vetores em disco).
+    """
+
+    name: str = ""
+    dim: int = 0
+    # Se os vetores valem o custo do cache persistente (EmbeddingCache)
+    cacheable: bool = True
+
+    def load(self):
+        """Prepara o backend para uso; lança exceção se não estiver disponível."""
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dim
+
+    def encode(self, texts: List[str], batch_size: int = 32) -> np.ndarray:
+        """
+        Codifica um lote de textos.
+
+        Args:
+            texts: Textos a codificar
+            batch_size: Tamanho do lote (dica para backends que processam em lotes internos)
+
+        Returns:
+            Matriz float32 (len(texts), dim)
+        """
+        raise NotImplementedError
+
+class SentenceTransformerBackend(EmbeddingBackend):
+    """Modelo sentence-transformers; sentence_transformers (e torch) só são importados em load()."""
+
+    def __init__(self, model_name: str = "sentence-transformers/all-MiniLM-L6-v2", dim: int = 384):
+        """
+        Inicializa o backend.
+
+        Args:
+            model_name: Nome do modelo no Hugging Face
+            dim: Dimensão esperada (atualizada com a do modelo ao carregar)
+        """
+        self.name = model_name
+        self.dim = dim
+        self.model = None
+
+    def load(self):
+        from sentence_transformers import SentenceTransformer
+
+        model = SentenceTransformer(self.name)
+        self.dim = model.get_sentence_embedding_dimension()
+        self.model = model
+
+    def encode(self, texts: List[str], batch_size: int = 32) -> np.ndarray:
+        return np.asarray(self.model.encode(texts, batch_size=batch_size), dtype=np.float32)
+
+class HashedNgramBackend(EmbeddingBackend):
+    """
+    Embedding por hashing de n-gramas de caracteres (feature hashing com sinal).
+
+    O texto é normalizado como no índice lexical (minúsculas, sem acentos, termos
+    separados por um espaço) e cada n-grama de min_n a max_n caracteres soma ±1 em uma
+    das `dim` posições. As contagens recebem peso sublinear (log1p) e o vetor é
+    normalizado. O lote inteiro é processado com operações do NumPy (hash rolante sobre
+    o buffer concatenado e np.bincount), sem laço por n-grama.
+    """
+
+    cacheable = False  # Recalcular é mais barato que consultar o cache em disco
+
+    _PRIME = np.uint64(1099511628211)
+    _MIX = np.uint64(0xff51afd7ed558ccd)
+
+    def __init__(self, dim: int = 512, min_n: int = 3, max_n: int = 5):
+        """
+        Inicializa o backend.
+
+        Args:
+            dim: Dimensão dos vetores (mais posições = menos colisões de hash)
+            min_n: Menor tamanho de n-grama
+            max_n: Maior tamanho de n-grama
+        """
+        if not 0 < min_n <= max_n:
+            raise ValueError("É necessário 0 < min_n <= max_n")
+        self.dim = dim
+        self.min_n = min_n
+        self.max_n = max_n
+        self.name = f"hashed-char-ngrams-{min_n}-{max_n}-{dim}"
+
+    def encode(self, texts: List[str], batch_size: int = 32) -> np.ndarray:
+        if not texts:
+            return np.zeros((0, self.dim), dtype=np.float32)
+
+        # Cada texto vira " termo termo ... " (as bordas das palavras entram nos n-gramas)
+        padded = [f" {' '.join(tokenize(text, frozenset()))} " for text in texts]
+        data = np.frombuffer("".join(padded).encode("ascii"), dtype=np.uint8).astype(np.uint64)
+        doc_ids = np.repeat(np.arange(len(texts)), [len(text) for text in padded])
+
+        flat_positions = []
+        signs = []
+        for n in range(self.min_n, self.max_n + 1):
+            count = len(data) - n + 1
+            if count <= 0:
+                continue
+            hashes = np.full(count, n, dtype=np.uint64)
+            for offset in range(n):
+                hashes = hashes * self._PRIME + data[offset:offset + count]
+            # Finalizador do MurmurHash3: espalha os bits antes do módulo
+            hashes ^= hashes >> np.uint64(33)
+            hashes *= self._MIX
+            hashes ^= hashes >> np.uint64(33)
+
+            # Apenas n-gramas inteiramente dentro de um mesmo texto
+            valid = doc_ids[:count] == doc_ids[n - 1:]
+            hashes = hashes[valid]
+            flat_positions.append(doc_ids[:count][valid] * self.dim + (hashes % np.uint64(self.dim)).astype(np.int64))
+            signs.append(np.where(hashes >> np.uint64(63), -1.0, 1.0))
+
+        if not flat_positions:
+            return np.zeros((len(texts), self.dim), dtype=np.float32)
+        counts = np.bincount(
+            np.concatenate(flat_positions), weights=np.concatenate(signs), minlength=len(texts) * self.dim
+        ).reshape(len(texts), self.dim)
+        vectors = (np.sign(counts) * np.log1p(np.abs(counts))).astype(np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+def create_embedding_backend(backend: str, model_name: str = "sentence-transformers/all-MiniLM-L6-v2",
+                             hash_dim: int = 512) -> EmbeddingBackend:
+    """
+    Cria um backend de embedding pelo nome.
+
+    Args:
+        backend: "sentence-transformers" ou "hashed"
+        model_name: Modelo usado pelo backend sentence-transformers
+        hash_dim: Dimensão dos vetores do backend hashed
+
+    Returns:
+        Instância do backend (ainda não carregada)
+    """
+    if backend == "hashed":
+        return HashedNgramBackend(dim=hash_dim)
+    if backend != "sentence-transformers":
+        logger.warning(f"Backend de embedding desconhecido '{backend}', usando 'sentence-transformers'")
+    return SentenceTransformerBackend(model_name)
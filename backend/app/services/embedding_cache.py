@@ -0,0 +1,246 @@
+"""
+Cache de embeddings por conteúdo, compartilhado entre usuários e reinicializações.
+A chave é (nome do modelo, sha256 do texto); há uma camada LRU em memória e uma
+camada persistente em SQLite com limite de tamanho e evicção dos itens menos usados.
+Também define o cache em memória (LRU + TTL) dos embeddings de consultas.
+"""
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+class EmbeddingCache:
+    """
+    Cache de dois níveis para vetores de embedding.
+
+    Características:
+    - Camada em memória (LRU) limitada por número de itens
+    - Camada em disco (SQLite, modo WAL) compartilhável entre processos
+    - Evicção por último acesso quando a camada em disco excede o limite
+    - Contadores de acertos/faltas por camada
+    """
+
+    def __init__(self, db_path: Optional[str] = None, memory_items: int = 10000, disk_items: int = 200000):
+        """
+        Inicializa o cache.
+
+        Args:
+            db_path: Caminho do arquivo SQLite (None desativa a camada em disco)
+            memory_items: Número máximo de vetores na camada em memória
+            disk_items: Número máximo de vetores na camada em disco
+        """
+        self.memory_items = memory_items
+        self.disk_items = disk_items
+        self._memory: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self.stats_counters = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "memory_evictions": 0,
+            "disk_evictions": 0
+        }
+
+        if db_path:
+            try:
+                os.makedirs(os.path.dirname(db_path), exist_ok=True)
+                self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=5.0)
+                self._conn.execute("PRAGMA journal_mode=WAL")
+                self._conn.execute("PRAGMA synchronous=NORMAL")
+                self._conn.execute(
+                    "CREATE TABLE IF NOT EXISTS embeddings ("
+                    "key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_access REAL NOT NULL)"
+                )
+                self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_access ON embeddings(last_access)")
+                self._conn.commit()
+            except Exception as e:
+                logger.warning(f"Cache de embeddings em disco indisponível: {str(e)}")
+                self._conn = None
+
+    @staticmethod
+    def make_key(model_name: str, text: str) -> str:
+        """Chave do cache: modelo + sha256 do texto."""
+        return f"{model_name}:{hashlib.sha256(text.encode('utf-8')).hexdigest()}"
+
+    def _remember(self, key: str, vector: np.ndarray):
+        """Insere na camada em memória, descartando os itens menos recentes."""
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+            self.stats_counters["memory_evictions"] += 1
+
+    def get_many(self, model_name: str, texts: List[str]) -> Tuple[Dict[int, np.ndarray], List[int]]:
+        """
+        Busca vetores para uma lista de textos.
+
+        Args:
+            model_name: Nome do modelo de embedding
+            texts: Textos a buscar
+
+        Returns:
+            Tupla com: (posição -> vetor encontrado, posições não encontradas)
+        """
+        found: Dict[int, np.ndarray] = {}
+        pending: Dict[str, List[int]] = {}
+        with self._lock:
+            for position, text in enumerate(texts):
+                key = self.make_key(model_name, text)
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    found[position] = vector
+                    self.stats_counters["memory_hits"] += 1
+                else:
+                    pending.setdefault(key, []).append(position)
+
+            if pending and self._conn is not None:
+                try:
+                    keys = list(pending)
+                    for start in range(0, len(keys), 500):
+                        chunk = keys[start:start + 500]
+                        placeholders = ",".join("?" * len(chunk))
+                        rows = self._conn.execute(
+                            f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", chunk
+                        ).fetchall()
+                        for key, blob in rows:
+                            vector = np.frombuffer(blob, dtype=np.float32)
+                            self._remember(key, vector)
+                            for position in pending.pop(key):
+                                found[position] = vector
+                                self.stats_counters["disk_hits"] += 1
+                        now = time.time()
+                        self._conn.executemany(
+                            "UPDATE embeddings SET last_access = ? WHERE key = ?",
+                            [(now, key) for key, _ in rows]
+                        )
+                    self._conn.commit()
+                except Exception as e:
+                    logger.warning(f"Erro ao ler cache de embeddings em disco: {str(e)}")
+
+            missing = sorted(position for positions in pending.values() for position in positions)
+            self.stats_counters["misses"] += len(missing)
+        return found, missing
+
+    def put_many(self, model_name: str, texts: List[str], vectors: np.ndarray):
+        """
+        Armazena vetores recém-calculados nas duas camadas.
+
+        Args:
+            model_name: Nome do modelo de embedding
+            texts: Textos correspondentes
+            vectors: Matriz (len(texts), dim)
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        entries = [(self.make_key(model_name, text), vectors[i]) for i, text in enumerate(texts)]
+        with self._lock:
+            for key, vector in entries:
+                self._remember(key, vector)
+
+            if self._conn is None:
+                return
+            try:
+                now = time.time()
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO embeddings (key, vector, last_access) VALUES (?, ?, ?)",
+                    [(key, vector.tobytes(), now) for key, vector in entries]
+                )
+                self._evict_disk()
+                self._conn.commit()
+            except Exception as e:
+                logger.warning(f"Erro ao gravar cache de embeddings em disco: {str(e)}")
+
+    def _evict_disk(self):
+        """Remove os itens menos acessados quando a camada em disco excede o limite (até 90% dele)."""
+        count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        if count <= self.disk_items:
+            return
+        excess = count - int(self.disk_items * 0.9)
+        self._conn.execute(
+            "DELETE FROM embeddings WHERE key IN "
+            "(SELECT key FROM embeddings ORDER BY last_access ASC LIMIT ?)",
+            (excess,)
+        )
+        self.stats_counters["disk_evictions"] += excess
+        logger.info(f"Cache de embeddings em disco: {excess} itens removidos")
+
+    def stats(self) -> Dict[str, float]:
+        """Retorna contadores de acertos/faltas, taxa de acerto e ocupação das camadas."""
+        with self._lock:
+            stats = dict(self.stats_counters)
+            stats["memory_items"] = len(self._memory)
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["memory_hits"] + stats["disk_hits"]) / lookups if lookups else 0.0
+        return stats
+
+class QueryEmbeddingCache:
+    """
+    Cache LRU com TTL para embeddings de consultas.
+
+    Consultas se repetem muito ("quais minhas tarefas de hoje"), mas raramente valem
+    um registro permanente: este cache fica só em memória, limitado por número de
+    itens e com expiração, e é indexado pelo texto já normalizado da consulta.
+    """
+
+    def __init__(self, max_items: int = 2048, ttl_seconds: float = 3600):
+        """
+        Inicializa o cache.
+
+        Args:
+            max_items: Número máximo de consultas em cache
+            ttl_seconds: Tempo de vida de cada entrada, em segundos
+        """
+        self.max_items = max_items
+        self.ttl_seconds = ttl_seconds
+        self._items: "OrderedDict[Tuple[str, str], Tuple[np.ndarray, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats_counters = {"hits": 0, "misses": 0, "expired": 0, "evictions": 0}
+
+    def get(self, model_name: str, normalized_query: str) -> Optional[np.ndarray]:
+        """
+        Busca o embedding de uma consulta normalizada.
+
+        Returns:
+            Vetor em cache ou None (ausente ou expirado)
+        """
+        key = (model_name, normalized_query)
+        with self._lock:
+            entry = self._items.get(key)
+            if entry is not None and entry[1] < time.time():
+                del self._items[key]
+                self.stats_counters["expired"] += 1
+                entry = None
+            if entry is None:
+                self.stats_counters["misses"] += 1
+                return None
+            self._items.move_to_end(key)
+            self.stats_counters["hits"] += 1
+            return entry[0]
+
+    def put(self, model_name: str, normalized_query: str, vector: np.ndarray):
+        """Armazena o embedding de uma consulta, descartando as entradas menos recentes."""
+        key = (model_name, normalized_query)
+        with self._lock:
+            self._items[key] = (vector, time.time() + self.ttl_seconds)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+                self.stats_counters["evictions"] += 1
+
+    def stats(self) -> Dict[str, float]:
+        """Retorna contadores de acertos/faltas, taxa de acerto e ocupação."""
+        with self._lock:
+            stats = dict(self.stats_counters)
+            stats["items"] = len(self._items)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
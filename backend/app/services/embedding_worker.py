@@ -0,0 +1,155 @@
+"""
+Worker de embeddings em segundo plano.
+Executa as atualizações do vectorstore fora do event loop, em um pool de threads
+dedicado, coalescendo pedidos repetidos de atualização do mesmo usuário.
+"""
+import asyncio
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Tuple
+
+from app.database import SessionLocal
+from app.services.vector_store_service import vector_store_service
+
+logger = logging.getLogger(__name__)
+
+class EmbeddingWorker:
+    """
+    Fila de atualizações de embeddings por usuário.
+
+    Características:
+    - Pool de threads dedicado: SentenceTransformer.encode nunca roda no event loop
+    - Coalescência: pedidos para um usuário que ainda não começou a ser processado
+      são agrupados em um único job (force é combinado com OR)
+    - Lotes entre usuários: cada execução drena os jobs pendentes e faz uma única
+      passada de embedding para todos eles
+    - API aguardável (refresh) para quem precisa de vetores atualizados
+    - API "fire-and-forget" (refresh_nowait) para quem aceita vetores levemente defasados
+    """
+
+    def __init__(self, vector_store: Any, session_factory: Callable[[], Any], max_workers: int = 1,
+                 max_batch_users: int = 32):
+        """
+        Inicializa o worker.
+
+        Args:
+            vector_store: Serviço de armazenamento vetorial
+            session_factory: Fábrica de sessões do banco (cada job usa sua própria sessão)
+            max_workers: Número de threads de embedding
+            max_batch_users: Número máximo de usuários embedados em uma mesma passada
+        """
+        self.vector_store = vector_store
+        self.session_factory = session_factory
+        self.max_batch_users = max_batch_users
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="embedding")
+        self._lock = threading.Lock()
+        self._pending: Dict[str, Tuple[Future, bool]] = {}  # usuário -> (future, force)
+        self.stats_counters = {"submitted": 0, "coalesced": 0, "batches": 0, "completed": 0, "failed": 0}
+
+    def submit(self, user_id: str, force: bool = False) -> Future:
+        """
+        Agenda a atualização do vectorstore de um usuário.
+
+        Args:
+            user_id: ID do usuário
+            force: Se True, ignora o TTL do cache de vetores
+
+        Returns:
+            Future concluído quando a atualização terminar
+        """
+        with self._lock:
+            self.stats_counters["submitted"] += 1
+            pending = self._pending.get(user_id)
+            if pending is not None:
+                future, pending_force = pending
+                self._pending[user_id] = (future, pending_force or force)
+                self.stats_counters["coalesced"] += 1
+                return future
+
+            future = Future()
+            self._pending[user_id] = (future, force)
+        self.executor.submit(self._run, user_id)
+        return future
+
+    def _run(self, user_id: str):
+        """
+        Executa, em uma thread do pool, o job do usuário junto com os demais jobs pendentes.
+        Os textos de todos os usuários drenados são embedados em uma única passada.
+        """
+        with self._lock:
+            if user_id not in self._pending:
+                return  # Já processado no lote de outra thread
+            drained = {user_id: self._pending.pop(user_id)}
+            for other_id in list(self._pending)[:self.max_batch_users - 1]:
+                drained[other_id] = self._pending.pop(other_id)
+
+        jobs = {
+            job_user: (future, force) for job_user, (future, force) in drained.items()
+            if future.set_running_or_notify_cancel()
+        }
+        if not jobs:
+            return
+
+        db = self.session_factory()
+        try:
+            errors = self.vector_store.update_users_vectorstores(
+                [(job_user, force) for job_user, (_, force) in jobs.items()], db
+            )
+            self.stats_counters["batches"] += 1
+            for job_user, (future, _) in jobs.items():
+                error = errors.get(job_user)
+                if error is None:
+                    self.stats_counters["completed"] += 1
+                    future.set_result(None)
+                else:
+                    self.stats_counters["failed"] += 1
+                    future.set_exception(error)
+        except Exception as e:
+            logger.error(f"Erro ao atualizar embeddings dos usuários {list(jobs)}: {str(e)}")
+            for future, _ in jobs.values():
+                self.stats_counters["failed"] += 1
+                future.set_exception(e)
+        finally:
+            db.close()
+
+    async def refresh(self, user_id: str, force: bool = False):
+        """Agenda a atualização e aguarda sua conclusão sem bloquear o event loop."""
+        await asyncio.wrap_future(self.submit(user_id, force=force))
+
+    async def refresh_within(self, user_id: str, timeout: float, force: bool = False) -> bool:
+        """
+        Agenda a atualização e aguarda no máximo `timeout` segundos; depois disso ela
+        continua em segundo plano e a consulta usa os vetores atuais.
+
+        Returns:
+            True se a atualização terminou dentro do prazo
+        """
+        future = asyncio.wrap_future(self.submit(user_id, force=force))
+        # O erro de uma atualização que terminar depois do prazo é apenas registrado pelo worker
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        done, _ = await asyncio.wait({future}, timeout=timeout)
+        if done:
+            future.result()
+        return bool(done)
+
+    def refresh_nowait(self, user_id: str, force: bool = False):
+        """Agenda a atualização sem aguardar (a próxima consulta pode usar vetores antigos)."""
+        self.submit(user_id, force=force)
+
+    def stats(self) -> Dict[str, int]:
+        """Retorna os contadores do worker e o número de jobs pendentes."""
+        with self._lock:
+            return {**self.stats_counters, "pending": len(self._pending)}
+
+    def shutdown(self):
+        """Encerra o pool de threads, aguardando os jobs em andamento e cancelando os pendentes."""
+        with self._lock:
+            pending = list(self._pending.values())
+            self._pending.clear()
+        for future, _ in pending:
+            future.cancel()
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+# Instância global para uso em toda a aplicação
+embedding_worker = EmbeddingWorker(vector_store_service, SessionLocal)
@@ -0,0 +1,455 @@
+"""
+Fila durável de jobs de LLM no Postgres (tabela llm_jobs).
+
+Os jobs sobrevivem a reinícios e deploys e são distribuídos entre todos os processos
+que rodam o worker (containers da API ou `python -m app.job_worker`): cada worker
+reivindica jobs prontos com SELECT ... FOR UPDATE SKIP LOCKED, de modo que dois
+workers nunca pegam o mesmo job e nenhum espera pelo lock do outro.
+
+- Visibility timeout: o job reivindicado fica reservado até locked_until, renovado
+  periodicamente enquanto o worker está vivo; se o worker morrer, outro o retoma
+- Retentativas com backoff exponencial (com jitter) até max_attempts; depois o job vai
+  para o dead-letter (status "dead"), de onde pode ser reenfileirado manualmente
+- Cada execução passa pelo QueueService (limite de concorrência e justiça por usuário)
+- Encerramento gracioso: jobs não concluídos no prazo voltam para a fila sem gastar
+  tentativa
+"""
+import asyncio
+import logging
+import os
+import random
+import socket
+import time
+import uuid
+from datetime import timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from sqlalchemy import and_, func, or_, select, update
+from sqlalchemy.exc import SQLAlchemyError
+
+from app.database import SessionLocal, engine
+from app.models.llm_job import LLMJob
+from app.services.queue_service import queue_service, QueueFullError
+
+logger = logging.getLogger(__name__)
+
+def _job_to_dict(job: LLMJob) -> Dict[str, Any]:
+    """Representação pública de um job (sem o payload)."""
+    return {
+        "job_id": str(job.id),
+        "user_id": str(job.user_id) if job.user_id else None,
+        "kind": job.kind,
+        "status": job.status,
+        "attempts": job.attempts,
+        "max_attempts": job.max_attempts,
+        "run_after": job.run_after.isoformat() if job.run_after else None,
+        "result": job.result,
+        "last_error": job.last_error,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None
+    }
+
+class DurableJobQueue:
+    """
+    Produtor e worker da fila durável.
+
+    Os métodos de produtor (enqueue, get, cancel, retry_dead, ...) são síncronos e usam a
+    sessão recebida, como as demais rotas; o worker roda no event loop e faz o acesso ao
+    banco em threads (asyncio.to_thread).
+    """
+
+    def __init__(self, session_factory: Callable[[], Any], concurrency: int = 2,
+                 visibility_timeout: float = 300, job_timeout: float = 600, max_attempts: int = 5,
+                 retry_base_seconds: float = 5, retry_max_seconds: float = 600,
+                 poll_interval: float = 2.0, retention_hours: float = 72, shutdown_grace: float = 10):
+        """
+        Inicializa a fila.
+
+        Args:
+            session_factory: Fábrica de sessões do banco
+            concurrency: Jobs executados ao mesmo tempo por este worker
+            visibility_timeout: Segundos de reserva de um job (renovada enquanto executa)
+            job_timeout: Tempo máximo de uma execução (segundos)
+            max_attempts: Tentativas antes do dead-letter (padrão dos jobs novos)
+            retry_base_seconds: Atraso da primeira retentativa (dobra a cada tentativa)
+            retry_max_seconds: Atraso máximo entre tentativas
+            poll_interval: Intervalo de consulta quando não há jobs prontos
+            retention_hours: Tempo que jobs done/cancelled ficam na tabela
+            shutdown_grace: Segundos para concluir os jobs em execução ao encerrar
+        """
+        self.session_factory = session_factory
+        self.concurrency = concurrency
+        self.visibility_timeout = visibility_timeout
+        self.job_timeout = job_timeout
+        self.max_attempts = max_attempts
+        self.retry_base_seconds = retry_base_seconds
+        self.retry_max_seconds = retry_max_seconds
+        self.poll_interval = poll_interval
+        self.retention_hours = retention_hours
+        self.shutdown_grace = shutdown_grace
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.handlers: Dict[str, Callable[[Dict[str, Any]], Awaitable[Any]]] = {}
+        self._running: Dict[str, asyncio.Task] = {}  # ID do job -> execução local
+        self._running_jobs: Dict[str, Dict[str, Any]] = {}  # ID do job -> job reivindicado
+        self._cancel_requested = set()
+        self._worker_task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._stopping = False
+        self.stats_counters = {
+            "enqueued": 0, "claimed": 0, "completed": 0, "retried": 0, "dead_lettered": 0,
+            "released": 0, "lost_leases": 0, "claim_errors": 0
+        }
+
+    def register(self, kind: str, handler: Callable[[Dict[str, Any]], Awaitable[Any]]):
+        """
+        Registra o handler de um tipo de job.
+
+        Args:
+            kind: Tipo do job (coluna kind)
+            handler: Função assíncrona que recebe o payload e retorna um resultado serializável em JSON
+        """
+        self.handlers[kind] = handler
+
+    # ---------------------------------------------------------------- produtor
+
+    def enqueue(self, db, kind: str, payload: Dict[str, Any], user_id: Optional[str] = None,
+                max_attempts: Optional[int] = None) -> str:
+        """
+        Grava um job novo (confirmado no banco ao retornar).
+
+        Args:
+            db: Sessão do banco
+            kind: Tipo do job (deve ter handler registrado nos workers)
+            payload: Parâmetros do handler (JSON)
+            user_id: Usuário dono do job
+            max_attempts: Tentativas antes do dead-letter
+
+        Returns:
+            ID do job
+        """
+        job = LLMJob(
+            kind=kind,
+            payload=payload,
+            user_id=uuid.UUID(str(user_id)) if user_id else None,
+            max_attempts=max_attempts or self.max_attempts
+        )
+        db.add(job)
+        db.commit()
+        self.stats_counters["enqueued"] += 1
+        self._notify()
+        logger.info(f"Job durável {job.id} ({kind}) enfileirado")
+        return str(job.id)
+
+    def get(self, db, job_id: str) -> Optional[Dict[str, Any]]:
+        """Estado e resultado de um job, ou None se não existir."""
+        try:
+            job = db.get(LLMJob, uuid.UUID(str(job_id)))
+        except ValueError:
+            return None
+        return _job_to_dict(job) if job is not None else None
+
+    def cancel(self, db, job_id: str) -> bool:
+        """
+        Cancela um job que ainda não terminou. Um job na fila é cancelado no banco; um job
+        em execução só pode ser cancelado pelo processo que o executa.
+
+        Returns:
+            True se o job foi cancelado
+        """
+        cancelled = db.execute(
+            update(LLMJob)
+            .where(LLMJob.id == uuid.UUID(str(job_id)), LLMJob.status == "queued")
+            .values(status="cancelled", finished_at=func.now(), updated_at=func.now())
+        ).rowcount
+        db.commit()
+        if cancelled:
+            return True
+        task = self._running.get(str(job_id))
+        if task is not None and not task.done():
+            self._cancel_requested.add(str(job_id))
+            task.cancel()
+            return True
+        return False
+
+    def retry_dead(self, db, job_id: str) -> bool:
+        """Reenfileira um job do dead-letter com as tentativas zeradas."""
+        requeued = db.execute(
+            update(LLMJob)
+            .where(LLMJob.id == uuid.UUID(str(job_id)), LLMJob.status == "dead")
+            .values(status="queued", attempts=0, run_after=func.now(), finished_at=None, updated_at=func.now())
+        ).rowcount
+        db.commit()
+        if requeued:
+            self._notify()
+        return bool(requeued)
+
+    def list_dead(self, db, limit: int = 50) -> List[Dict[str, Any]]:
+        """Jobs no dead-letter, do mais recente para o mais antigo."""
+        jobs = db.query(LLMJob).filter(LLMJob.status == "dead").order_by(LLMJob.updated_at.desc()).limit(limit).all()
+        return [_job_to_dict(job) for job in jobs]
+
+    def stats(self, db) -> Dict[str, Any]:
+        """Jobs por estado (tabela inteira), execuções locais e contadores deste worker."""
+        counts = dict(db.query(LLMJob.status, func.count(LLMJob.id)).group_by(LLMJob.status).all())
+        return {
+            "worker_id": self.worker_id,
+            "worker_running": self._worker_task is not None and not self._worker_task.done(),
+            "concurrency": self.concurrency,
+            "running_here": len(self._running),
+            "by_status": counts,
+            **self.stats_counters
+        }
+
+    def _notify(self):
+        """Acorda o worker local (ex.: job novo ou slot livre), de qualquer thread."""
+        if self._loop is not None and self._wakeup is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    # ------------------------------------------------------------ acesso do worker
+
+    def _claim(self, limit: int) -> List[Dict[str, Any]]:
+        """
+        Reivindica até `limit` jobs prontos: na fila com run_after vencido, ou em execução
+        com a reserva vencida (worker que morreu). Jobs que estouram max_attempts ao serem
+        retomados vão para o dead-letter.
+        """
+        now = func.now()
+        ready = or_(
+            and_(LLMJob.status == "queued", LLMJob.run_after <= now),
+            and_(LLMJob.status == "running", LLMJob.locked_until < now)
+        )
+        candidates = (
+            select(LLMJob.id).where(ready).order_by(LLMJob.run_after).limit(limit)
+            .with_for_update(skip_locked=True)
+        )
+        with self.session_factory() as db:
+            rows = db.execute(
+                update(LLMJob)
+                .where(LLMJob.id.in_(candidates))
+                .values(
+                    status="running",
+                    locked_by=self.worker_id,
+                    locked_until=now + timedelta(seconds=self.visibility_timeout),
+                    attempts=LLMJob.attempts + 1,
+                    updated_at=now
+                )
+                .returning(LLMJob.id, LLMJob.kind, LLMJob.payload, LLMJob.user_id, LLMJob.attempts,
+                           LLMJob.max_attempts)
+                .execution_options(synchronize_session=False)
+            ).all()
+            jobs = []
+            for row in rows:
+                job = {
+                    "id": str(row.id), "kind": row.kind, "payload": row.payload,
+                    "user_id": str(row.user_id) if row.user_id else None,
+                    "attempts": row.attempts, "max_attempts": row.max_attempts
+                }
+                if row.attempts > row.max_attempts:
+                    self._finish(db, job, status="dead", last_error="Tentativas esgotadas (reserva do job expirou)")
+                    self.stats_counters["dead_lettered"] += 1
+                else:
+                    jobs.append(job)
+            db.commit()
+        return jobs
+
+    def _owned(self, job: Dict[str, Any]):
+        """Condição de posse: só o worker da tentativa atual altera o job."""
+        return and_(
+            LLMJob.id == uuid.UUID(job["id"]),
+            LLMJob.status == "running",
+            LLMJob.locked_by == self.worker_id,
+            LLMJob.attempts == job["attempts"]
+        )
+
+    def _finish(self, db, job: Dict[str, Any], **values) -> bool:
+        """Atualiza um job deste worker (sem commit); False se a posse foi perdida."""
+        updated = db.execute(
+            update(LLMJob).where(self._owned(job))
+            .values(locked_by=None, locked_until=None, updated_at=func.now(), **values)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        if not updated:
+            self.stats_counters["lost_leases"] += 1
+            logger.warning(f"Job durável {job['id']}: reserva perdida para outro worker; resultado descartado")
+        return bool(updated)
+
+    def _complete(self, job: Dict[str, Any], result: Any):
+        with self.session_factory() as db:
+            self._finish(db, job, status="done", result=result, last_error=None, finished_at=func.now())
+            db.commit()
+
+    def _fail(self, job: Dict[str, Any], error: str):
+        """Agenda uma nova tentativa com backoff exponencial ou move o job para o dead-letter."""
+        with self.session_factory() as db:
+            if job["attempts"] >= job["max_attempts"]:
+                if self._finish(db, job, status="dead", last_error=error, finished_at=func.now()):
+                    self.stats_counters["dead_lettered"] += 1
+                    logger.error(f"Job durável {job['id']} movido para o dead-letter após {job['attempts']} tentativas: {error}")
+            else:
+                delay = min(self.retry_max_seconds, self.retry_base_seconds * 2 ** (job["attempts"] - 1))
+                delay *= random.uniform(0.5, 1.0)  # Jitter: evita retentativas sincronizadas
+                if self._finish(db, job, status="queued", last_error=error,
+                                run_after=func.now() + timedelta(seconds=delay)):
+                    self.stats_counters["retried"] += 1
+                    logger.warning(f"Job durável {job['id']} falhou (tentativa {job['attempts']}), nova tentativa em {delay:.0f}s: {error}")
+            db.commit()
+
+    def _release(self, job: Dict[str, Any], delay: float = 0.0):
+        """Devolve um job à fila sem consumir a tentativa (encerramento ou fila local cheia)."""
+        with self.session_factory() as db:
+            if self._finish(db, job, status="queued", attempts=LLMJob.attempts - 1,
+                            run_after=func.now() + timedelta(seconds=delay)):
+                self.stats_counters["released"] += 1
+            db.commit()
+
+    def _cancelled(self, job: Dict[str, Any]):
+        with self.session_factory() as db:
+            self._finish(db, job, status="cancelled", last_error="Job cancelado", finished_at=func.now())
+            db.commit()
+
+    def _extend_leases(self, jobs: List[Dict[str, Any]]):
+        """Renova a reserva dos jobs em execução (heartbeat)."""
+        with self.session_factory() as db:
+            for job in jobs:
+                db.execute(
+                    update(LLMJob).where(self._owned(job))
+                    .values(locked_until=func.now() + timedelta(seconds=self.visibility_timeout))
+                    .execution_options(synchronize_session=False)
+                )
+            db.commit()
+
+    def _purge(self) -> int:
+        """Apaga jobs done/cancelled mais antigos que retention_hours (o dead-letter é mantido)."""
+        with self.session_factory() as db:
+            deleted = db.query(LLMJob).filter(
+                LLMJob.status.in_(("done", "cancelled")),
+                LLMJob.finished_at < func.now() - timedelta(hours=self.retention_hours)
+            ).delete(synchronize_session=False)
+            db.commit()
+        return deleted
+
+    # ------------------------------------------------------------------ worker
+
+    async def start(self):
+        """Inicia o loop do worker (apenas com Postgres: SKIP LOCKED não existe nos demais bancos)."""
+        if self._worker_task is not None:
+            return
+        if engine.dialect.name != "postgresql":
+            logger.warning(f"Worker da fila durável desativado: requer Postgres (banco atual: {engine.dialect.name})")
+            return
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self._worker_task = asyncio.create_task(self._run())
+        logger.info(f"Worker da fila durável iniciado ({self.worker_id}, concorrência {self.concurrency})")
+
+    async def stop(self):
+        """
+        Para de reivindicar jobs, aguarda os em execução por até shutdown_grace segundos e
+        devolve os restantes à fila.
+        """
+        if self._worker_task is None:
+            return
+        self._stopping = True
+        self._wakeup.set()
+        await asyncio.gather(self._worker_task, return_exceptions=True)
+        self._worker_task = None
+        if self._running:
+            _, pending = await asyncio.wait(list(self._running.values()), timeout=self.shutdown_grace)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+        logger.info("Worker da fila durável encerrado")
+
+    async def _run(self):
+        last_heartbeat = last_purge = time.monotonic()
+        while not self._stopping:
+            free = self.concurrency - len(self._running)
+            if free > 0:
+                try:
+                    jobs = await asyncio.to_thread(self._claim, free)
+                except SQLAlchemyError as e:
+                    self.stats_counters["claim_errors"] += 1
+                    logger.error(f"Erro ao reivindicar jobs duráveis: {str(e)}")
+                    jobs = []
+                for job in jobs:
+                    self.stats_counters["claimed"] += 1
+                    self._running_jobs[job["id"]] = job
+                    self._running[job["id"]] = asyncio.create_task(self._process(job))
+
+            now = time.monotonic()
+            try:
+                if self._running and now - last_heartbeat >= self.visibility_timeout / 3:
+                    await asyncio.to_thread(self._extend_leases, list(self._running_jobs.values()))
+                    last_heartbeat = now
+                if now - last_purge >= 3600:
+                    purged = await asyncio.to_thread(self._purge)
+                    if purged:
+                        logger.info(f"{purged} jobs duráveis antigos removidos")
+                    last_purge = now
+            except SQLAlchemyError as e:
+                logger.error(f"Erro na manutenção da fila durável: {str(e)}")
+
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _process(self, job: Dict[str, Any]):
+        """Executa um job reivindicado e registra o desfecho no banco."""
+        handler = self.handlers.get(job["kind"])
+        try:
+            if handler is None:
+                raise ValueError(f"Tipo de job sem handler: {job['kind']}")
+            result = await queue_service.run(
+                lambda: handler(job["payload"]), user_id=job["user_id"], priority="batch", timeout=self.job_timeout
+            )
+            await asyncio.to_thread(self._complete, job, result)
+            self.stats_counters["completed"] += 1
+        except QueueFullError as e:
+            await asyncio.to_thread(self._release, job, e.retry_after)
+        except asyncio.CancelledError:
+            if job["id"] in self._cancel_requested:
+                await asyncio.shield(asyncio.to_thread(self._cancelled, job))
+            else:
+                # Encerramento: outro worker retoma o job imediatamente
+                await asyncio.shield(asyncio.to_thread(self._release, job))
+            raise
+        except asyncio.TimeoutError:
+            await asyncio.to_thread(self._fail, job, f"Timeout excedido ({self.job_timeout}s)")
+        except Exception as e:
+            await asyncio.to_thread(self._fail, job, str(e) or type(e).__name__)
+        finally:
+            self._cancel_requested.discard(job["id"])
+            self._running.pop(job["id"], None)
+            self._running_jobs.pop(job["id"], None)
+            if self._wakeup is not None:
+                self._wakeup.set()
+
+async def _generate_text(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Handler "generate": gera a resposta do LLM para o prompt do payload."""
+    from app.services.ai_service import ai_service
+    from app.utils.llm_cleaner import clean_llm_response
+
+    response, metadata = await ai_service.aprocess_message(payload["prompt"], user_id=payload.get("user_id"))
+    if metadata.get("error"):
+        # Falha do LLM vira exceção para que o job seja tentado novamente
+        raise RuntimeError(metadata["error"])
+    return {"response": clean_llm_response(response)}
+
+# Instância global para uso em toda a aplicação
+job_queue = DurableJobQueue(
+    SessionLocal,
+    concurrency=int(os.getenv("JOB_WORKER_CONCURRENCY", "2")),
+    visibility_timeout=float(os.getenv("JOB_VISIBILITY_TIMEOUT_SECONDS", "300")),
+    job_timeout=float(os.getenv("JOB_TIMEOUT_SECONDS", "600")),
+    max_attempts=int(os.getenv("JOB_MAX_ATTEMPTS", "5")),
+    retry_base_seconds=float(os.getenv("JOB_RETRY_BASE_SECONDS", "5")),
+    retry_max_seconds=float(os.getenv("JOB_RETRY_MAX_SECONDS", "600")),
+    poll_interval=float(os.getenv("JOB_POLL_INTERVAL_SECONDS", "2")),
+    retention_hours=float(os.getenv("JOB_RETENTION_HOURS", "72")),
+    shutdown_grace=float(os.getenv("JOB_SHUTDOWN_GRACE_SECONDS", "10"))
+)
+job_queue.register("generate", _generate_text)
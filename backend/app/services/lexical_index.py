@@ -0,0 +1,153 @@
+"""
+Índice lexical (BM25) usado pelo VectorStoreService na busca híbrida.
+Complementa a similaridade semântica com correspondência exata de termos
+(nomes próprios, datas, códigos) e atende às consultas quando o modelo de
+embedding não está disponível.
+"""
+import heapq
+import logging
+import math
+import re
+import unicodedata
+from typing import Dict, FrozenSet, Iterable, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+# Palavras muito frequentes em português que não ajudam a ranquear documentos
+STOPWORDS = frozenset("""
+a ao aos as com como da das de do dos e em entre na nas no nos o os ou para pela pelas pelo
+pelos por que se sem sob sobre um uma umas uns
+""".split())
+
+def tokenize(text: str, stopwords: FrozenSet[str] = STOPWORDS) -> List[str]:
+    """
+    Divide um texto em termos: minúsculas, sem acentos e sem stopwords.
+    Números e códigos (ex.: "2024", "os-123" -> "os", "123") são preservados.
+
+    Args:
+        text: Texto a tokenizar
+        stopwords: Termos descartados
+
+    Returns:
+        Lista de termos, na ordem em que aparecem
+    """
+    text = unicodedata.normalize('NFKD', text.lower()).encode('ascii', 'ignore').decode('ascii')
+    return [token for token in TOKEN_PATTERN.findall(text) if token not in stopwords]
+
+def reciprocal_rank_fusion(rankings: Iterable[List[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """
+    Combina rankings pela fusão de postos recíprocos (RRF): score = soma de 1 / (k + posto).
+
+    Args:
+        rankings: Listas de chaves, cada uma ordenada da mais para a menos relevante
+        k: Constante de suavização (60 é o valor usual)
+
+    Returns:
+        Lista de (chave, score fundido) em ordem decrescente
+    """
+    fused: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, key in enumerate(ranking, start=1):
+            fused[key] = fused.get(key, 0.0) + 1.0 / (k + rank)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
+
+class LexicalIndex:
+    """
+    Índice invertido em memória com ranqueamento BM25.
+
+    Características:
+    - Listas invertidas termo -> {chave: frequência}
+    - Atualização incremental com add/remove (add substitui documentos existentes)
+    - Busca visita apenas as listas dos termos da consulta
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75, stopwords: FrozenSet[str] = STOPWORDS):
+        """
+        Inicializa o índice.
+
+        Args:
+            k1: Saturação da frequência de termo
+            b: Peso da normalização pelo tamanho do documento
+            stopwords: Termos ignorados na indexação e nas consultas
+        """
+        self.k1 = k1
+        self.b = b
+        self.stopwords = stopwords
+        self._postings: Dict[str, Dict[str, int]] = {}  # termo -> chave -> frequência
+        self._doc_terms: Dict[str, Dict[str, int]] = {}  # chave -> termo -> frequência
+        self._doc_lengths: Dict[str, int] = {}
+        self._total_length = 0
+
+    def __len__(self) -> int:
+        return len(self._doc_lengths)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._doc_lengths
+
+    def add(self, keys: List[str], texts: List[str]):
+        """
+        Adiciona (ou substitui) documentos no índice.
+
+        Args:
+            keys: Chaves dos documentos
+            texts: Textos correspondentes
+        """
+        self.remove([key for key in keys if key in self._doc_lengths])
+        for key, text in zip(keys, texts):
+            tokens = tokenize(text, self.stopwords)
+            frequencies: Dict[str, int] = {}
+            for token in tokens:
+                frequencies[token] = frequencies.get(token, 0) + 1
+            for term, frequency in frequencies.items():
+                self._postings.setdefault(term, {})[key] = frequency
+            self._doc_terms[key] = frequencies
+            self._doc_lengths[key] = len(tokens)
+            self._total_length += len(tokens)
+
+    def remove(self, keys: Iterable[str]):
+        """
+        Remove documentos do índice.
+
+        Args:
+            keys: Chaves a remover (chaves inexistentes são ignoradas)
+        """
+        for key in keys:
+            frequencies = self._doc_terms.pop(key, None)
+            if frequencies is None:
+                continue
+            for term in frequencies:
+                postings = self._postings[term]
+                del postings[key]
+                if not postings:
+                    del self._postings[term]
+            self._total_length -= self._doc_lengths.pop(key)
+
+    def search(self, query: str, k: int) -> List[Tuple[str, float]]:
+        """
+        Busca os k documentos com maior score BM25 para a consulta.
+
+        Args:
+            query: Texto da consulta
+            k: Número máximo de resultados
+
+        Returns:
+            Lista de (chave, score) em ordem decrescente; só documentos com algum termo em comum
+        """
+        count = len(self._doc_lengths)
+        if not count or k <= 0:
+            return []
+
+        average_length = self._total_length / count or 1.0
+        scores: Dict[str, float] = {}
+        for term in set(tokenize(query, self.stopwords)):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1.0 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for key, frequency in postings.items():
+                norm = self.k1 * (1.0 - self.b + self.b * self._doc_lengths[key] / average_length)
+                scores[key] = scores.get(key, 0.0) + idf * frequency * (self.k1 + 1.0) / (frequency + norm)
+
+        return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
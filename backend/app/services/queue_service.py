@@ -3,149 +3,710 @@ Serviço de fila para gerenciar requisições ao LLM.
 Usado para evitar sobrecarga e permitir processamento paralelo.
 """
 import asyncio
+import bisect
 import logging
-from typing import Dict, List, Any, Callable, Awaitable, Optional
+import math
+import os
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Dict, List, Any, Callable, Awaitable, Optional, Tuple
 import time
 import uuid
 
+from fastapi import HTTPException, status
+
+from app.services.concurrency_limiter import AdaptiveConcurrencyLimiter
+
 logger = logging.getLogger(__name__)
 
+# Classes de prioridade, da mais para a menos prioritária: chat interativo, streaming e
+# lotes do N8N (e-mails). Uma classe só é atendida quando as anteriores estão vazias
+PRIORITY_CLASSES = ("interactive", "stream", "batch")
+# Limites superiores (segundos) dos buckets dos histogramas de espera e de execução
+LATENCY_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+# Estados das tarefas assíncronas (enqueue_task): queued -> running -> done | cancelled;
+# um resultado descartado por TTL ou capacidade passa a "expired"
+TASK_STATUSES = ("queued", "running", "done", "cancelled", "expired")
+
+class QueueFullError(HTTPException):
+    """Fila cheia: a requisição é rejeitada na entrada com 429 e uma estimativa de Retry-After."""
+
+    def __init__(self, retry_after: int, reason: str):
+        super().__init__(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=f"Muitas requisições ao serviço de IA ({reason}). Tente novamente em {retry_after}s",
+            headers={"Retry-After": str(retry_after)}
+        )
+        self.retry_after = retry_after
+        self.reason = reason
+
+class LatencyHistogram:
+    """Histograma de latências com buckets fixos (cumulativos no formato do Prometheus)."""
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Último = acima do maior bucket
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, seconds: float):
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Estimativa do quantil: limite superior do bucket que o contém."""
+        if not self.count:
+            return None
+        target = q * self.count
+        cumulative = 0
+        for bound, count in zip(self.buckets + (math.inf,), self.counts):
+            cumulative += count
+            if cumulative >= target:
+                return bound
+        return math.inf
+
+    def snapshot(self) -> Dict[str, Any]:
+        cumulative = 0
+        buckets = {}
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            buckets[str(bound)] = cumulative
+        buckets["+Inf"] = self.count
+        return {
+            "count": self.count,
+            "sum": round(self.total, 4),
+            "mean": round(self.total / self.count, 4) if self.count else None,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+            "buckets": buckets
+        }
+
+class TaskStore:
+    """
+    Registro das tarefas assíncronas e de seus resultados, com memória limitada.
+
+    Tarefas ativas (queued/running) ficam até terminar; as concluídas ficam no máximo
+    ttl_seconds e, acima de max_entries, as mais antigas são descartadas primeiro. Uma
+    tarefa descartada deixa apenas uma marca "expired" (também limitada por TTL e
+    quantidade), para que quem consulta saiba que o resultado existiu.
+    """
+
+    def __init__(self, ttl_seconds: float = 600, max_entries: int = 1000):
+        """
+        Inicializa o registro.
+
+        Args:
+            ttl_seconds: Tempo que um resultado fica disponível após a conclusão
+            max_entries: Número máximo de resultados guardados
+        """
+        self.ttl = ttl_seconds
+        self.max_entries = max_entries
+        self._active: Dict[str, Dict[str, Any]] = {}
+        # Concluídas em ordem de conclusão (a mais antiga no início)
+        self._finished: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        # ID -> instante do descarte
+        self._expired: "OrderedDict[str, float]" = OrderedDict()
+        self.stats_counters = {"expired_ttl": 0, "evicted_capacity": 0}
+
+    def add(self, task_id: str, user_id: Optional[str], priority: str):
+        self._active[task_id] = {
+            "task_id": task_id,
+            "status": "queued",
+            "user_id": user_id,
+            "priority": priority,
+            "created_at": time.time(),
+            "started_at": None,
+            "finished_at": None
+        }
+
+    def mark_running(self, task_id: str):
+        record = self._active.get(task_id)
+        if record is not None:
+            record["status"] = "running"
+            record["started_at"] = time.time()
+
+    def finish(self, task_id: str, status: str, **fields):
+        """Move uma tarefa ativa para as concluídas (done ou cancelled) com os campos do resultado."""
+        record = self._active.pop(task_id, None)
+        if record is None:
+            return
+        record.update(fields)
+        record["status"] = status
+        record["finished_at"] = time.time()
+        self._finished[task_id] = record
+        self._evict()
+
+    def is_active(self, task_id: str) -> bool:
+        return task_id in self._active
+
+    def get(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """Estado atual da tarefa (cópia), marca "expired" ou None se desconhecida."""
+        self._evict()
+        record = self._active.get(task_id) or self._finished.get(task_id)
+        if record is not None:
+            return dict(record)
+        if task_id in self._expired:
+            return {"task_id": task_id, "status": "expired"}
+        return None
+
+    def pop(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """Retira o resultado de uma tarefa concluída (o resultado só pode ser lido uma vez)."""
+        self._evict()
+        return self._finished.pop(task_id, None)
+
+    def _evict(self):
+        """Descarta resultados vencidos ou excedentes e marcas "expired" antigas."""
+        now = time.time()
+        while self._finished:
+            task_id, record = next(iter(self._finished.items()))
+            if now - record["finished_at"] >= self.ttl:
+                self.stats_counters["expired_ttl"] += 1
+            elif len(self._finished) > self.max_entries:
+                self.stats_counters["evicted_capacity"] += 1
+            else:
+                break
+            del self._finished[task_id]
+            self._expired[task_id] = now
+        while self._expired:
+            task_id, expired_at = next(iter(self._expired.items()))
+            if now - expired_at < self.ttl and len(self._expired) <= self.max_entries:
+                break
+            del self._expired[task_id]
+
+    def stats(self) -> Dict[str, Any]:
+        self._evict()
+        by_status = {status: 0 for status in TASK_STATUSES}
+        for record in list(self._active.values()) + list(self._finished.values()):
+            by_status[record["status"]] += 1
+        by_status["expired"] = len(self._expired)
+        return {
+            "by_status": by_status,
+            "ttl_seconds": self.ttl,
+            "max_entries": self.max_entries,
+            **self.stats_counters
+        }
+
+class _Waiter:
+    """Requisição aguardando um slot de execução."""
+
+    __slots__ = ("future", "user_id", "priority", "enqueued_at", "finish_tag", "seq", "in_queue")
+
+    def __init__(self, future: asyncio.Future, user_id: str, priority: str, finish_tag: float, seq: int):
+        self.future = future
+        self.user_id = user_id
+        self.priority = priority
+        self.enqueued_at = time.monotonic()
+        self.finish_tag = finish_tag
+        self.seq = seq
+        self.in_queue = True
+
 class QueueService:
     """
-    Implementa um sistema de fila para processar requisições de chat.
-    
+    Implementa um sistema de fila para processar requisições ao LLM.
+
     Características:
-    - Processamento assíncrono de requisições
-    - Limite de concorrência para o Ollama
-    - Sistema de prioridade para requisições
+    - Limite de concorrência para o Ollama (slots de execução)
+    - Classes de prioridade estrita: interactive (chat) > stream > batch (N8N)
+    - Justiça entre usuários dentro de cada classe (weighted fair queuing com relógio
+      virtual auto-sincronizado): um usuário com muitas requisições não bloqueia os demais
+    - Backlog limitado por classe e por usuário: o excesso é rejeitado na entrada com 429 e
+      Retry-After estimado pela fila à frente e pelo tempo médio de execução; uma rajada
+      de batch não esgota o backlog de interactive/stream
+    - Histogramas de espera (por classe) e de execução, profundidade da fila e contadores
     - Timeout para evitar esperas infinitas
+    - Tarefas assíncronas (enqueue_task) canceláveis, com resultados limitados por TTL e quantidade
+    - Limite de concorrência opcionalmente adaptativo (AdaptiveConcurrencyLimiter), ajustado
+      pelas métricas das gerações (observe_generation)
     """
-    
-    def __init__(self, max_concurrent: int = 2, timeout_seconds: int = 60):
+
+    def __init__(self, max_concurrent: int = 2, timeout_seconds: int = 60, max_backlog: int = 64,
+                 max_per_user: int = 8, user_weights: Optional[Dict[str, float]] = None,
+                 result_ttl_seconds: float = 600, max_results: int = 1000,
+                 limiter: Optional[AdaptiveConcurrencyLimiter] = None,
+                 max_backlog_per_class: Optional[Dict[str, int]] = None):
         """
         Inicializa o serviço de fila.
-        
+
         Args:
             max_concurrent: Número máximo de requisições concorrentes
             timeout_seconds: Tempo máximo para processar uma requisição (segundos)
+            max_backlog: Número máximo de requisições aguardando em cada classe
+            max_per_user: Número máximo de requisições aguardando por usuário
+            user_weights: Peso de cada usuário no fair queuing (padrão 1.0)
+            result_ttl_seconds: Tempo que o resultado de uma tarefa fica disponível
+            max_results: Número máximo de resultados de tarefas guardados
+            limiter: Limitador adaptativo; quando informado, define max_concurrent
+            max_backlog_per_class: Limite específico de alguma classe (padrão max_backlog)
         """
-        self.semaphore = asyncio.Semaphore(max_concurrent)
+        self.limiter = limiter
+        self.max_concurrent = limiter.limit if limiter is not None else max_concurrent
         self.timeout = timeout_seconds
-        self.pending_tasks = {}  # ID da tarefa -> task
-        self.results = {}        # ID da tarefa -> resultado
-        
-    async def enqueue_task(self, 
-                        handler: Callable[[Dict[str, Any]], Awaitable[Any]], 
-                        params: Dict[str, Any]) -> str:
+        self.max_backlog = max_backlog
+        self.max_backlog_per_class = {
+            priority: (max_backlog_per_class or {}).get(priority, max_backlog) for priority in PRIORITY_CLASSES
+        }
+        self.max_per_user = max_per_user
+        self.user_weights = user_weights or {}
+        self.running = 0
+        # Classe -> usuário -> fila FIFO do usuário
+        self.queues: Dict[str, Dict[str, "deque[_Waiter]"]] = {priority: {} for priority in PRIORITY_CLASSES}
+        # Relógio virtual e última marca de término por usuário, por classe
+        self.virtual_time = {priority: 0.0 for priority in PRIORITY_CLASSES}
+        self.last_finish: Dict[str, Dict[str, float]] = {priority: {} for priority in PRIORITY_CLASSES}
+        self.queued = 0
+        self.queued_per_user: Dict[str, int] = {}
+        self.queued_per_class = {priority: 0 for priority in PRIORITY_CLASSES}
+        # Tarefas de enqueue_task admitidas que ainda não pediram o slot (task ainda não rodou)
+        self.reserved = 0
+        self.reserved_per_user: Dict[str, int] = {}
+        self.reserved_per_class = {priority: 0 for priority in PRIORITY_CLASSES}
+        self.reservations: Dict[str, Tuple[str, str]] = {}  # ID da tarefa -> (usuário, classe)
+        self._seq = 0
+        self.service_time_ewma: Optional[float] = None
+        self.wait_histograms = {priority: LatencyHistogram() for priority in PRIORITY_CLASSES}
+        self.service_histogram = LatencyHistogram()
+        self.stats_counters = {
+            "admitted": 0, "rejected": 0, "completed": 0, "cancelled": 0, "timeouts": 0, "max_queued": 0
+        }
+        self.pending_tasks: Dict[str, asyncio.Task] = {}  # ID da tarefa -> task
+        self.tasks = TaskStore(result_ttl_seconds, max_results)  # Estados e resultados
+
+    def backlog(self) -> int:
+        """Requisições aguardando slot, incluindo as reservas que não cabem nos slots livres."""
+        return self.queued + self._reserved_waiting()
+
+    def _reserved_waiting(self, user: Optional[str] = None) -> int:
+        """Reservas (de todos ou de um usuário) que excedem os slots livres e vão esperar na fila."""
+        free_slots = max(self.max_concurrent - self.running, 0)
+        reserved = self.reserved if user is None else self.reserved_per_user.get(user, 0)
+        return max(reserved - free_slots, 0)
+
+    def _class_backlog(self) -> Dict[str, int]:
+        """Backlog de cada classe; os slots livres atendem primeiro as reservas das classes prioritárias."""
+        free_slots = max(self.max_concurrent - self.running, 0)
+        backlog = {}
+        for priority in PRIORITY_CLASSES:
+            reserved = self.reserved_per_class[priority]
+            starting = min(reserved, free_slots)
+            free_slots -= starting
+            backlog[priority] = self.queued_per_class[priority] + reserved - starting
+        return backlog
+
+    def estimate_retry_after(self, priority: str = "batch") -> int:
+        """Segundos estimados até haver espaço: fila à frente (classes >= priority) x tempo médio / slots."""
+        service_time = self.service_time_ewma if self.service_time_ewma is not None else 5.0
+        class_backlog = self._class_backlog()
+        ahead = sum(class_backlog[p] for p in PRIORITY_CLASSES[:PRIORITY_CLASSES.index(priority) + 1])
+        seconds = (ahead + 1) * service_time / max(self.max_concurrent, 1)
+        return max(1, min(int(math.ceil(seconds)), int(self.timeout)))
+
+    def check_admission(self, user_id: Optional[str] = None, priority: str = "interactive"):
+        """
+        Verifica se uma nova requisição seria aceita, sem enfileirá-la (ex.: antes de
+        iniciar uma resposta em streaming, quando ainda é possível responder 429).
+
+        Raises:
+            QueueFullError: Backlog da classe ou do usuário cheio
+        """
+        if priority not in PRIORITY_CLASSES:
+            raise ValueError(f"Classe de prioridade desconhecida: {priority}")
+        if self.running + self.reserved < self.max_concurrent and self.queued == 0:
+            return
+        user = str(user_id or "anonymous")
+        reason = None
+        if self._class_backlog()[priority] >= self.max_backlog_per_class[priority]:
+            reason = f"fila {priority} cheia"
+        elif self.queued_per_user.get(user, 0) + self._reserved_waiting(user) >= self.max_per_user:
+            reason = "limite de requisições pendentes do usuário"
+        if reason:
+            self.stats_counters["rejected"] += 1
+            retry_after = self.estimate_retry_after(priority)
+            logger.warning(f"Requisição do usuário {user} ({priority}) rejeitada: {reason}; Retry-After {retry_after}s")
+            raise QueueFullError(retry_after, reason)
+
+    def _reserve(self, task_id: str, user_id: Optional[str], priority: str):
+        """Conta uma tarefa admitida no backlog até ela pedir o slot ou ser cancelada."""
+        user = str(user_id or "anonymous")
+        self.reservations[task_id] = (user, priority)
+        self.reserved += 1
+        self.reserved_per_class[priority] += 1
+        self.reserved_per_user[user] = self.reserved_per_user.get(user, 0) + 1
+
+    def _release_reservation(self, task_id: str) -> bool:
+        """Libera a reserva da tarefa (idempotente); retorna True se ela existia."""
+        reservation = self.reservations.pop(task_id, None)
+        if reservation is None:
+            return False
+        user, priority = reservation
+        self.reserved -= 1
+        self.reserved_per_class[priority] -= 1
+        self.reserved_per_user[user] -= 1
+        if not self.reserved_per_user[user]:
+            del self.reserved_per_user[user]
+        return True
+
+    async def acquire(self, user_id: Optional[str] = None, priority: str = "interactive",
+                      reservation: Optional[str] = None):
+        """
+        Aguarda um slot de execução. Quem chama deve liberar o slot com release()
+        (ou usar o context manager slot()).
+
+        Args:
+            user_id: Usuário da requisição
+            priority: "interactive", "stream" ou "batch"
+            reservation: ID da tarefa já admitida por enqueue_task (troca a reserva pela fila)
+
+        Raises:
+            QueueFullError: Backlog da classe ou do usuário cheio
+        """
+        if reservation is None or not self._release_reservation(reservation):
+            self.check_admission(user_id, priority)
+        self.stats_counters["admitted"] += 1
+        user = str(user_id or "anonymous")
+
+        # Slot livre e ninguém esperando: executar imediatamente
+        if self.running < self.max_concurrent and self.queued == 0:
+            self.running += 1
+            self.wait_histograms[priority].observe(0.0)
+            return
+
+        # Marca de término virtual: início = max(relógio virtual, último término do usuário)
+        weight = self.user_weights.get(user, 1.0)
+        start_tag = max(self.virtual_time[priority], self.last_finish[priority].get(user, 0.0))
+        finish_tag = start_tag + 1.0 / weight
+        self.last_finish[priority][user] = finish_tag
+        self._seq += 1
+        waiter = _Waiter(asyncio.get_running_loop().create_future(), user, priority, finish_tag, self._seq)
+        self.queues[priority].setdefault(user, deque()).append(waiter)
+        self.queued += 1
+        self.queued_per_class[priority] += 1
+        self.queued_per_user[user] = self.queued_per_user.get(user, 0) + 1
+        self.stats_counters["max_queued"] = max(self.stats_counters["max_queued"], self.queued)
+
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # O slot foi concedido antes do cancelamento: devolvê-lo
+                self.release()
+            else:
+                self._remove_waiter(waiter)
+            self.stats_counters["cancelled"] += 1
+            raise
+
+    def release(self):
+        """Libera um slot de execução e concede-o à próxima requisição da fila."""
+        self.running -= 1
+        self._dispatch()
+
+    def _remove_waiter(self, waiter: _Waiter):
+        """Retira uma requisição da fila (idempotente)."""
+        if not waiter.in_queue:
+            return
+        waiter.in_queue = False
+        user_queue = self.queues[waiter.priority].get(waiter.user_id)
+        if user_queue is not None:
+            try:
+                user_queue.remove(waiter)
+            except ValueError:
+                pass
+            if not user_queue:
+                del self.queues[waiter.priority][waiter.user_id]
+                # Sem requisições na fila, o próximo início do usuário é o relógio virtual
+                self.last_finish[waiter.priority].pop(waiter.user_id, None)
+        self.queued -= 1
+        self.queued_per_class[waiter.priority] -= 1
+        self.queued_per_user[waiter.user_id] -= 1
+        if not self.queued_per_user[waiter.user_id]:
+            del self.queued_per_user[waiter.user_id]
+
+    def _next_waiter(self) -> Optional[_Waiter]:
+        """Próxima requisição: classe mais prioritária e, nela, a menor marca de término."""
+        for priority in PRIORITY_CLASSES:
+            users = self.queues[priority]
+            if not users:
+                continue
+            user = min(users, key=lambda u: (users[u][0].finish_tag, users[u][0].seq))
+            waiter = users[user][0]
+            self._remove_waiter(waiter)
+            # Relógio virtual auto-sincronizado: a marca da requisição em atendimento
+            self.virtual_time[priority] = waiter.finish_tag
+            return waiter
+        return None
+
+    def _dispatch(self):
+        """Concede slots livres às próximas requisições da fila."""
+        while self.running < self.max_concurrent:
+            waiter = self._next_waiter()
+            if waiter is None:
+                return
+            if waiter.future.done():
+                continue  # Cancelada enquanto aguardava
+            self.running += 1
+            self.wait_histograms[waiter.priority].observe(time.monotonic() - waiter.enqueued_at)
+            waiter.future.set_result(None)
+
+    def set_max_concurrent(self, limit: int):
+        """Altera o número de slots; um aumento concede imediatamente os slots novos à fila."""
+        self.max_concurrent = max(1, limit)
+        self._dispatch()
+
+    def observe_generation(self, ttft: float, tokens: int, decode_seconds: float):
+        """
+        Registra as métricas de uma geração concluída no limitador adaptativo (se houver),
+        aplicando o novo limite. Deve ser chamado dentro do slot da geração.
+
+        Args:
+            ttft: Tempo até o primeiro token (segundos)
+            tokens: Tokens gerados
+            decode_seconds: Tempo de decodificação (segundos)
+        """
+        if self.limiter is None:
+            return
+        limit = self.limiter.on_sample(ttft, tokens, decode_seconds, in_flight=self.running, saturated=self.queued > 0)
+        if limit != self.max_concurrent:
+            self.set_max_concurrent(limit)
+
+    def _record_service_time(self, seconds: float):
+        self.service_histogram.observe(seconds)
+        if self.service_time_ewma is None:
+            self.service_time_ewma = seconds
+        else:
+            self.service_time_ewma = 0.8 * self.service_time_ewma + 0.2 * seconds
+
+    @asynccontextmanager
+    async def slot(self, user_id: Optional[str] = None, priority: str = "interactive",
+                   reservation: Optional[str] = None):
+        """
+        Context manager que ocupa um slot de execução durante o bloco (ex.: um stream inteiro).
+
+        Args:
+            user_id: Usuário da requisição (fair queuing e limite por usuário)
+            priority: "interactive", "stream" ou "batch"
+            reservation: ID da tarefa já admitida por enqueue_task
+        """
+        await self.acquire(user_id, priority, reservation)
+        start_time = time.monotonic()
+        try:
+            yield
+        finally:
+            self._record_service_time(time.monotonic() - start_time)
+            self.stats_counters["completed"] += 1
+            self.release()
+
+    async def run(self, handler: Callable[[], Awaitable[Any]], user_id: Optional[str] = None,
+                  priority: str = "interactive", timeout: Optional[float] = None) -> Any:
+        """
+        Executa uma chamada ao LLM dentro de um slot e retorna o resultado.
+
+        Args:
+            handler: Função assíncrona sem argumentos (ex.: lambda: ai_service.aprocess_message(...))
+            user_id: Usuário da requisição
+            priority: "interactive", "stream" ou "batch"
+            timeout: Tempo máximo de execução (None = sem limite adicional)
+
+        Raises:
+            QueueFullError: Backlog cheio (429)
+        """
+        async with self.slot(user_id, priority):
+            if timeout is None:
+                return await handler()
+            return await asyncio.wait_for(handler(), timeout=timeout)
+
+    async def enqueue_task(self,
+                        handler: Callable[[Dict[str, Any]], Awaitable[Any]],
+                        params: Dict[str, Any],
+                        user_id: Optional[str] = None,
+                        priority: str = "batch") -> str:
         """
         Adiciona uma tarefa à fila e retorna um ID para consulta posterior.
-        
+
         Args:
             handler: Função assíncrona que processa a requisição
             params: Parâmetros para passar ao handler
-            
+            user_id: Usuário da requisição
+            priority: "interactive", "stream" ou "batch"
+
         Returns:
             ID da tarefa para consulta posterior
+
+        Raises:
+            QueueFullError: Backlog cheio (429)
         """
+        self.check_admission(user_id, priority)
         task_id = str(uuid.uuid4())
         logger.info(f"Enfileirada nova tarefa {task_id}")
-        
-        # Criar e armazenar a tarefa
-        task = asyncio.create_task(self._execute_task(handler, params, task_id))
+
+        # A tarefa conta no backlog desde já (sem await entre a admissão e a reserva):
+        # uma rajada de enqueue_task não passa toda pela admissão antes de a primeira rodar
+        self._reserve(task_id, user_id, priority)
+        self.tasks.add(task_id, str(user_id) if user_id is not None else None, priority)
+        task = asyncio.create_task(self._execute_task(handler, params, task_id, user_id, priority))
         self.pending_tasks[task_id] = task
-        
+        task.add_done_callback(lambda _: self._on_task_done(task_id))
+
         return task_id
-        
-    async def _execute_task(self, 
-                         handler: Callable[[Dict[str, Any]], Awaitable[Any]], 
+
+    async def _execute_task(self,
+                         handler: Callable[[Dict[str, Any]], Awaitable[Any]],
                          params: Dict[str, Any],
-                         task_id: str) -> None:
+                         task_id: str,
+                         user_id: Optional[str] = None,
+                         priority: str = "batch") -> None:
         """
         Executa a tarefa quando um slot estiver disponível.
-        
+
         Args:
             handler: Função assíncrona que processa a requisição
             params: Parâmetros para passar ao handler
             task_id: ID da tarefa
+            user_id: Usuário da requisição
+            priority: Classe de prioridade
         """
-        async with self.semaphore:
-            start_time = time.time()
-            logger.info(f"Iniciando processamento da tarefa {task_id}")
-            
-            try:
+        start_time = time.time()
+        try:
+            async with self.slot(user_id, priority, reservation=task_id):
+                logger.info(f"Iniciando processamento da tarefa {task_id}")
+                self.tasks.mark_running(task_id)
+
                 # Executar a tarefa com timeout
                 result = await asyncio.wait_for(
                     handler(params),
                     timeout=self.timeout
                 )
-                
-                # Armazenar resultado
-                self.results[task_id] = {
-                    "success": True,
-                    "result": result,
-                    "elapsed": time.time() - start_time
-                }
-                
-                logger.info(f"Tarefa {task_id} completada em {time.time() - start_time:.2f}s")
-                
-            except asyncio.TimeoutError:
-                logger.error(f"Timeout na tarefa {task_id} após {self.timeout}s")
-                self.results[task_id] = {
-                    "success": False,
-                    "error": "Timeout excedido",
-                    "elapsed": time.time() - start_time
-                }
-                
-            except Exception as e:
-                logger.error(f"Erro na tarefa {task_id}: {str(e)}")
-                self.results[task_id] = {
-                    "success": False,
-                    "error": str(e),
-                    "elapsed": time.time() - start_time
-                }
-                
-            finally:
-                # Remover da lista de pendentes
-                if task_id in self.pending_tasks:
-                    del self.pending_tasks[task_id]
-    
+
+            # Armazenar resultado
+            self.tasks.finish(task_id, "done", success=True, result=result, elapsed=time.time() - start_time)
+
+            logger.info(f"Tarefa {task_id} completada em {time.time() - start_time:.2f}s")
+
+        except asyncio.TimeoutError:
+            logger.error(f"Timeout na tarefa {task_id} após {self.timeout}s")
+            self.stats_counters["timeouts"] += 1
+            self.tasks.finish(task_id, "done", success=False, error="Timeout excedido", elapsed=time.time() - start_time)
+
+        except Exception as e:
+            logger.error(f"Erro na tarefa {task_id}: {str(e)}")
+            self.tasks.finish(task_id, "done", success=False, error=str(e), elapsed=time.time() - start_time)
+
+    def _on_task_done(self, task_id: str):
+        """
+        Remove a tarefa das pendentes. Uma tarefa cancelada antes de terminar (inclusive
+        antes de começar a executar) é registrada como "cancelled".
+        """
+        self.pending_tasks.pop(task_id, None)
+        # Cancelada antes de pedir o slot: a reserva ainda está contada no backlog
+        self._release_reservation(task_id)
+        if self.tasks.is_active(task_id):
+            logger.info(f"Tarefa {task_id} cancelada")
+            self.tasks.finish(task_id, "cancelled", success=False, error="Tarefa cancelada")
+
+    def cancel(self, task_id: str) -> bool:
+        """
+        Cancela uma tarefa na fila ou em execução (a chamada ao LLM em andamento é abortada
+        e o slot é devolvido).
+
+        Args:
+            task_id: ID da tarefa
+
+        Returns:
+            True se a tarefa estava pendente e foi cancelada
+        """
+        task = self.pending_tasks.get(task_id)
+        if task is None or task.done():
+            return False
+        return task.cancel()
+
+    def get_task(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Consulta o estado de uma tarefa sem consumir o resultado.
+
+        Args:
+            task_id: ID da tarefa
+
+        Returns:
+            Estado (queued, running, done, cancelled ou expired) e, se concluída, o
+            resultado; None se a tarefa não existe
+        """
+        return self.tasks.get(task_id)
+
     async def get_task_result(self, task_id: str, wait: bool = True) -> Optional[Dict[str, Any]]:
         """
         Obtém o resultado de uma tarefa pelo ID.
-        
+
         Args:
             task_id: ID da tarefa
             wait: Se deve esperar a tarefa completar
-            
+
         Returns:
-            Resultado da tarefa ou None se não encontrada
+            Resultado da tarefa, estado em andamento, marca "expired" ou None se não encontrada
         """
-        # Verificar se a tarefa já está concluída
-        if task_id in self.results:
-            result = self.results[task_id]
-            # Limpar resultados antigos para economizar memória
-            del self.results[task_id]
+        # Verificar se a tarefa já está concluída (o resultado é consumido)
+        result = self.tasks.pop(task_id)
+        if result is not None:
             return result
-            
+
         # Verificar se a tarefa está pendente
         if task_id in self.pending_tasks:
             if wait:
-                # Esperar a tarefa completar
-                try:
-                    await self.pending_tasks[task_id]
-                    return self.results.pop(task_id, None)
-                except Exception:
-                    logger.error(f"Erro ao aguardar tarefa {task_id}")
-                    return None
+                # Esperar a tarefa completar (sem propagar um eventual cancelamento dela)
+                await asyncio.wait({self.pending_tasks[task_id]})
+                return self.tasks.pop(task_id) or self.tasks.get(task_id)
             else:
                 # Retornar status em andamento
                 return {
                     "status": "processing",
                     "message": "A tarefa está sendo processada"
                 }
-                
-        # Tarefa não encontrada
+
+        # Tarefa descartada por TTL/capacidade ("expired") ou não encontrada
+        return self.tasks.get(task_id)
+
+    def stats(self) -> Dict[str, Any]:
+        """Profundidade da fila, slots em uso, contadores e histogramas de espera/execução."""
+        return {
+            "max_concurrent": self.max_concurrent,
+            "running": self.running,
+            "queued": self.queued,
+            "queued_by_class": dict(self.queued_per_class),
+            "queued_users": len(self.queued_per_user),
+            "reserved": self.reserved,
+            "backlog_by_class": self._class_backlog(),
+            "max_backlog_by_class": dict(self.max_backlog_per_class),
+            "max_per_user": self.max_per_user,
+            "estimated_retry_after": self.estimate_retry_after(),
+            "service_time_ewma": round(self.service_time_ewma, 4) if self.service_time_ewma is not None else None,
+            **self.stats_counters,
+            "wait_seconds": {priority: histogram.snapshot() for priority, histogram in self.wait_histograms.items()},
+            "service_seconds": self.service_histogram.snapshot(),
+            "tasks": self.tasks.stats(),
+            "adaptive_limit": self.limiter.stats() if self.limiter is not None else None
+        }
+
+def _create_limiter() -> Optional[AdaptiveConcurrencyLimiter]:
+    """Limitador adaptativo se QUEUE_ADAPTIVE_LIMIT estiver ativo (limite inicial = QUEUE_MAX_CONCURRENT)."""
+    if os.getenv("QUEUE_ADAPTIVE_LIMIT", "false").lower() not in ("1", "true", "yes"):
         return None
+    return AdaptiveConcurrencyLimiter(
+        initial_limit=int(os.getenv("QUEUE_MAX_CONCURRENT", "2")),
+        min_limit=int(os.getenv("QUEUE_ADAPTIVE_MIN", "1")),
+        max_limit=int(os.getenv("QUEUE_ADAPTIVE_MAX", "8")),
+        window_seconds=float(os.getenv("QUEUE_ADAPTIVE_WINDOW_SECONDS", "10"))
+    )
 
 # Instância global para uso em toda a aplicação
-queue_service = QueueService(max_concurrent=2, timeout_seconds=60)
+queue_service = QueueService(
+    max_concurrent=int(os.getenv("QUEUE_MAX_CONCURRENT", "2")),
+    timeout_seconds=int(os.getenv("QUEUE_TIMEOUT_SECONDS", "60")),
+    max_backlog=int(os.getenv("QUEUE_MAX_BACKLOG", "64")),
+    max_per_user=int(os.getenv("QUEUE_MAX_PER_USER", "8")),
+    result_ttl_seconds=float(os.getenv("QUEUE_RESULT_TTL_SECONDS", "600")),
+    max_results=int(os.getenv("QUEUE_MAX_RESULTS", "1000")),
+    limiter=_create_limiter(),
+    max_backlog_per_class={
+        priority: int(os.environ[f"QUEUE_MAX_BACKLOG_{priority.upper()}"])
+        for priority in PRIORITY_CLASSES if os.getenv(f"QUEUE_MAX_BACKLOG_{priority.upper()}")
+    }
+)
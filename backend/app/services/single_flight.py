@@ -0,0 +1,196 @@
+"""
+Coalescência de gerações idênticas em andamento (single-flight).
+
+Requisições concorrentes com a mesma chave (modelo, prompt completo e opções) compartilham
+uma única geração no Ollama: a primeira executa e as demais aguardam o mesmo resultado
+(do) ou recebem os mesmos chunks do stream (stream), inclusive os já produzidos antes de
+chegarem. Nada é guardado depois que a geração termina: uma requisição posterior gera de
+novo. Se todos os interessados desistirem (cliente desconectou), a geração é cancelada e
+libera o Ollama.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+def generation_key(*parts: Any) -> str:
+    """Chave estável (SHA-256 do JSON canônico) para modelo, prompt/mensagens e opções."""
+    canonical = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+class _Call:
+    """Geração em andamento e número de requisições aguardando por ela."""
+
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+class SharedStream:
+    """
+    Stream produzido uma única vez e repassado a vários assinantes.
+
+    Os chunks ficam em um buffer enquanto a geração está em andamento, de modo que um
+    assinante que chega depois recebe a resposta desde o início.
+    """
+
+    def __init__(self, source: AsyncIterator[str]):
+        self.chunks: List[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self.abandoned = False
+        self._changed = asyncio.Event()
+        self.task = asyncio.create_task(self._pump(source))
+
+    def _notify(self):
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    async def _pump(self, source: AsyncIterator[str]):
+        try:
+            async for chunk in source:
+                self.chunks.append(chunk)
+                self._notify()
+        except asyncio.CancelledError:
+            self.error = asyncio.CancelledError()
+            raise
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done = True
+            self._notify()
+
+    async def subscribe(self) -> AsyncIterator[str]:
+        """Itera sobre todos os chunks do stream (use com contextlib.aclosing)."""
+        self.subscribers += 1
+        index = 0
+        try:
+            while True:
+                while index < len(self.chunks):
+                    yield self.chunks[index]
+                    index += 1
+                if self.done:
+                    if self.error is not None:
+                        raise self.error
+                    return
+                await self._changed.wait()
+        finally:
+            self.subscribers -= 1
+            if self.subscribers == 0 and not self.done:
+                # Ninguém mais se junta a uma geração sendo cancelada
+                self.done = True
+                self.abandoned = True
+                self.task.cancel()
+
+class SingleFlight:
+    """
+    Registro das gerações em andamento por chave.
+
+    Características:
+    - do(): chamadas assíncronas idênticas aguardam a mesma execução
+    - stream(): streams idênticos são produzidos uma vez e repassados a todos (fan-out)
+    - Cancelamento só quando não resta nenhum interessado
+    - Contadores de gerações executadas e economizadas
+    """
+
+    def __init__(self, enabled: bool = True):
+        """
+        Inicializa o registro.
+
+        Args:
+            enabled: Se False, cada chamada executa sua própria geração
+        """
+        self.enabled = enabled
+        self._calls: Dict[str, _Call] = {}
+        self._streams: Dict[str, SharedStream] = {}
+        self.stats_counters = {"requests": 0, "executions": 0, "generations_saved": 0, "abandoned": 0}
+
+    def _forget(self, registry: Dict[str, Any], key: str, entry: Any):
+        if registry.get(key) is entry:
+            del registry[key]
+
+    async def do(self, key: str, factory: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Executa factory() ou, se houver uma execução com a mesma chave em andamento,
+        aguarda o resultado dela (exceções também são compartilhadas).
+
+        Args:
+            key: Chave da geração (generation_key)
+            factory: Função que inicia a geração
+
+        Returns:
+            Resultado da geração
+        """
+        self.stats_counters["requests"] += 1
+        if not self.enabled:
+            self.stats_counters["executions"] += 1
+            return await factory()
+
+        call = self._calls.get(key)
+        if call is None:
+            call = _Call(asyncio.create_task(factory()))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda _, call=call: self._forget(self._calls, key, call))
+            self.stats_counters["executions"] += 1
+        else:
+            self.stats_counters["generations_saved"] += 1
+            logger.info("Requisição idêntica em andamento: aguardando a mesma geração")
+
+        call.waiters += 1
+        try:
+            # shield: o cancelamento de um interessado não cancela a geração dos demais
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                call.task.cancel()
+                self._forget(self._calls, key, call)
+                self.stats_counters["abandoned"] += 1
+
+    async def stream(self, key: str, factory: Callable[[], AsyncIterator[str]]) -> AsyncIterator[str]:
+        """
+        Itera sobre o stream factory() ou se junta a um stream idêntico em andamento.
+        Use com contextlib.aclosing para liberar a assinatura assim que o cliente sair.
+
+        Args:
+            key: Chave da geração (generation_key)
+            factory: Função que cria o iterador assíncrono da geração
+        """
+        self.stats_counters["requests"] += 1
+        if not self.enabled:
+            self.stats_counters["executions"] += 1
+            async for chunk in factory():
+                yield chunk
+            return
+
+        shared = self._streams.get(key)
+        if shared is None or shared.done:
+            shared = SharedStream(factory())
+            self._streams[key] = shared
+            shared.task.add_done_callback(lambda _, shared=shared: self._forget(self._streams, key, shared))
+            self.stats_counters["executions"] += 1
+        else:
+            self.stats_counters["generations_saved"] += 1
+            logger.info(f"Stream idêntico em andamento: repassando a geração ({shared.subscribers + 1} assinantes)")
+
+        subscription = shared.subscribe()
+        try:
+            async for chunk in subscription:
+                yield chunk
+        finally:
+            await subscription.aclose()
+            if shared.abandoned and shared.subscribers == 0:
+                self.stats_counters["abandoned"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Contadores, gerações em andamento e fração de requisições atendidas sem gerar."""
+        stats = dict(self.stats_counters)
+        stats["enabled"] = self.enabled
+        stats["in_flight"] = len(self._calls) + len(self._streams)
+        stats["saved_rate"] = round(stats["generations_saved"] / stats["requests"], 3) if stats["requests"] else 0.0
+        return stats
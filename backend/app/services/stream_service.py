@@ -10,9 +10,14 @@ from typing import Dict, AsyncIterator, Any, List, Tuple, Optional
 from fastapi import HTTPException, status
 import os
 import time
+from contextlib import aclosing
 
 from app.services.intent_recognizer import intent_recognizer
 from app.services.vector_store_service import vector_store_service
+from app.services.embedding_worker import embedding_worker
+from app.services.queue_service import queue_service
+from app.services.concurrency_limiter import ollama_generation_metrics
+from app.services.single_flight import SingleFlight, generation_key
 
 logger = logging.getLogger(__name__)
 
@@ -85,6 +90,90 @@ class StreamService:
         self.max_retries = 3
         self.base_timeout = 60.0
         self.backoff_factor = 1.5
+        # Espera máxima pela atualização do vectorstore antes do primeiro token, em segundos
+        self.rag_refresh_timeout = float(os.getenv("STREAM_RAG_REFRESH_TIMEOUT", "0.5"))
+
+        # Sessão HTTP compartilhada (duração da aplicação): criada no startup do FastAPI e
+        # fechada no shutdown; os streams reutilizam conexões keep-alive do pool
+        self.session: Optional[aiohttp.ClientSession] = None
+        self.connection_limit = int(os.getenv("OLLAMA_STREAM_MAX_CONNECTIONS", "32"))
+        self.keepalive_timeout = float(os.getenv("OLLAMA_STREAM_KEEPALIVE_SECONDS", "60"))
+        self.dns_cache_ttl = int(os.getenv("OLLAMA_STREAM_DNS_TTL", "300"))
+        self.stats_counters = {
+            "streams": 0,
+            "active_streams": 0,
+            "peak_active_streams": 0,
+            "connections_created": 0,
+            "connections_reused": 0,
+            "queued_for_connection": 0
+        }
+        # Fan-out de streams idênticos em andamento para vários clientes
+        self.single_flight = SingleFlight(enabled=os.getenv("LLM_SINGLE_FLIGHT", "true").lower() == "true")
+
+    async def start(self):
+        """Cria a sessão compartilhada e o pool de conexões (startup da aplicação)."""
+        if self.session is not None and not self.session.closed:
+            return
+        connector = aiohttp.TCPConnector(
+            limit=self.connection_limit,
+            limit_per_host=self.connection_limit,  # Um único host: o Ollama
+            keepalive_timeout=self.keepalive_timeout,
+            use_dns_cache=True,
+            ttl_dns_cache=self.dns_cache_ttl
+        )
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_connection_create_end.append(self._on_connection_created)
+        trace_config.on_connection_reuseconn.append(self._on_connection_reused)
+        trace_config.on_connection_queued_start.append(self._on_connection_queued)
+        self.session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=self.base_timeout),
+            trace_configs=[trace_config]
+        )
+        logger.info(f"Pool de conexões do stream criado (limite {self.connection_limit}, "
+                    f"keep-alive {self.keepalive_timeout:.0f}s)")
+
+    async def close(self):
+        """Fecha a sessão compartilhada e suas conexões (shutdown da aplicação)."""
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def _get_session(self) -> aiohttp.ClientSession:
+        """Sessão compartilhada; criada sob demanda se o startup não a criou (ex.: scripts)."""
+        if self.session is None or self.session.closed:
+            await self.start()
+        return self.session
+
+    async def _on_connection_created(self, session, context, params):
+        self.stats_counters["connections_created"] += 1
+
+    async def _on_connection_reused(self, session, context, params):
+        self.stats_counters["connections_reused"] += 1
+
+    async def _on_connection_queued(self, session, context, params):
+        self.stats_counters["queued_for_connection"] += 1
+
+    def pool_stats(self) -> Dict[str, Any]:
+        """Utilização do pool de conexões com o Ollama e contadores de streams."""
+        stats = dict(self.stats_counters)
+        stats["limit"] = self.connection_limit
+        reused = stats["connections_reused"]
+        stats["reuse_rate"] = round(reused / (stats["connections_created"] + reused), 3) if reused else 0.0
+        connector = self.session.connector if self.session is not None and not self.session.closed else None
+        if connector is None:
+            stats.update({"open": False, "in_use": 0, "idle": 0, "utilization": 0.0})
+            return stats
+        # _acquired e _conns são internos do TCPConnector (conexões em uso e ociosas)
+        in_use = len(getattr(connector, "_acquired", ()))
+        idle = sum(len(conns) for conns in getattr(connector, "_conns", {}).values())
+        stats.update({
+            "open": True,
+            "in_use": in_use,
+            "idle": idle,
+            "utilization": round(in_use / self.connection_limit, 3) if self.connection_limit else 0.0
+        })
+        return stats
 
     def process_intent(self, message: str) -> Tuple[bool, Optional[Dict[str, Any]], Optional[str]]:
         """
@@ -132,22 +221,22 @@ class StreamService:
         Returns:
             Lista de mensagens melhorada
         """
-        if not user_id or not user_message or not hasattr(vector_store_service, 'get_formatted_context'):
+        if not user_id or not user_message or not hasattr(vector_store_service, 'get_context_prefix'):
             return original_messages
         
         try:
-            # Obter contexto relevante com base na consulta
-            rag_context = vector_store_service.get_formatted_context(user_id, user_message)
+            # Prefixo (contexto relevante + "Pergunta: ") em cache por versão do índice do usuário
+            rag_prefix = vector_store_service.get_context_prefix(user_id, user_message)
             
-            if not rag_context:
+            if not rag_prefix:
                 return original_messages
                 
             # Encontrar a última mensagem do usuário
             enhanced_messages = list(original_messages)
             for i in range(len(enhanced_messages) - 1, -1, -1):
                 if enhanced_messages[i].get("role") == "user":
-                    # Modificar a última mensagem do usuário para incluir o contexto RAG
-                    enhanced_messages[i]["content"] = f"{rag_context}\n\nPergunta: {enhanced_messages[i]['content']}"
+                    # Nova mensagem com o contexto RAG (sem alterar a mensagem original)
+                    enhanced_messages[i] = {**enhanced_messages[i], "content": rag_prefix + enhanced_messages[i]["content"]}
                     break
                     
             return enhanced_messages
@@ -155,6 +244,104 @@ class StreamService:
             logger.error(f"Erro ao melhorar mensagens com RAG: {str(e)}")
             return original_messages
         
+    async def _ollama_stream(self, data: Dict[str, Any]) -> AsyncIterator[str]:
+        """
+        Faz a chamada de streaming ao Ollama e produz o conteúdo limpo de cada chunk.
+        
+        Args:
+            data: Payload para /api/chat
+            
+        Returns:
+            Um iterador assíncrono que produz partes da resposta
+        """
+        session = await self._get_session()
+        self.stats_counters["streams"] += 1
+        self.stats_counters["active_streams"] += 1
+        self.stats_counters["peak_active_streams"] = max(
+            self.stats_counters["peak_active_streams"], self.stats_counters["active_streams"]
+        )
+        try:
+            endpoint = "/api/chat"
+            full_url = f"{self.ollama_api_url}{endpoint}"
+            logger.info(f"Making request to: {full_url}")
+            
+            empty_responses = 0
+            request_start = time.monotonic()
+            first_token_time = None
+            async with session.post(full_url, json=data) as response:
+                if response.status != 200:
+                    error_text = await response.text()
+                    if response.status == 503:
+                        raise HTTPException(
+                            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                            detail="Serviço de IA temporariamente indisponível"
+                        )
+                    elif response.status == 429:
+                        raise HTTPException(
+                            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                            detail="Muitas requisições. Tente novamente em alguns instantes"
+                        )
+                    else:
+                        raise HTTPException(
+                            status_code=response.status,
+                            detail=f"Erro do serviço de IA: {error_text}"
+                        )
+                
+                # Process streaming response
+                try:
+                    async for line in response.content:
+                        if not line:
+                            empty_responses += 1
+                            if empty_responses > 5:
+                                raise HTTPException(
+                                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                                    detail="Muitas respostas vazias do serviço"
+                                )
+                            continue
+                        
+                        try:
+                            json_line = json.loads(line)
+                            if 'error' in json_line:
+                                raise HTTPException(
+                                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                                    detail=f"Erro do serviço de IA: {json_line['error']}"
+                                )
+                                
+                            if 'message' in json_line and 'content' in json_line['message']:
+                                content = json_line['message']['content']
+                                if content:
+                                    # Clean up content - remove repeated asterisks and formatting issues
+                                    clean_content = self._clean_stream_content(content)
+                                    empty_responses = 0
+                                    if first_token_time is None:
+                                        first_token_time = time.monotonic() - request_start
+                                    yield clean_content
+                            if json_line.get('done'):
+                                # O último chunk traz as métricas da geração (limite adaptativo da fila)
+                                metrics = ollama_generation_metrics(
+                                    json_line, time.monotonic() - request_start, first_token_time
+                                )
+                                if metrics is not None:
+                                    queue_service.observe_generation(*metrics)
+                                return
+                        except json.JSONDecodeError:
+                            logger.warning(f"Linha inválida no stream: {line}")
+                            continue
+                        except Exception as e:
+                            logger.error(f"Erro processando linha do stream: {str(e)}")
+                            raise HTTPException(
+                                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                                detail=f"Erro processando resposta: {str(e)}"
+                            )
+                except Exception as e:
+                    logger.error(f"Error processing stream: {str(e)}")
+                    raise HTTPException(
+                        status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                        detail=f"Error processing response stream: {str(e)}"
+                    )
+        finally:
+            self.stats_counters["active_streams"] -= 1
+
     async def generate_stream(self, 
                               messages: List[Dict[str, str]], 
                               user_id: Optional[str] = None) -> AsyncIterator[str]:
@@ -202,7 +389,16 @@ class StreamService:
             # Melhorar as mensagens com contexto RAG se possível
             enhanced_messages = messages
             if user_id:
-                enhanced_messages = self.get_enhanced_messages(messages, user_id, user_message)
+                # Atualizar os vetores (respeita o TTL) sem segurar o primeiro token: após o
+                # prazo, o stream usa o índice atual e a atualização segue no worker
+                try:
+                    if not await embedding_worker.refresh_within(user_id, self.rag_refresh_timeout):
+                        logger.info("Atualização do vectorstore em andamento; usando o índice atual")
+                except Exception as e:
+                    logger.warning(f"Erro ao atualizar vectorstore: {str(e)}")
+                enhanced_messages = await asyncio.to_thread(
+                    self.get_enhanced_messages, messages, user_id, user_message
+                )
                 if len(enhanced_messages) != len(messages):
                     logger.info("Mensagens melhoradas com contexto RAG")
         
@@ -235,82 +431,12 @@ class StreamService:
                 }
             }
         
-            async with aiohttp.ClientSession(
-                timeout=aiohttp.ClientTimeout(total=self.base_timeout),
-                headers={"Connection": "close"}
-            ) as session:
-                endpoint = "/api/chat"
-                full_url = f"{self.ollama_api_url}{endpoint}"
-                logger.info(f"Making request to: {full_url}")
-                
-                empty_responses = 0
-                async with session.post(
-                    full_url,
-                    json=data,
-                    headers={"Connection": "close"}
-                ) as response:
-                    if response.status != 200:
-                        error_text = await response.text()
-                        if response.status == 503:
-                            raise HTTPException(
-                                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-                                detail="Serviço de IA temporariamente indisponível"
-                            )
-                        elif response.status == 429:
-                            raise HTTPException(
-                                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
-                                detail="Muitas requisições. Tente novamente em alguns instantes"
-                            )
-                        else:
-                            raise HTTPException(
-                                status_code=response.status,
-                                detail=f"Erro do serviço de IA: {error_text}"
-                            )
-                    
-                    # Process streaming response
-                    try:
-                        async for line in response.content:
-                            if not line:
-                                empty_responses += 1
-                                if empty_responses > 5:
-                                    raise HTTPException(
-                                        status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                                        detail="Muitas respostas vazias do serviço"
-                                    )
-                                continue
-                            
-                            try:
-                                json_line = json.loads(line)
-                                if 'error' in json_line:
-                                    raise HTTPException(
-                                        status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                                        detail=f"Erro do serviço de IA: {json_line['error']}"
-                                    )
-                                    
-                                if 'message' in json_line and 'content' in json_line['message']:
-                                    content = json_line['message']['content']
-                                    if content:
-                                        # Clean up content - remove repeated asterisks and formatting issues
-                                        clean_content = self._clean_stream_content(content)
-                                        empty_responses = 0
-                                        yield clean_content
-                                elif 'done' in json_line and json_line['done']:
-                                    return
-                            except json.JSONDecodeError:
-                                logger.warning(f"Linha inválida no stream: {line}")
-                                continue
-                            except Exception as e:
-                                logger.error(f"Erro processando linha do stream: {str(e)}")
-                                raise HTTPException(
-                                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                                    detail=f"Erro processando resposta: {str(e)}"
-                                )
-                    except Exception as e:
-                        logger.error(f"Error processing stream: {str(e)}")
-                        raise HTTPException(
-                            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                            detail=f"Error processing response stream: {str(e)}"
-                        )
+            # Streams idênticos em andamento (mesmo modelo, mensagens e opções) compartilham
+            # uma única geração no Ollama, repassada a cada cliente
+            key = generation_key(data)
+            async with aclosing(self.single_flight.stream(key, lambda: self._ollama_stream(data))) as chunks:
+                async for chunk in chunks:
+                    yield chunk
                     
         except HTTPException:
             raise  # Re-raise HTTP exceptions
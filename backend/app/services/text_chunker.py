@@ -0,0 +1,85 @@
+"""
+Divisão de textos longos em janelas sobrepostas para indexação vetorial.
+O all-MiniLM-L6-v2 trunca a entrada em 256 tokens: descrições longas e respostas
+extensas da IA são divididas em trechos que cabem no modelo, cada um embedado
+separadamente e ligado de volta à linha de origem.
+"""
+import logging
+from typing import List
+
+logger = logging.getLogger(__name__)
+
+def estimate_tokens(word: str) -> int:
+    """Estimativa barata de tokens de uma palavra (~4 caracteres por token), sem tokenizador."""
+    return max(1, (len(word) + 3) // 4)
+
+class TextChunker:
+    """
+    Divide textos em janelas de palavras limitadas por tokens (estimados), com sobreposição.
+
+    Características:
+    - Textos que cabem em uma janela são mantidos inteiros (um único trecho)
+    - Janelas consecutivas compartilham ~overlap_tokens tokens, preservando o contexto nas bordas
+    - No máximo max_chunks trechos por texto: o custo de embedding e o tamanho do índice
+      ficam limitados por documento, independentemente do tamanho do texto
+    """
+
+    def __init__(self, max_tokens: int = 200, overlap_tokens: int = 40, max_chunks: int = 8):
+        """
+        Inicializa o divisor.
+
+        Args:
+            max_tokens: Tokens (estimados) por janela; abaixo do limite de 256 do modelo,
+                        pois a estimativa subestima o WordPiece em português
+            overlap_tokens: Tokens (estimados) repetidos entre janelas consecutivas
+            max_chunks: Número máximo de trechos por texto (o restante é descartado)
+        """
+        if overlap_tokens >= max_tokens:
+            raise ValueError("overlap_tokens deve ser menor que max_tokens")
+        self.max_tokens = max_tokens
+        self.overlap_tokens = overlap_tokens
+        self.max_chunks = max_chunks
+
+    @property
+    def config(self) -> List[int]:
+        """Parâmetros que definem a divisão (vetores gerados com outra configuração são inválidos)."""
+        return [self.max_tokens, self.overlap_tokens, self.max_chunks]
+
+    def split(self, text: str) -> List[str]:
+        """
+        Divide um texto em trechos sobrepostos.
+
+        Args:
+            text: Texto a dividir
+
+        Returns:
+            Lista com pelo menos um trecho (o próprio texto, se for curto)
+        """
+        words = text.split()
+        costs = [estimate_tokens(word) for word in words]
+        if sum(costs) <= self.max_tokens:
+            return [text]
+
+        chunks = []
+        start = 0
+        while start < len(words) and len(chunks) < self.max_chunks:
+            end = start
+            total = 0
+            while end < len(words) and (total + costs[end] <= self.max_tokens or end == start):
+                total += costs[end]
+                end += 1
+            chunks.append(" ".join(words[start:end]))
+            if end >= len(words):
+                break
+
+            # Recuar a partir do fim da janela até acumular overlap_tokens (sempre avançando)
+            next_start = end
+            overlap = 0
+            while next_start - 1 > start and overlap + costs[next_start - 1] <= self.overlap_tokens:
+                next_start -= 1
+                overlap += costs[next_start]
+            start = next_start
+
+        if start < len(words) and len(chunks) == self.max_chunks:
+            logger.debug(f"Texto com {len(words)} palavras truncado em {self.max_chunks} trechos")
+        return chunks
@@ -0,0 +1,377 @@
+"""
+Índices vetoriais usados pelo VectorStoreService para busca por similaridade.
+Define uma interface comum e duas implementações em NumPy puro:
+- FlatIndex: busca exata (força bruta) sobre todos os vetores
+- IVFIndex: busca aproximada com listas invertidas (IVF) particionadas por k-means
+Os dois podem armazenar os vetores em float32 ou int8 (quantização escalar com escala
+por vetor), opcionalmente reordenando os melhores candidatos em float32.
+"""
+import logging
+import numpy as np
+from typing import Callable, Dict, List, Iterable, Tuple, Optional
+
+logger = logging.getLogger(__name__)
+
+# Tipos de armazenamento suportados pelos índices. float16 foi removido: o matmul do
+# NumPy converte half para float32 a cada consulta (~13x mais lento que float32 em 10k vetores)
+STORAGE_DTYPES = {"float32": np.float32, "int8": np.int8}
+# Linhas convertidas para float32 por vez ao pontuar armazenamentos quantizados
+SCAN_BLOCK_ROWS = 8192
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    """Normaliza (L2) cada linha para float32; linhas nulas permanecem nulas."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+def top_k(scores: np.ndarray, k: int, min_score: Optional[float] = None) -> np.ndarray:
+    """
+    Seleciona os índices dos k maiores scores em ordem decrescente.
+    Usa np.argpartition (O(n)) e só ordena os k selecionados; o threshold é aplicado
+    antes da ordenação.
+
+    Args:
+        scores: Vetor de scores
+        k: Número máximo de posições
+        min_score: Score mínimo (exclusivo) para manter uma posição
+
+    Returns:
+        Posições selecionadas, do maior para o menor score
+    """
+    if k < len(scores):
+        selected = np.argpartition(-scores, k - 1)[:k]
+    else:
+        selected = np.arange(len(scores))
+    if min_score is not None:
+        selected = selected[scores[selected] > min_score]
+    return selected[np.argsort(-scores[selected])]
+
+class VectorIndex:
+    """
+    Interface dos índices vetoriais.
+    Cada vetor é identificado por uma chave textual (ex.: "task:<id>").
+    Os índices são construídos incrementalmente com add/remove e armazenam os vetores
+    já normalizados (L2), de modo que o cosseno é um único produto matriz-vetor.
+
+    Armazenamento compacto (opção de memória, não de velocidade):
+    - int8: um quarto da memória; cada vetor é guardado como round(v / escala) com
+      escala = max|v| / 127 (um float32 por vetor), e o score é (códigos · q) * escala.
+      A varredura converte os códigos para float32 em blocos e fica ~3x mais lenta que
+      float32 (benchmarks/bench_quantization.py)
+    - Com uma função de rescoring, os `k * rescore_factor` melhores candidatos
+      aproximados são pontuados novamente com os vetores float32 originais
+    """
+
+    def __init__(self, dim: int, storage: str = "float32", rescore_factor: int = 4):
+        """
+        Inicializa a matriz de armazenamento do índice.
+
+        Args:
+            dim: Dimensão dos vetores
+            storage: Tipo de armazenamento ("float32" ou "int8")
+            rescore_factor: Multiplicador de k para os candidatos reordenados em float32
+        """
+        if storage not in STORAGE_DTYPES:
+            raise ValueError(f"Tipo de armazenamento desconhecido: {storage}")
+        self.dim = dim
+        self.storage = storage
+        self.rescore_factor = rescore_factor
+        self._matrix = np.zeros((16, dim), dtype=STORAGE_DTYPES[storage])
+        self._scales = np.ones(16, dtype=np.float32) if storage == "int8" else None  # linha -> escala
+        self._keys: List[str] = []
+        self._rows: Dict[str, int] = {}  # chave -> linha na matriz
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._rows
+
+    @property
+    def quantized(self) -> bool:
+        """Indica se os vetores são armazenados em precisão reduzida."""
+        return self.storage != "float32"
+
+    @property
+    def nbytes(self) -> int:
+        """Memória ocupada pela matriz do índice e pelas escalas (capacidade alocada)."""
+        return self._matrix.nbytes + (self._scales.nbytes if self._scales is not None else 0)
+
+    @property
+    def vectors(self) -> np.ndarray:
+        """Vetores ativos do índice em float32 (visão sem cópia no armazenamento float32)."""
+        return self._dequantize(slice(0, len(self._keys)))
+
+    def _quantize(self, vectors: np.ndarray) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        """Converte vetores float32 normalizados para o tipo de armazenamento (códigos, escalas)."""
+        if self.storage == "int8":
+            scales = np.maximum(np.abs(vectors).max(axis=1), 1e-12) / 127.0
+            codes = np.rint(vectors / scales[:, None]).astype(np.int8)
+            return codes, scales.astype(np.float32)
+        return vectors.astype(STORAGE_DTYPES[self.storage]), None
+
+    def _dequantize(self, rows) -> np.ndarray:
+        """Reconstrói em float32 as linhas selecionadas (slice ou array de linhas)."""
+        vectors = self._matrix[rows]
+        if not self.quantized:
+            return vectors
+        vectors = vectors.astype(np.float32)
+        if self._scales is not None:
+            vectors *= self._scales[rows][:, None]
+        return vectors
+
+    def _score(self, query: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Pontua a consulta contra as linhas informadas (None = todas as linhas ativas).
+        Armazenamentos quantizados são convertidos para float32 em blocos de
+        SCAN_BLOCK_ROWS linhas, limitando a memória temporária da varredura.
+        """
+        if rows is None:
+            if not self.quantized:
+                return self._matrix[:len(self._keys)] @ query
+            count = len(self._keys)
+            scores = np.empty(count, dtype=np.float32)
+            for start in range(0, count, SCAN_BLOCK_ROWS):
+                block = slice(start, min(start + SCAN_BLOCK_ROWS, count))
+                scores[block] = self._matrix[block].astype(np.float32) @ query
+            if self._scales is not None:
+                scores *= self._scales[:count]
+            return scores
+
+        scores = self._matrix[rows].astype(np.float32, copy=False) @ query
+        if self._scales is not None:
+            scores *= self._scales[rows]
+        return scores
+
+    def _grow(self, needed: int):
+        """Dobra a capacidade da matriz até caber `needed` linhas (custo amortizado O(1))."""
+        capacity = self._matrix.shape[0]
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        matrix = np.zeros((capacity, self.dim), dtype=self._matrix.dtype)
+        matrix[:len(self._keys)] = self._matrix[:len(self._keys)]
+        self._matrix = matrix
+        if self._scales is not None:
+            scales = np.ones(capacity, dtype=np.float32)
+            scales[:len(self._keys)] = self._scales[:len(self._keys)]
+            self._scales = scales
+
+    def add(self, keys: List[str], vectors: np.ndarray):
+        """
+        Adiciona (ou substitui) vetores no índice.
+
+        Args:
+            keys: Chaves dos vetores
+            vectors: Matriz (len(keys), dim)
+        """
+        vectors = normalize_rows(np.asarray(vectors, dtype=np.float32).reshape(len(keys), self.dim))
+        existing = [key for key in keys if key in self._rows]
+        if existing:
+            self.remove(existing)
+
+        start = len(self._keys)
+        self._grow(start + len(keys))
+        codes, scales = self._quantize(vectors)
+        self._matrix[start:start + len(keys)] = codes
+        if scales is not None:
+            self._scales[start:start + len(keys)] = scales
+        for offset, key in enumerate(keys):
+            self._rows[key] = start + offset
+            self._keys.append(key)
+        self._on_added(range(start, start + len(keys)))
+
+    def remove(self, keys: Iterable[str]):
+        """
+        Remove vetores do índice. A última linha ocupa o lugar da removida (swap-remove).
+
+        Args:
+            keys: Chaves a remover (chaves inexistentes são ignoradas)
+        """
+        for key in keys:
+            row = self._rows.pop(key, None)
+            if row is None:
+                continue
+            last = len(self._keys) - 1
+            self._on_removed(row)
+            if row != last:
+                moved_key = self._keys[last]
+                self._matrix[row] = self._matrix[last]
+                if self._scales is not None:
+                    self._scales[row] = self._scales[last]
+                self._keys[row] = moved_key
+                self._rows[moved_key] = row
+                self._on_moved(last, row)
+            self._keys.pop()
+
+    def search(self, query: np.ndarray, k: int, min_score: Optional[float] = None,
+               rescore: Optional[Callable[[List[str]], np.ndarray]] = None) -> List[Tuple[str, float]]:
+        """
+        Busca os k vetores mais similares (similaridade de cosseno) à consulta.
+
+        Args:
+            query: Vetor de consulta
+            k: Número máximo de resultados
+            min_score: Score mínimo (exclusivo); resultados abaixo são descartados
+            rescore: Função que retorna os vetores float32 originais de uma lista de chaves;
+                     usada apenas em armazenamentos quantizados
+
+        Returns:
+            Lista de (chave, score) em ordem decrescente de similaridade
+        """
+        if not self._keys or k <= 0:
+            return []
+        query = normalize_rows(np.asarray(query, dtype=np.float32).reshape(self.dim))
+        candidates = self._candidate_rows(query)
+        if candidates is not None and len(candidates) < k:
+            candidates = None
+        scores = self._score(query, candidates)
+
+        rescoring = rescore is not None and self.quantized
+        if rescoring:
+            # Sem threshold aqui: os scores aproximados só escolhem quem será reordenado
+            selected = top_k(scores, k * self.rescore_factor)
+        else:
+            selected = top_k(scores, k, min_score)
+        rows = selected if candidates is None else candidates[selected]
+        if not rescoring:
+            return [(self._keys[row], float(scores[i])) for row, i in zip(rows, selected)]
+
+        keys = [self._keys[row] for row in rows]
+        exact_scores = normalize_rows(rescore(keys)) @ query
+        return [(keys[i], float(exact_scores[i])) for i in top_k(exact_scores, k, min_score)]
+
+    # Ganchos para índices com estruturas auxiliares
+    def _candidate_rows(self, query: np.ndarray) -> Optional[np.ndarray]:
+        """Linhas a pontuar para a consulta; None significa todas (busca exata)."""
+        return None
+
+    def _on_added(self, rows: Iterable[int]):
+        pass
+
+    def _on_removed(self, row: int):
+        pass
+
+    def _on_moved(self, old_row: int, new_row: int):
+        pass
+
+class FlatIndex(VectorIndex):
+    """Índice exato: pontua todos os vetores em cada consulta."""
+
+class IVFIndex(VectorIndex):
+    """
+    Índice aproximado com listas invertidas (IVF).
+
+    Os vetores são particionados em `nlist` células por k-means esférico e cada consulta
+    pontua apenas as `nprobe` células mais próximas. Abaixo de `min_train_size` vetores
+    o índice faz busca exata. As células são retreinadas quando o índice dobra de tamanho
+    desde o último treino; entre treinos, novos vetores são atribuídos à célula mais próxima.
+    """
+
+    def __init__(self, dim: int, nprobe: int = 4, min_train_size: int = 1024, kmeans_iterations: int = 8,
+                 storage: str = "float32", rescore_factor: int = 4):
+        """
+        Args:
+            dim: Dimensão dos vetores
+            nprobe: Número de células visitadas por consulta
+            min_train_size: Número mínimo de vetores para treinar as células
+            kmeans_iterations: Iterações do k-means em cada treino
+            storage: Tipo de armazenamento ("float32" ou "int8")
+            rescore_factor: Multiplicador de k para os candidatos reordenados em float32
+        """
+        super().__init__(dim, storage=storage, rescore_factor=rescore_factor)
+        self.nprobe = nprobe
+        self.min_train_size = min_train_size
+        self.kmeans_iterations = kmeans_iterations
+        self.centroids: Optional[np.ndarray] = None
+        self._trained_size = 0
+        self._assignments = np.zeros(16, dtype=np.int32)  # linha -> célula
+        self._lists: List[set] = []                       # célula -> linhas
+
+    def _assign(self, vectors: np.ndarray) -> np.ndarray:
+        """Atribui cada vetor (normalizado) à célula de centróide mais similar."""
+        return np.argmax(vectors @ self.centroids.T, axis=1).astype(np.int32)
+
+    def train(self):
+        """Treina os centróides com k-means esférico sobre os vetores atuais."""
+        count = len(self._keys)
+        nlist = max(1, int(np.sqrt(count)))
+        data = self.vectors
+        rng = np.random.default_rng(42)
+        centroids = data[rng.choice(count, size=nlist, replace=False)].copy()
+
+        for _ in range(self.kmeans_iterations):
+            assignments = np.argmax(data @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignments, data)
+            empty = ~sums.any(axis=1)
+            sums[empty] = centroids[empty]  # Células vazias mantêm o centróide anterior
+            centroids = normalize_rows(sums)
+
+        self.centroids = centroids.astype(np.float32)
+        self._trained_size = count
+        self._assignments = np.zeros(max(count, 16), dtype=np.int32)
+        self._assignments[:count] = self._assign(data)
+        self._lists = [set() for _ in range(nlist)]
+        for row, cell in enumerate(self._assignments[:count]):
+            self._lists[cell].add(row)
+        logger.info(f"Índice IVF treinado: {count} vetores em {nlist} células")
+
+    def _on_added(self, rows: Iterable[int]):
+        rows = list(rows)
+        count = len(self._keys)
+        if self.centroids is None or count >= 2 * self._trained_size:
+            if count >= self.min_train_size:
+                self.train()
+            return
+
+        if self._assignments.shape[0] < count:
+            assignments = np.zeros(self._matrix.shape[0], dtype=np.int32)
+            assignments[:self._assignments.shape[0]] = self._assignments
+            self._assignments = assignments
+        cells = self._assign(self._dequantize(rows))
+        for row, cell in zip(rows, cells):
+            self._assignments[row] = cell
+            self._lists[cell].add(row)
+
+    def _on_removed(self, row: int):
+        if self.centroids is not None:
+            self._lists[self._assignments[row]].discard(row)
+
+    def _on_moved(self, old_row: int, new_row: int):
+        if self.centroids is not None:
+            cell = self._assignments[old_row]
+            self._lists[cell].discard(old_row)
+            self._lists[cell].add(new_row)
+            self._assignments[new_row] = cell
+
+    def _candidate_rows(self, query: np.ndarray) -> Optional[np.ndarray]:
+        if self.centroids is None:
+            return None
+
+        centroid_scores = self.centroids @ query
+        cells = top_k(centroid_scores, self.nprobe)
+        rows = [row for cell in cells for row in self._lists[cell]]
+        return np.fromiter(rows, dtype=np.int64, count=len(rows))
+
+def create_vector_index(backend: str, dim: int, storage: str = "float32") -> VectorIndex:
+    """
+    Cria um índice vetorial pelo nome do backend.
+
+    Args:
+        backend: "flat" (exato) ou "ivf" (aproximado)
+        dim: Dimensão dos vetores
+        storage: Tipo de armazenamento ("float32" ou "int8")
+
+    Returns:
+        Instância do índice
+    """
+    if storage not in STORAGE_DTYPES:
+        logger.warning(f"Tipo de armazenamento vetorial desconhecido '{storage}', usando 'float32'")
+        storage = "float32"
+    if backend == "ivf":
+        return IVFIndex(dim, storage=storage)
+    if backend != "flat":
+        logger.warning(f"Backend de índice vetorial desconhecido '{backend}', usando 'flat'")
+    return FlatIndex(dim, storage=storage)
@@ -0,0 +1,213 @@
+"""
+Cliente do servidor de vectorstore (app.vector_store_server).
+
+Com VECTOR_STORE_URL definido, os workers da API não carregam o modelo nem os vetores:
+usam este cliente, que encaminha cada usuário ao shard responsável (hash do user_id)
+por HTTP em localhost ou por Unix socket, agrupando consultas concorrentes em lotes.
+"""
+import hashlib
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+class VectorStoreShardClient:
+    """
+    Conexão com um shard do servidor de vectorstore.
+
+    As consultas enviadas por threads diferentes são acumuladas por até `batch_window`
+    segundos (ou `max_batch` itens) e enviadas em uma única requisição POST /query.
+    """
+
+    def __init__(self, url: str, timeout: float = 30.0, batch_window: float = 0.002, max_batch: int = 64):
+        """
+        Inicializa a conexão.
+
+        Args:
+            url: "unix:///caminho/shard.sock" ou "http://127.0.0.1:8601"
+            timeout: Timeout das requisições, em segundos
+            batch_window: Tempo máximo de espera para completar um lote, em segundos
+            max_batch: Número máximo de consultas por lote
+        """
+        self.url = url
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        if url.startswith("unix://"):
+            transport = httpx.HTTPTransport(uds=url[len("unix://"):])
+            self.client = httpx.Client(transport=transport, base_url="http://vector-store", timeout=timeout)
+        else:
+            self.client = httpx.Client(base_url=url, timeout=timeout)
+        self._queue: "queue.Queue[Tuple[Dict[str, Any], Future]]" = queue.Queue()
+        self.stats_counters = {"queries": 0, "batches": 0, "refreshes": 0, "errors": 0}
+        threading.Thread(target=self._batch_loop, name="vector-store-client", daemon=True).start()
+
+    def query(self, payload: Dict[str, Any]) -> Any:
+        """Enfileira uma consulta para o próximo lote e aguarda o resultado."""
+        future: Future = Future()
+        self._queue.put((payload, future))
+        return future.result()
+
+    def _batch_loop(self):
+        """Acumula consultas concorrentes e envia cada lote em uma única requisição."""
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.batch_window
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            try:
+                response = self.client.post("/query", json={"queries": [payload for payload, _ in batch]})
+                response.raise_for_status()
+                results = response.json()["results"]
+                self.stats_counters["batches"] += 1
+                self.stats_counters["queries"] += len(batch)
+                for (_, future), result in zip(batch, results):
+                    future.set_result(result)
+            except Exception as e:
+                self.stats_counters["errors"] += 1
+                for _, future in batch:
+                    future.set_exception(e)
+
+    def refresh(self, requests: List[Tuple[str, bool]]) -> Dict[str, Optional[str]]:
+        """Solicita a atualização de vários usuários; retorna o erro de cada um (None = sucesso)."""
+        response = self.client.post("/refresh", json={"users": [[user_id, force] for user_id, force in requests]})
+        response.raise_for_status()
+        self.stats_counters["refreshes"] += 1
+        return response.json()["errors"]
+
+    def get(self, path: str, timeout: Optional[float] = None) -> Dict[str, Any]:
+        """GET simples (estatísticas e prontidão); timeout None usa o timeout do cliente."""
+        response = self.client.get(path, timeout=timeout if timeout is not None else httpx.USE_CLIENT_DEFAULT)
+        if response.status_code not in (200, 503):
+            response.raise_for_status()
+        return response.json()
+
+class RemoteVectorStore:
+    """
+    Substituto do VectorStoreService nos workers da API quando o vectorstore roda em
+    processos próprios. Expõe a mesma interface usada pela aplicação (consultas,
+    atualizações via EmbeddingWorker, estatísticas e prontidão), de modo que a memória
+    dos vetores e do modelo não depende do número de workers do uvicorn.
+
+    Todos os métodos fazem chamadas HTTP bloqueantes: em rotas async, use
+    asyncio.to_thread (ou rode-os no threadpool, como as rotas síncronas).
+    """
+
+    def __init__(self, urls: str):
+        """
+        Inicializa o cliente.
+
+        Args:
+            urls: URLs dos shards separadas por vírgula, na ordem dos shards
+        """
+        self.shards = [VectorStoreShardClient(url.strip()) for url in urls.split(",") if url.strip()]
+        if not self.shards:
+            raise ValueError("VECTOR_STORE_URL não contém nenhum shard")
+        self.change_capture = os.getenv("VECTOR_STORE_CDC", "true").lower() != "false"
+        # Timeouts curtos das sondas: um shard lento não deve segurar o health check
+        self.readiness_timeout = float(os.getenv("VECTOR_STORE_READY_TIMEOUT", "2"))
+        self.stats_timeout = float(os.getenv("VECTOR_STORE_STATS_TIMEOUT", "5"))
+        logger.info(f"Vectorstore remoto com {len(self.shards)} shard(s): {[shard.url for shard in self.shards]}")
+
+    def _shard_number(self, user_id: str) -> int:
+        """Shard responsável pelo usuário (hash estável do user_id)."""
+        digest = hashlib.sha1(str(user_id).encode("utf-8")).hexdigest()
+        return int(digest, 16) % len(self.shards)
+
+    def _shard(self, user_id: str) -> VectorStoreShardClient:
+        return self.shards[self._shard_number(user_id)]
+
+    def update_user_vectorstore(self, user_id: str, db: Any = None, force: bool = False):
+        """Atualiza o vectorstore de um usuário no shard responsável."""
+        error = self.update_users_vectorstores([(user_id, force)], db)[user_id]
+        if error is not None:
+            raise error
+
+    def update_users_vectorstores(self, requests: List[Tuple[str, bool]], db: Any = None) -> Dict[str, Optional[Exception]]:
+        """
+        Atualiza vários usuários, com uma requisição por shard.
+        A sessão do banco é ignorada: cada shard usa suas próprias conexões.
+        """
+        by_shard: Dict[int, List[Tuple[str, bool]]] = {}
+        for user_id, force in requests:
+            by_shard.setdefault(self._shard_number(user_id), []).append((str(user_id), force))
+
+        errors: Dict[str, Optional[Exception]] = {}
+        for shard_number, shard_requests in by_shard.items():
+            try:
+                for user_id, error in self.shards[shard_number].refresh(shard_requests).items():
+                    errors[user_id] = RuntimeError(error) if error else None
+            except Exception as e:
+                logger.error(f"Erro ao atualizar vectorstore remoto (shard {shard_number}): {str(e)}")
+                for user_id, _ in shard_requests:
+                    errors[user_id] = e
+        return errors
+
+    def retrieve_relevant_context(self, user_id: str, query: str, max_results: int = 5) -> List[Dict[str, Any]]:
+        """Recupera contexto relevante no shard do usuário (consultas concorrentes vão em lote)."""
+        try:
+            return self._shard(user_id).query(
+                {"user_id": str(user_id), "query": query, "max_results": max_results, "kind": "results"}
+            )
+        except Exception as e:
+            logger.error(f"Erro ao recuperar contexto no vectorstore remoto: {str(e)}")
+            return []
+
+    def _query_context(self, user_id: str, query: str, kind: str) -> str:
+        """Consulta um texto já montado (e em cache) pelo shard do usuário."""
+        try:
+            return self._shard(user_id).query(
+                {"user_id": str(user_id), "query": query, "max_results": 5, "kind": kind}
+            )
+        except Exception as e:
+            logger.error(f"Erro ao recuperar contexto no vectorstore remoto: {str(e)}")
+            return ""
+
+    def get_formatted_context(self, user_id: str, query: str) -> str:
+        """Retorna o contexto já formatado pelo shard do usuário."""
+        return self._query_context(user_id, query, "context")
+
+    def get_context_prefix(self, user_id: str, query: str) -> str:
+        """Retorna o prefixo da mensagem (contexto + "Pergunta: ") montado pelo shard do usuário."""
+        return self._query_context(user_id, query, "prefix")
+
+    def start_warmup(self):
+        """Os shards carregam o modelo na própria inicialização."""
+
+    def readiness(self) -> Dict[str, Any]:
+        """Prontidão agregada: pronto quando todos os shards estão prontos."""
+        shards = []
+        for shard in self.shards:
+            try:
+                shards.append({"url": shard.url, **shard.get("/ready", timeout=self.readiness_timeout)})
+            except Exception as e:
+                shards.append({"url": shard.url, "ready": False, "error": str(e)})
+        return {"ready": all(shard["ready"] for shard in shards), "remote": True, "shards": shards}
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Estatísticas de cada shard e contadores de lotes do cliente."""
+        shards = []
+        for shard in self.shards:
+            try:
+                stats = shard.get("/stats", timeout=self.stats_timeout)
+            except Exception as e:
+                stats = {"error": str(e)}
+            shards.append({"url": shard.url, "client": dict(shard.stats_counters), **stats})
+        return {"remote": True, "shards": shards}
+
+    def healthcheck(self) -> bool:
+        """Verifica se todos os shards estão acessíveis e com o modelo carregado."""
+        return self.readiness()["ready"]
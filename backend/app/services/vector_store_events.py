@@ -0,0 +1,112 @@
+"""
+Captura de alterações (CDC) para o vectorstore.
+Listeners do SQLAlchemy registram os usuários cujas tarefas, projetos ou conversas
+foram inseridos, alterados ou excluídos e, após o commit, agendam no worker de
+embeddings uma atualização incremental apenas desses usuários.
+"""
+import logging
+import threading
+from typing import Any, Dict, Set
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import object_session
+
+from app.database import SessionLocal
+from app.models.chat import ChatHistory
+from app.models.project_model import Project
+from app.models.task_model import Task
+from app.services.embedding_worker import embedding_worker
+
+logger = logging.getLogger(__name__)
+
+# Chave em Session.info com os usuários alterados na transação corrente
+PENDING_KEY = "vector_store_changed_users"
+
+class VectorStoreChangeCapture:
+    """
+    Ponte entre os eventos do ORM e o worker de embeddings.
+
+    Características:
+    - after_insert/after_update/after_delete em Task, Project e ChatHistory
+    - Usuários afetados acumulados por sessão e enviados somente após o commit
+      (um rollback descarta as alterações pendentes)
+    - Troca de dono de uma linha atualiza o usuário antigo e o novo
+    - O worker coalesce vários commits do mesmo usuário em um único job
+    - Alcance: só os commits deste processo; outros workers com vectorstore local dependem
+      do TTL (VECTOR_STORE_TTL), exceto com o servidor compartilhado (VECTOR_STORE_URL)
+    """
+
+    def __init__(self, worker: Any, models: tuple = (Task, Project, ChatHistory)):
+        """
+        Inicializa a captura de alterações.
+
+        Args:
+            worker: Worker de embeddings que executa as atualizações
+            models: Modelos observados (precisam da coluna user_id)
+        """
+        self.worker = worker
+        self.models = models
+        self._registered = False
+        self._lock = threading.Lock()
+        self.stats_counters = {"row_events": 0, "commits": 0, "rollbacks": 0, "users_enqueued": 0}
+
+    def register(self, session_factory: Any = SessionLocal):
+        """
+        Registra os listeners nos modelos e na fábrica de sessões (idempotente).
+
+        Args:
+            session_factory: sessionmaker cujas sessões disparam a atualização no commit
+        """
+        with self._lock:
+            if self._registered:
+                return
+            for model in self.models:
+                event.listen(model, "after_insert", self._on_row_changed)
+                event.listen(model, "after_update", self._on_row_changed)
+                event.listen(model, "after_delete", self._on_row_changed)
+            event.listen(session_factory, "after_commit", self._on_commit)
+            event.listen(session_factory, "after_rollback", self._on_rollback)
+            self._registered = True
+        logger.info(f"Captura de alterações do vectorstore ativa para {[model.__name__ for model in self.models]}")
+
+    def _on_row_changed(self, mapper: Any, connection: Any, target: Any):
+        """Registra o(s) usuário(s) da linha alterada na sessão corrente."""
+        session = object_session(target)
+        if session is None:
+            return
+
+        users: Set[str] = session.info.setdefault(PENDING_KEY, set())
+        if target.user_id is not None:
+            users.add(str(target.user_id))
+        # Linha transferida para outro usuário: o antigo também precisa ser atualizado
+        for previous_user in inspect(target).attrs.user_id.history.deleted or ():
+            if previous_user is not None:
+                users.add(str(previous_user))
+        self.stats_counters["row_events"] += 1
+
+    def _on_commit(self, session: Any):
+        """Agenda a atualização incremental dos usuários alterados na transação."""
+        users = session.info.pop(PENDING_KEY, None)
+        if not users:
+            return
+
+        self.stats_counters["commits"] += 1
+        for user_id in users:
+            try:
+                # force ignora o TTL; o modo incremental re-embeda só as linhas alteradas
+                self.worker.refresh_nowait(user_id, force=True)
+                self.stats_counters["users_enqueued"] += 1
+            except Exception as e:
+                logger.warning(f"Erro ao agendar atualização do vectorstore do usuário {user_id}: {str(e)}")
+
+    def _on_rollback(self, session: Any):
+        """Descarta as alterações pendentes de uma transação revertida."""
+        if session.info.pop(PENDING_KEY, None):
+            self.stats_counters["rollbacks"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Retorna os contadores de eventos capturados."""
+        return {**self.stats_counters, "registered": self._registered}
+
+# Instância global para uso em toda a aplicação
+vector_store_change_capture = VectorStoreChangeCapture(embedding_worker)
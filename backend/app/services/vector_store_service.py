@@ -6,7 +6,6 @@ com dados contextuais do usuário.
 import logging
 import numpy as np
 from typing import List, Dict, Any, Tuple, Optional
-from sentence_transformers import SentenceTransformer
 from sqlalchemy.orm import Session
 try:
     from app.models.task_model import Task
@@ -15,13 +14,28 @@ except ImportError:
     # Fall back to models from all_models if direct import fails
     from app.models.all_models import Task, Project
 from app.models.chat import ChatHistory
+from app.services.vector_index import VectorIndex, create_vector_index
+from app.services.embedding_cache import EmbeddingCache, QueryEmbeddingCache
+from app.services.intent_recognizer import intent_recognizer
+from app.services.lexical_index import STOPWORDS, LexicalIndex, reciprocal_rank_fusion
+from app.services.text_chunker import TextChunker
+from app.services.context_cache import ContextCache
+from app.services.embedding_backends import HashedNgramBackend, create_embedding_backend
 import os
-import torch
+import fcntl
 import json
 import time
+import hashlib
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
 
 logger = logging.getLogger(__name__)
 
+# Rótulos dos textos indexados ("Tarefa: ... Status: ..."): presentes em quase todos os
+# documentos, não ajudam o BM25 a diferenciá-los
+DOCUMENT_LABELS = frozenset({"tarefa", "projeto", "descricao", "status", "prioridade", "pergunta", "resposta"})
+
 class VectorStoreService:
     """
     Serviço para armazenar e recuperar embeddings vetoriais para RAG.
@@ -30,8 +44,9 @@ class VectorStoreService:
     
     def __init__(self):
         """
-        Inicializa o serviço de armazenamento vetorial.
-        Carrega o modelo de embedding e inicializa estruturas de dados necessárias.
+        Inicializa o serviço de armazenamento vetorial e as estruturas de dados necessárias.
+        O modelo de embedding (sentence-transformers + torch) não é carregado aqui: ele é
+        carregado no primeiro uso ou pelo aquecimento em segundo plano (start_warmup).
         """
         logger.info("Inicializando serviço de armazenamento vetorial...")
         
@@ -41,26 +56,111 @@ class VectorStoreService:
         self.chat_embeddings = {}
         self.last_update = {}
         self.embedding_model = None
-        self.embedding_dim = 384  # Dimensão padrão para o modelo all-MiniLM-L6-v2
-        self.cache_ttl = 300  # 5 minutos em segundos
+        # Estado do carregamento do modelo: not_loaded, loading, ready ou failed
+        self.model_status = "not_loaded"
+        self.model_error: Optional[str] = None
+        self.model_load_seconds: Optional[float] = None
+        self._model_lock = threading.Lock()
+        # Backend de embedding (EMBEDDING_BACKEND): "sentence-transformers" (padrão) ou "hashed"
+        # (n-gramas de caracteres, sem modelo, para ambientes de baixa latência). Com
+        # EMBEDDING_FALLBACK=hashed, uma falha ao carregar o modelo troca para o backend hashed
+        # em vez de deixar o RAG apenas com a busca lexical
+        self.hash_dim = int(os.getenv("EMBEDDING_HASH_DIM", "512"))
+        self.embedding_fallback = os.getenv("EMBEDDING_FALLBACK", "none").lower()
+        self.fallback_active = False
+        # Escolha um modelo leve - all-MiniLM-L6-v2 (33MB) é um bom equilíbrio entre tamanho e performance
+        self.embedding_backend = create_embedding_backend(
+            os.getenv("EMBEDDING_BACKEND", "sentence-transformers").lower(),
+            model_name="sentence-transformers/all-MiniLM-L6-v2", hash_dim=self.hash_dim
+        )
+        self.model_name = self.embedding_backend.name
+        self.embedding_dim = self.embedding_backend.dim  # 384 para o all-MiniLM-L6-v2
+        # Com a captura de alterações (VECTOR_STORE_CDC), inserções/alterações/exclusões de
+        # tarefas, projetos e conversas disparam a atualização. Os listeners só enxergam os
+        # commits do próprio processo: o TTL longo vale apenas no servidor de vectorstore
+        # compartilhado (app.vector_store_server), que recebe as atualizações de todos os
+        # workers da API. Um vectorstore local por worker mantém o TTL de 300s, pois os
+        # commits dos outros workers (e de escritores fora da aplicação) não chegam a ele
+        self.change_capture = os.getenv("VECTOR_STORE_CDC", "true").lower() != "false"
+        self.shared_server = os.getenv("VECTOR_STORE_SHARED_SERVER", "false").lower() == "true"
+        self.cache_ttl = int(os.getenv(
+            "VECTOR_STORE_TTL", "3600" if self.change_capture and self.shared_server else "300"
+        ))
+        self.chat_history_limit = 50  # Conversas mais recentes indexadas por usuário
+        self.similarity_threshold = 0.3  # Score mínimo de similaridade para um resultado
+        # Lotes de embedding dimensionados por tokens (padding incluído) e truncamento do modelo
+        self.max_batch_tokens = int(os.getenv("EMBEDDING_BATCH_TOKENS", "8192"))
+        self.max_batch_size = int(os.getenv("EMBEDDING_MAX_BATCH_SIZE", "256"))
+        self.max_seq_tokens = 256
+        # Textos longos (descrições, respostas da IA) são divididos em trechos sobrepostos que
+        # cabem no modelo; cada trecho é um vetor ligado à linha de origem ("<id>#<n>") e a
+        # consulta usa o melhor trecho de cada linha
+        self.chunker = TextChunker(
+            max_tokens=int(os.getenv("CHUNK_MAX_TOKENS", "200")),
+            overlap_tokens=int(os.getenv("CHUNK_OVERLAP_TOKENS", "40")),
+            max_chunks=int(os.getenv("CHUNK_MAX_PER_DOCUMENT", "8"))
+        )
+        self.chunk_search_factor = 4  # Trechos buscados por resultado antes da agregação por linha
+        # Modo incremental: re-embeda apenas linhas novas/alteradas (VECTOR_STORE_INCREMENTAL=false desativa)
+        self.incremental_indexing = os.getenv("VECTOR_STORE_INCREMENTAL", "true").lower() != "false"
+        # Índice de busca por usuário: "flat" (exato) ou "ivf" (aproximado, sub-linear)
+        self.index_backend = os.getenv("VECTOR_INDEX_BACKEND", "flat").lower()
+        self.indexes: Dict[str, VectorIndex] = {}
+        # Armazenamento do índice: "float32" (padrão, mais rápido) ou "int8" (4x menos memória,
+        # escala por vetor, ~3x mais latência por consulta). Com VECTOR_RESCORE (padrão), os
+        # melhores candidatos do int8 são reordenados com os vetores float32 (recall ~1.0)
+        self.storage_dtype = os.getenv("VECTOR_STORAGE_DTYPE", "float32").lower()
+        self.rescore_enabled = os.getenv("VECTOR_RESCORE", "true").lower() != "false"
+        self.index_positions: Dict[str, Dict[str, Dict[str, int]]] = {}  # usuário -> coleção -> id -> linha
+        # Busca híbrida: BM25 sobre os mesmos textos, fundido aos resultados vetoriais por RRF
+        # (VECTOR_STORE_HYBRID=false desativa). Sem modelo de embedding, só o BM25 é usado
+        self.hybrid_retrieval = os.getenv("VECTOR_STORE_HYBRID", "true").lower() != "false"
+        self.hybrid_candidates = 20  # Candidatos de cada ranking antes da fusão
+        self.rrf_k = 60
+        self.lexical_indexes: Dict[str, LexicalIndex] = {}
+        # Atualizações rodam em threads do worker de embeddings: um lock por usuário serializa
+        # as atualizações e _index_lock protege os índices durante mutações e buscas
+        self._user_locks: Dict[str, threading.Lock] = {}
+        self._user_locks_guard = threading.Lock()
+        self._index_lock = threading.RLock()
+        # Orçamento de memória: usuários menos consultados recentemente saem da memória
+        # (os vetores ficam no disco e são recarregados sob demanda). 0 = sem limite
+        self.max_resident_users = int(os.getenv("VECTOR_STORE_MAX_USERS", "0"))
+        self.max_resident_mb = float(os.getenv("VECTOR_STORE_MAX_MB", "0"))
+        self._access_order: "OrderedDict[str, None]" = OrderedDict()  # usuário -> (LRU)
+        self._pinned_users: Dict[str, int] = {}  # usuário -> consultas em andamento (não evictável)
+        self.evictions = 0
+        self.index_metadata: Dict[str, Dict[str, Dict[str, Any]]] = {}  # usuário -> chave -> metadados
         
-        self.cache_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), "cache")
+        # VECTOR_STORE_CACHE_DIR permite isolar os arquivos (ex.: benchmarks e shards)
+        self.cache_dir = os.getenv(
+            "VECTOR_STORE_CACHE_DIR", os.path.join(os.path.dirname(os.path.dirname(__file__)), "cache")
+        )
         os.makedirs(self.cache_dir, exist_ok=True)
+        # Matrizes de embeddings por usuário (.npy) + diário das linhas, abertas via mmap
+        self.vectors_dir = os.path.join(self.cache_dir, "vectors")
+        os.makedirs(self.vectors_dir, exist_ok=True)
+        # Geração em disco e tamanho do diário de cada coleção (usuário -> coleção -> estado)
+        self.persisted_collections: Dict[str, Dict[str, Dict[str, int]]] = {}
+        # Cache de embeddings por conteúdo (memória + SQLite), compartilhado entre usuários
+        self.embedding_cache = EmbeddingCache(
+            db_path=os.path.join(self.cache_dir, "embeddings.sqlite"),
+            memory_items=int(os.getenv("EMBEDDING_CACHE_MEMORY_ITEMS", "10000")),
+            disk_items=int(os.getenv("EMBEDDING_CACHE_DISK_ITEMS", "200000"))
+        )
+        # Cache de embeddings de consultas (LRU + TTL), indexado pelo texto normalizado
+        self.query_cache = QueryEmbeddingCache(
+            max_items=int(os.getenv("QUERY_EMBEDDING_CACHE_ITEMS", "2048")),
+            ttl_seconds=float(os.getenv("QUERY_EMBEDDING_CACHE_TTL", "3600"))
+        )
+        # Cache dos blocos de contexto formatados, por (usuário, versão do índice, bucket da consulta).
+        # A versão muda a cada alteração nos dados do usuário, invalidando as entradas dele
+        self.context_cache = ContextCache(max_bytes=int(float(os.getenv("CONTEXT_CACHE_MAX_MB", "16")) * 1024 * 1024))
+        self.context_bucket_bits = int(os.getenv("CONTEXT_CACHE_BUCKET_BITS", "64"))
+        self._bucket_planes: Optional[np.ndarray] = None
+        self.index_versions: Dict[str, int] = {}  # usuário -> versão do índice
         
         try:
-            # Escolha um modelo leve - all-MiniLM-L6-v2 (33MB) é um bom equilíbrio entre tamanho e performance
-            self.model_name = "sentence-transformers/all-MiniLM-L6-v2"
-            logger.info(f"Carregando modelo de embedding: {self.model_name}")
-            
-            try:
-                self.embedding_model = SentenceTransformer(self.model_name)
-                self.embedding_dim = self.embedding_model.get_sentence_embedding_dimension()
-                logger.info(f"Modelo de embedding carregado com sucesso. Dimensão: {self.embedding_dim}")
-            except Exception as e:
-                logger.error(f"Erro ao carregar modelo de embedding: {str(e)}")
-                # Fallback para modo sem embedding
-                self.embedding_model = None
-            
             # Carregar embeddings do cache disk se disponíveis
             self._load_embeddings_from_disk()
             
@@ -73,6 +173,87 @@ class VectorStoreService:
             self.last_update = {}
             self.embedding_model = None
 
+    def _load_model(self) -> bool:
+        """
+        Carrega o backend de embedding (no sentence-transformers, importa o pacote e torch).
+        Chamadas concorrentes aguardam o carregamento em andamento; após uma falha,
+        a próxima chamada tenta novamente, exceto se o backend de fallback assumiu.
+        
+        Returns:
+            True se o modelo está disponível
+        """
+        with self._model_lock:
+            if self.embedding_model is not None:
+                return True
+            
+            self.model_status = "loading"
+            start_time = time.time()
+            logger.info(f"Carregando modelo de embedding: {self.model_name}")
+            try:
+                self.embedding_backend.load()
+                self.embedding_dim = self.embedding_backend.dim
+                self.embedding_model = self.embedding_backend
+                self.model_status = "ready"
+                self.model_error = None
+                self.model_load_seconds = time.time() - start_time
+                logger.info(f"Modelo de embedding carregado com sucesso em {self.model_load_seconds:.1f}s. "
+                            f"Dimensão: {self.embedding_dim}")
+                return True
+            except Exception as e:
+                logger.error(f"Erro ao carregar modelo de embedding: {str(e)}")
+                self.model_error = str(e)
+                if self.embedding_fallback == "hashed" and not isinstance(self.embedding_backend, HashedNgramBackend):
+                    self._activate_fallback_backend()
+                    return True
+                # Fallback para modo sem embedding (apenas busca lexical)
+                self.model_status = "failed"
+                return False
+
+    def _activate_fallback_backend(self):
+        """
+        Troca para o backend hashed após uma falha do modelo (chamado com _model_lock).
+        Os vetores em memória pertencem a outro espaço vetorial: os usuários residentes são
+        descartados e reconstruídos na próxima atualização (os arquivos em disco, com outro
+        model_name, são ignorados e regravados por completo).
+        """
+        backend = create_embedding_backend("hashed", hash_dim=self.hash_dim)
+        logger.warning(f"Usando o backend de embedding {backend.name} como fallback do modelo {self.model_name}")
+        with self._index_lock:
+            for _, store, _, _ in self._collection_specs():
+                for user_id in list(store):
+                    store.pop(user_id, None)
+                    self._drop_user_indexes(user_id)
+                    self.last_update.pop(user_id, None)
+            self._access_order.clear()
+            self.persisted_collections.clear()
+            self.embedding_backend = backend
+            self.model_name = backend.name
+            self.embedding_dim = backend.dim
+            self.embedding_model = backend
+        self.fallback_active = True
+        self.model_status = "ready"
+
+    def start_warmup(self):
+        """Carrega o modelo de embedding em uma thread de segundo plano (não bloqueia o chamador)."""
+        if self.embedding_model is not None or self.model_status == "loading":
+            return
+        threading.Thread(target=self._load_model, name="embedding-warmup", daemon=True).start()
+
+    def readiness(self) -> Dict[str, Any]:
+        """
+        Estado de prontidão do RAG.
+        Enquanto o modelo não está pronto, as consultas são atendidas apenas pelo BM25.
+        """
+        return {
+            "ready": self.embedding_model is not None,
+            "model_status": self.model_status,
+            "model_name": self.model_name,
+            "load_seconds": self.model_load_seconds,
+            "error": self.model_error,
+            "embedding_fallback": self.fallback_active,
+            "lexical_fallback": self.embedding_model is None
+        }
+
     def _load_embeddings_from_disk(self):
         """Carrega embeddings salvos anteriormente em disco."""
         try:
@@ -104,59 +285,833 @@ class VectorStoreService:
         except Exception as e:
             logger.warning(f"Erro ao salvar cache de embeddings: {str(e)}")
 
-    def _create_embedding(self, text: str) -> np.ndarray:
+    def _user_vectors_dir(self, user_id: str) -> str:
+        """Diretório com as matrizes e os diários de linhas de um usuário."""
+        return os.path.join(self.vectors_dir, str(user_id))
+
+    @staticmethod
+    def _atomic_write(path: str, write: Any):
+        """
+        Escreve um arquivo de forma atômica (arquivo temporário + os.replace).
+        Workers que já mapearam a versão anterior continuam lendo o inode antigo.
+        """
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            write(f)
+        os.replace(tmp_path, path)
+
+    def _collection_files(self, user_dir: str, name: str, generation: int) -> Tuple[str, str]:
+        """Arquivos de uma geração da coleção: matriz (.npy) e ordem das linhas/trechos (.json)."""
+        return (os.path.join(user_dir, f"{name}.{generation}.npy"),
+                os.path.join(user_dir, f"{name}.{generation}.json"))
+
+    @contextmanager
+    def _user_dir_lock(self, user_dir: str):
+        """Lock exclusivo (flock) no diretório do usuário, válido entre processos."""
+        with open(os.path.join(user_dir, ".lock"), 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _read_generations(user_dir: str) -> Dict[str, int]:
+        """Gerações apontadas pelo cabeçalho em disco ({} se não existe ou é de outro formato)."""
+        try:
+            with open(os.path.join(user_dir, "metadata.json"), 'r') as f:
+                header = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        return header.get("generations", {}) if header.get("format") == 2 else {}
+
+    def _write_rows_journal(self, path: str, collection: Dict[str, Any], generation: int,
+                            row_ids: Optional[List[str]] = None):
+        """
+        Grava o estado (texto, hash, updated_at) e os metadados das linhas no diário da coleção.
+        Com row_ids, acrescenta apenas essas linhas; sem row_ids, reescreve o diário compactado.
+        """
+        metadata_by_id = {meta["id"]: meta for meta in collection["metadata"]}
+        ids = row_ids if row_ids is not None else list(collection["row_state"])
+        lines = [
+            json.dumps({"generation": generation, "id": row_id, "state": collection["row_state"][row_id],
+                        "metadata": metadata_by_id.get(row_id)}, default=str) + "\n"
+            for row_id in ids if row_id in collection["row_state"]
+        ]
+        payload = "".join(lines).encode("utf-8")
+        if row_ids is None:
+            self._atomic_write(path, lambda f: f.write(payload))
+        else:
+            with open(path, 'ab') as f:
+                f.write(payload)
+        return len(lines)
+
+    def _save_user_vectors(self, user_id: str, changed_rows: Optional[Dict[str, List[str]]] = None):
+        """
+        Persiste em disco apenas as coleções alteradas do usuário.
+
+        Cada coleção tem gerações numeradas: a matriz float32 (.npy) e a ordem das linhas e
+        trechos (.json) são regravadas só quando a coleção muda, e o estado das linhas (com o
+        texto) vai para um diário .rows.jsonl em que apenas as linhas alteradas são
+        acrescentadas; o diário é compactado quando passa do dobro das linhas ativas. O
+        cabeçalho metadata.json, pequeno, é escrito por último e marca a geração completa de
+        cada coleção. Após salvar, os vetores em memória são substituídos por visões
+        memory-mapped, compartilhadas entre workers pelo page cache.
+
+        Args:
+            user_id: ID do usuário
+            changed_rows: Coleção -> IDs das linhas alteradas; None regrava todas as coleções
+        """
+        try:
+            user_dir = self._user_vectors_dir(user_id)
+            os.makedirs(user_dir, exist_ok=True)
+            # Lock entre processos: workers do uvicorn gravando o mesmo usuário não escolhem a
+            # mesma geração, não misturam arquivos nem removem a geração recém-gravada do outro
+            with self._user_dir_lock(user_dir):
+                persisted = self.persisted_collections.get(user_id)
+                on_disk = self._read_generations(user_dir)
+                known = {name: state["generation"] for name, state in persisted.items()} if persisted else None
+                if known != on_disk:
+                    # Estado em disco desconhecido ou alterado por outro processo: gravação completa,
+                    # com gerações posteriores às que estão no disco
+                    changed_rows = None
+                    persisted = {
+                        name: {"generation": max(on_disk.get(name, 0), (known or {}).get(name, 0)), "journal_rows": 0}
+                        for name, _, _, _ in self._collection_specs()
+                    }
+            
+                written = []
+                for name, store, _, _ in self._collection_specs():
+                    if changed_rows is not None and name not in changed_rows:
+                        continue
+                    collection = store[user_id]
+                    state = persisted[name]
+                    generation = state["generation"] + 1
+                    matrix_file, order_file = self._collection_files(user_dir, name, generation)
+                    vectors = np.ascontiguousarray(collection["vectors"], dtype=np.float32)
+                    self._atomic_write(matrix_file, lambda f, vectors=vectors: np.save(f, vectors, allow_pickle=False))
+                    order = json.dumps({"order": [meta["id"] for meta in collection["metadata"]],
+                                        "chunks": collection["chunks"]}).encode("utf-8")
+                    self._atomic_write(order_file, lambda f, order=order: f.write(order))
+                
+                    journal_file = os.path.join(user_dir, f"{name}.rows.jsonl")
+                    row_ids = changed_rows[name] if changed_rows is not None else None
+                    if row_ids is not None and state["journal_rows"] + len(row_ids) > 2 * len(collection["row_state"]) + 64:
+                        row_ids = None
+                    if row_ids is None:
+                        state["journal_rows"] = self._write_rows_journal(journal_file, collection, generation)
+                    else:
+                        state["journal_rows"] += self._write_rows_journal(journal_file, collection, generation, row_ids)
+                    state["generation"] = generation
+                    written.append(name)
+            
+                # O cabeçalho é escrito por último: ele marca a versão completa no disco
+                header = {
+                    "format": 2,
+                    "model_name": self.model_name,
+                    "embedding_dim": self.embedding_dim,
+                    "last_update": self.last_update.get(user_id, 0),
+                    "chunking": self.chunker.config,
+                    "generations": {name: state["generation"] for name, state in persisted.items()}
+                }
+                payload = json.dumps(header, default=str).encode("utf-8")
+                self._atomic_write(os.path.join(user_dir, "metadata.json"), lambda f: f.write(payload))
+                self.persisted_collections[user_id] = persisted
+            
+                for name, store, _, _ in self._collection_specs():
+                    if name in written:
+                        matrix_file, _ = self._collection_files(user_dir, name, persisted[name]["generation"])
+                        store[user_id]["vectors"] = np.load(matrix_file, mmap_mode="r")
+                self._remove_stale_generations(user_dir, header["generations"])
+        except Exception as e:
+            # Estado em disco incerto: a próxima gravação reescreve tudo
+            self.persisted_collections.pop(user_id, None)
+            logger.warning(f"Erro ao salvar vetores do usuário {user_id} em disco: {str(e)}")
+
+    def _remove_stale_generations(self, user_dir: str, generations: Dict[str, int]):
+        """Remove as gerações substituídas (workers que as mapearam continuam lendo o inode)."""
+        current = {os.path.basename(path) for name, generation in generations.items()
+                   for path in self._collection_files(user_dir, name, generation)}
+        for filename in os.listdir(user_dir):
+            if filename.endswith((".npy", ".json")) and filename != "metadata.json" and filename not in current:
+                try:
+                    os.remove(os.path.join(user_dir, filename))
+                except OSError:
+                    pass
+
+    def _read_rows_journal(self, path: str, generation: int) -> Tuple[Dict[str, Dict[str, Any]], bool]:
+        """
+        Lê o diário de linhas até a geração informada (a última entrada de cada linha vale).
+        
+        Returns:
+            (ID da linha -> entrada, True se havia entradas de uma gravação interrompida)
+        """
+        entries: Dict[str, Dict[str, Any]] = {}
+        interrupted = False
+        with open(path, 'r') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    interrupted = True
+                    continue
+                if entry["generation"] > generation:
+                    interrupted = True
+                    continue
+                entries[entry["id"]] = entry
+        return entries, interrupted
+
+    def _load_user_vectors(self, user_id: str) -> bool:
+        """
+        Carrega as matrizes do usuário do disco com np.load(mmap_mode="r") e o estado das
+        linhas a partir dos diários das coleções.
+        
+        Returns:
+            True se os vetores foram carregados, False se não existem ou são incompatíveis
+        """
+        user_dir = self._user_vectors_dir(user_id)
+        header_file = os.path.join(user_dir, "metadata.json")
+        if not os.path.exists(header_file):
+            return False
+        
+        try:
+            # O lock impede ler um cabeçalho cujos arquivos outro processo está substituindo
+            with self._user_dir_lock(user_dir):
+                with open(header_file, 'r') as f:
+                    header = json.load(f)
+            
+                # Formato antigo (sidecar único com todas as coleções): reconstruir
+                if header.get("format") != 2:
+                    logger.info(f"Vetores em disco do usuário {user_id} usam o formato antigo; ignorando")
+                    return False
+            
+                if header.get("model_name") != self.model_name or header.get("embedding_dim") != self.embedding_dim:
+                    logger.info(f"Vetores em disco do usuário {user_id} foram gerados por outro modelo; ignorando")
+                    return False
+            
+                # Outra configuração de trechos: reconstruir
+                if header.get("chunking") != self.chunker.config:
+                    logger.info(f"Vetores em disco do usuário {user_id} usam outra divisão em trechos; ignorando")
+                    return False
+            
+                loaded = {}
+                persisted = {}
+                for name, _, _, _ in self._collection_specs():
+                    generation = header["generations"][name]
+                    matrix_file, order_file = self._collection_files(user_dir, name, generation)
+                    with open(order_file, 'r') as f:
+                        order = json.load(f)
+                    vectors = np.load(matrix_file, mmap_mode="r")
+                    if vectors.shape != (len(order["chunks"]), self.embedding_dim):
+                        logger.warning(f"Vetores em disco do usuário {user_id} inconsistentes ({name}); ignorando")
+                        return False
+                    journal_file = os.path.join(user_dir, f"{name}.rows.jsonl")
+                    entries, interrupted = self._read_rows_journal(journal_file, generation)
+                    if any(row_id not in entries for row_id in order["order"]):
+                        logger.warning(f"Diário de linhas do usuário {user_id} incompleto ({name}); ignorando")
+                        return False
+                    loaded[name] = {
+                        "vectors": vectors,
+                        "metadata": [entries[row_id]["metadata"] for row_id in order["order"]],
+                        "row_state": {row_id: entries[row_id]["state"] for row_id in order["order"]},
+                        "chunks": order["chunks"]
+                    }
+                    persisted[name] = {"generation": generation, "journal_rows": len(entries)}
+                    if interrupted:
+                        # Entradas de uma gravação interrompida não podem reaparecer na próxima geração
+                        persisted[name]["journal_rows"] = self._write_rows_journal(journal_file, loaded[name], generation)
+            
+                with self._index_lock:
+                    # Outra consulta carregou o usuário enquanto o disco era lido: manter a dela
+                    # (e o índice que ela já pode ter construído)
+                    if user_id in self.task_embeddings:
+                        return True
+                    for name, store, _, _ in self._collection_specs():
+                        store[user_id] = loaded[name]
+                    self._drop_user_indexes(user_id)
+                    self.persisted_collections[user_id] = persisted
+                self.last_update[user_id] = header.get("last_update", 0)
+                logger.info(f"Vetores do usuário {user_id} carregados do disco (mmap)")
+                return True
+        except Exception as e:
+            logger.warning(f"Erro ao carregar vetores do usuário {user_id} do disco: {str(e)}")
+            return False
+
+    @staticmethod
+    def _normalize_query(query: str) -> str:
+        """Normaliza uma consulta para o cache: sem acentos, minúsculas, espaços e pontuação final."""
+        return " ".join(intent_recognizer._normalize_text(query).split()).strip("?!.,; ")
+
+    def _embed_query(self, query: str) -> np.ndarray:
         """
-        Cria um embedding vetorial para um texto.
+        Cria o embedding de uma consulta, reaproveitando o de consultas equivalentes.
+        Consultas não passam pelo cache persistente de documentos: apenas pelo cache
+        em memória (LRU + TTL), indexado pelo modelo e pelo texto normalizado.
         
         Args:
-            text: Texto a ser convertido em embedding
+            query: Texto da consulta
             
         Returns:
             Vetor de embedding numpy
         """
-        if self.embedding_model is None:
-            # Retornar vetor vazio se não há modelo
-            return np.zeros(384)  # 384 é o tamanho padrão do all-MiniLM-L6-v2
+        normalized = self._normalize_query(query)
+        vector = self.query_cache.get(self.model_name, normalized)
+        if vector is None:
+            vector = self._encode_batched([query])[0]
+            self.query_cache.put(self.model_name, normalized, vector)
+        return vector
+
+    def _encode_texts(self, texts: List[str]) -> np.ndarray:
+        """
+        Cria embeddings para vários textos, consultando o cache por conteúdo antes
+        de chamar o modelo. Apenas os textos ausentes do cache são codificados.
+        
+        Args:
+            texts: Textos a serem convertidos em embedding
             
-        try:
-            return self.embedding_model.encode(text)
-        except Exception as e:
-            logger.error(f"Erro ao criar embedding: {str(e)}")
-            return np.zeros(self.embedding_dim)
+        Returns:
+            Matriz float32 (len(texts), embedding_dim)
+        """
+        if not self.embedding_model.cacheable:
+            return self._encode_batched(texts)
+        
+        vectors = np.zeros((len(texts), self.embedding_dim), dtype=np.float32)
+        found, missing = self.embedding_cache.get_many(self.model_name, texts)
+        for position, vector in found.items():
+            vectors[position] = vector
+        
+        if missing:
+            # Textos repetidos no mesmo lote são codificados uma única vez
+            unique_texts = list(dict.fromkeys(texts[position] for position in missing))
+            encoded = self._encode_batched(unique_texts)
+            by_text = dict(zip(unique_texts, encoded))
+            for position in missing:
+                vectors[position] = by_text[texts[position]]
+            self.embedding_cache.put_many(self.model_name, unique_texts, encoded)
+        
+        return vectors
+
+    def _estimate_tokens(self, text: str) -> int:
+        """Estimativa barata de tokens (~4 caracteres por token), limitada ao truncamento do modelo."""
+        return min(max(1, len(text) // 4), self.max_seq_tokens)
+
+    def _encode_batched(self, texts: List[str]) -> np.ndarray:
+        """
+        Codifica textos com lotes dimensionados dinamicamente por tamanho em tokens.
+        
+        Os textos são ordenados por tamanho para minimizar padding e agrupados enquanto
+        o custo do lote (maior texto x número de textos) couber em max_batch_tokens.
+        O resultado volta na ordem original.
+        
+        Args:
+            texts: Textos a codificar
+            
+        Returns:
+            Matriz float32 (len(texts), embedding_dim)
+        """
+        vectors = np.zeros((len(texts), self.embedding_dim), dtype=np.float32)
+        order = sorted(range(len(texts)), key=lambda i: self._estimate_tokens(texts[i]))
+        
+        batch: List[int] = []
+        for position in order + [None]:
+            if position is not None:
+                tokens = self._estimate_tokens(texts[position])
+                # Como os textos estão ordenados, o texto atual é o maior do lote
+                if not batch or (tokens * (len(batch) + 1) <= self.max_batch_tokens
+                                 and len(batch) < self.max_batch_size):
+                    batch.append(position)
+                    continue
+            if batch:
+                encoded = self.embedding_model.encode([texts[i] for i in batch], batch_size=len(batch))
+                vectors[batch] = np.asarray(encoded, dtype=np.float32)
+            batch = [position] if position is not None else []
+        
+        return vectors
+
+    def _empty_collection(self) -> Dict[str, Any]:
+        """Cria uma coleção vazia (vetores, metadados e estado das linhas indexadas)."""
+        return {
+            "vectors": np.zeros((0, self.embedding_dim), dtype=np.float32),  # Um vetor por trecho
+            "metadata": [],  # Uma entrada por linha
+            "row_state": {},  # ID da linha -> {"updated_at": ..., "hash": ..., "text": ...}
+            "chunks": []  # Trecho de cada linha da matriz ("<id da linha>#<n>")
+        }
 
     def _ensure_user_structures(self, user_id: str):
         """
         Garante que as estruturas de dados necessárias para o usuário estão inicializadas.
+        Na primeira utilização, tenta carregar os vetores persistidos em disco.
         
         Args:
             user_id: ID do usuário
         """
-        # Inicializar task_embeddings para o usuário se não existir
-        if user_id not in self.task_embeddings:
-            self.task_embeddings[user_id] = {"vectors": np.array([]), "metadata": []}
-            
-        # Inicializar project_embeddings para o usuário se não existir
-        if user_id not in self.project_embeddings:
-            self.project_embeddings[user_id] = {"vectors": np.array([]), "metadata": []}
-            
-        # Inicializar chat_embeddings para o usuário se não existir
-        if user_id not in self.chat_embeddings:
-            self.chat_embeddings[user_id] = {"vectors": np.array([]), "metadata": []}
+        if user_id not in self.task_embeddings and not self._load_user_vectors(user_id):
+            # Sem vetores em disco, o timestamp herdado do cache não é confiável, e a próxima
+            # gravação precisa reescrever todas as coleções
+            self.last_update[user_id] = 0
+            self.persisted_collections.pop(user_id, None)
+        
+        for store in (self.task_embeddings, self.project_embeddings, self.chat_embeddings):
+            if user_id not in store:
+                store[user_id] = self._empty_collection()
+            else:
+                # Coleções antigas (sem estado por linha) são tratadas como vazias
+                store[user_id].setdefault("row_state", {})
             
         # Inicializar last_update para o usuário se não existir
         if user_id not in self.last_update:
             self.last_update[user_id] = 0  # Timestamp 0 forçará atualização
 
+    @staticmethod
+    def _content_hash(text: str) -> str:
+        """Calcula o hash do conteúdo indexado de uma linha."""
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _timestamp_key(value: Any) -> Optional[str]:
+        """Converte o updated_at de uma linha para uma chave comparável e serializável."""
+        if value is None:
+            return None
+        return value.isoformat() if hasattr(value, 'isoformat') else str(value)
+
+    @staticmethod
+    def _task_document(task: Any) -> Tuple[str, Dict[str, Any]]:
+        """Monta o texto a ser indexado e os metadados de uma tarefa."""
+        text = f"Tarefa: {task.title}. "
+        if task.description:
+            text += f"Descrição: {task.description}. "
+        text += f"Status: {task.status}. Prioridade: {task.priority}."
+        
+        return text, {
+            "id": str(task.id),
+            "title": task.title,
+            "status": task.status,
+            "priority": task.priority,
+            "type": "task"
+        }
+
+    @staticmethod
+    def _project_document(project: Any) -> Tuple[str, Dict[str, Any]]:
+        """Monta o texto a ser indexado e os metadados de um projeto."""
+        text = f"Projeto: {project.title}. "
+        if project.description:
+            text += f"Descrição: {project.description}. "
+        
+        return text, {
+            "id": str(project.id),
+            "name": project.title,
+            "type": "project"
+        }
+
+    @staticmethod
+    def _chat_document(chat: Any) -> Tuple[str, Dict[str, Any]]:
+        """Monta o texto a ser indexado e os metadados de uma conversa."""
+        # Combinar pergunta e resposta em um único texto para contexto
+        text = f"Pergunta: {chat.user_message} Resposta: {chat.ai_response}"
+        
+        return text, {
+            "id": str(chat.id),
+            "tags": chat.tags,
+            "created_at": chat.created_at.isoformat() if hasattr(chat.created_at, 'isoformat') else str(chat.created_at),
+            "type": "chat"
+        }
+
+    def _collection_specs(self) -> List[Tuple[str, Dict[str, Any], Any, Any]]:
+        """Lista (nome, armazenamento, modelo, construtor de documento) de cada coleção indexada."""
+        return [
+            ("tasks", self.task_embeddings, Task, self._task_document),
+            ("projects", self.project_embeddings, Project, self._project_document),
+            ("chats", self.chat_embeddings, ChatHistory, self._chat_document),
+        ]
+
+    def _current_rows(self, model: Any, user_id: str, db: Session) -> List[Any]:
+        """
+        Busca apenas (id, updated_at) das linhas do usuário que devem estar no índice.
+        O histórico de chat é limitado às 50 conversas mais recentes.
+        """
+        query = db.query(model.id, model.updated_at).filter(model.user_id == user_id)
+        if model is ChatHistory:
+            query = query.order_by(ChatHistory.created_at.desc()).limit(self.chat_history_limit)
+        return query.all()
+
+    def _plan_collection(self, name: str, store: Dict[str, Any], user_id: str, model: Any,
+                         build_document: Any, db: Session) -> Dict[str, Any]:
+        """
+        Planeja a sincronização incremental de uma coleção com o banco de dados.
+        
+        Compara o updated_at de cada linha com o estado indexado, carrega apenas as linhas
+        novas ou alteradas e separa os textos cujo conteúdo mudou (hash), que precisam ser
+        re-embedados; cada texto é dividido em trechos pelo TextChunker. Linhas excluídas
+        são marcadas para remoção. Nada é alterado aqui: os vetores são calculados em lote
+        e aplicados por _apply_collection.
+        
+        Returns:
+            Plano com o novo estado da coleção, os textos a embedar e os contadores
+        """
+        collection = store[user_id]
+        row_state = collection["row_state"]
+        old_chunk_rows: Dict[str, List[int]] = {}  # ID da linha -> linhas da matriz dos seus trechos
+        for matrix_row, chunk_id in enumerate(collection["chunks"]):
+            old_chunk_rows.setdefault(chunk_id.split("#", 1)[0], []).append(matrix_row)
+        
+        rows = self._current_rows(model, user_id, db)
+        current = [(str(row.id), row.id, self._timestamp_key(row.updated_at)) for row in rows]
+        current_ids = {row_id for row_id, _, _ in current}
+        
+        changed = [
+            raw_id for row_id, raw_id, updated_at in current
+            if row_id not in row_state or row_state[row_id]["updated_at"] != updated_at
+        ]
+        removed = [row_id for row_id in row_state if row_id not in current_ids]
+        plan = {
+            "name": name,
+            "store": store,
+            "old_chunk_rows": old_chunk_rows,
+            "order": [row_id for row_id, _, _ in current],
+            "new_state": {row_id: state for row_id, state in row_state.items() if row_id in current_ids},
+            "new_metadata": {meta["id"]: meta for meta in collection["metadata"] if meta["id"] in current_ids},
+            "texts": [],
+            "ids_to_embed": [],
+            "chunk_counts": [],
+            "counts": {"added": 0, "updated": 0, "embedded": 0, "chunks": 0, "removed": len(removed)},
+            "changes": {"metadata": {}, "vectors": {}, "removed": removed, "stale_chunks": []},
+            "unchanged": not changed and not removed
+        }
+        if plan["unchanged"]:
+            return plan
+        
+        # Carregar somente as linhas novas ou alteradas
+        new_rows = db.query(model).filter(model.id.in_(changed)).all() if changed else []
+        
+        for row in new_rows:
+            row_id = str(row.id)
+            text, metadata = build_document(row)
+            content_hash = self._content_hash(text)
+            previous = row_state.get(row_id)
+            plan["counts"]["updated" if previous else "added"] += 1
+            
+            plan["new_metadata"][row_id] = metadata
+            plan["changes"]["metadata"][row_id] = metadata
+            plan["new_state"][row_id] = {
+                "updated_at": self._timestamp_key(row.updated_at),
+                "hash": content_hash,
+                "text": text
+            }
+            # Re-embedar apenas se o conteúdo indexado mudou de fato
+            if previous is None or previous["hash"] != content_hash or row_id not in old_chunk_rows:
+                chunks = self.chunker.split(text)
+                plan["texts"].extend(chunks)
+                plan["ids_to_embed"].append(row_id)
+                plan["chunk_counts"].append(len(chunks))
+        
+        return plan
+
+    def _apply_collection(self, user_id: str, plan: Dict[str, Any], vectors: np.ndarray,
+                          lexical_only: bool = False) -> Dict[str, int]:
+        """
+        Aplica um plano de sincronização: remonta a matriz da coleção reaproveitando os
+        vetores inalterados e propaga as alterações para os índices de busca.
+        
+        Args:
+            user_id: ID do usuário
+            plan: Plano gerado por _plan_collection
+            vectors: Vetores dos trechos do plano, na mesma ordem
+            lexical_only: Se True, não há modelo de embedding: os textos vão apenas para o
+                          índice lexical e as linhas ficam marcadas para embedding posterior
+            
+        Returns:
+            Contadores de linhas adicionadas, alteradas, re-embedadas e removidas
+        """
+        counts = plan["counts"]
+        if plan["unchanged"]:
+            return counts
+        
+        store = plan["store"]
+        old_vectors = store[user_id]["vectors"]
+        old_chunks = store[user_id]["chunks"]
+        old_chunk_rows = plan["old_chunk_rows"]
+        new_state = plan["new_state"]
+        embedded = {}  # ID da linha -> matriz (trechos, dim)
+        offset = 0
+        for row_id, chunk_count in zip(plan["ids_to_embed"], plan["chunk_counts"]):
+            embedded[row_id] = vectors[offset:offset + chunk_count]
+            offset += chunk_count
+        
+        # Trechos antigos das linhas removidas ou re-embedadas saem do índice
+        plan["changes"]["stale_chunks"] = [
+            old_chunks[matrix_row]
+            for row_id in plan["changes"]["removed"] + plan["ids_to_embed"]
+            for matrix_row in old_chunk_rows.get(row_id, [])
+        ]
+        if lexical_only:
+            # Estado sem updated_at/hash: a próxima atualização com modelo re-embeda essas linhas
+            for row_id in plan["ids_to_embed"]:
+                new_state[row_id] = {**new_state[row_id], "updated_at": None, "hash": None}
+        else:
+            counts["embedded"] = len(embedded)
+            counts["chunks"] = len(plan["texts"])
+            plan["changes"]["vectors"] = embedded
+        
+        # Remontar a matriz na ordem atual reaproveitando os vetores inalterados
+        order = [row_id for row_id in plan["order"] if row_id in new_state]
+        blocks = []
+        chunk_ids = []
+        for row_id in order:
+            block = embedded[row_id] if row_id in embedded else old_vectors[old_chunk_rows[row_id]]
+            blocks.append(block)
+            chunk_ids.extend(f"{row_id}#{chunk}" for chunk in range(len(block)))
+        matrix = (np.vstack(blocks).astype(np.float32, copy=False) if blocks
+                  else np.zeros((0, self.embedding_dim), dtype=np.float32))
+        
+        with self._index_lock:
+            store[user_id] = {
+                "vectors": matrix,
+                "metadata": [plan["new_metadata"][row_id] for row_id in order],
+                "row_state": new_state,
+                "chunks": chunk_ids
+            }
+            if user_id in self.index_positions:
+                self.index_positions[user_id][plan["name"]] = {
+                    chunk_id: matrix_row for matrix_row, chunk_id in enumerate(chunk_ids)
+                }
+            self._apply_index_changes(user_id, plan["name"], plan["changes"])
+            self._bump_index_version(user_id)
+            
+            # O índice lexical usa o texto completo de cada linha (o BM25 normaliza pelo tamanho)
+            lexical_index = self.lexical_indexes.get(user_id)
+            if lexical_index is not None:
+                lexical_index.remove(self._index_key(plan["name"], row_id) for row_id in plan["changes"]["removed"])
+                lexical_index.add(
+                    [self._index_key(plan["name"], row_id) for row_id in plan["ids_to_embed"]],
+                    [new_state[row_id]["text"] for row_id in plan["ids_to_embed"]]
+                )
+        return counts
+
+    @staticmethod
+    def _index_key(collection: str, row_id: str) -> str:
+        """Chave de um documento ou trecho nos índices do usuário (ex.: "tasks:<id>", "tasks:<id>#0")."""
+        return f"{collection}:{row_id}"
+
+    @staticmethod
+    def _source_key(chunk_key: str) -> str:
+        """Chave do documento de origem de um trecho ("tasks:<id>#2" -> "tasks:<id>")."""
+        return chunk_key.split("#", 1)[0]
+
+    def _aggregate_chunks(self, matches: List[Tuple[str, float]]) -> List[Tuple[str, float]]:
+        """
+        Agrega os trechos encontrados por documento de origem, usando o maior score.
+        
+        Args:
+            matches: Lista de (chave do trecho, score) em ordem decrescente
+            
+        Returns:
+            Lista de (chave do documento, score) em ordem decrescente
+        """
+        best: Dict[str, float] = {}
+        for key, score in matches:
+            best.setdefault(self._source_key(key), score)  # O primeiro trecho já é o maior score
+        return list(best.items())
+
+    def _build_user_index(self, user_id: str) -> VectorIndex:
+        """Constrói o índice de busca do usuário a partir das coleções em memória."""
+        index = create_vector_index(self.index_backend, self.embedding_dim, storage=self.storage_dtype)
+        metadata_by_key = {}
+        positions = {}
+        for name, store, _, _ in self._collection_specs():
+            collection = store[user_id]
+            if collection["chunks"]:
+                index.add([self._index_key(name, chunk_id) for chunk_id in collection["chunks"]], collection["vectors"])
+            metadata_by_key.update(
+                (self._index_key(name, meta["id"]), meta) for meta in collection["metadata"]
+            )
+            positions[name] = {chunk_id: matrix_row for matrix_row, chunk_id in enumerate(collection["chunks"])}
+        
+        self.indexes[user_id] = index
+        self.index_metadata[user_id] = metadata_by_key
+        self.index_positions[user_id] = positions
+        return index
+
+    def _get_lexical_index(self, user_id: str) -> LexicalIndex:
+        """Retorna o índice BM25 do usuário, construindo-o a partir dos textos indexados."""
+        with self._index_lock:
+            index = self.lexical_indexes.get(user_id)
+            if index is None:
+                index = LexicalIndex(stopwords=STOPWORDS | DOCUMENT_LABELS)
+                for name, store, _, _ in self._collection_specs():
+                    collection = store[user_id]
+                    index.add(
+                        [self._index_key(name, meta["id"]) for meta in collection["metadata"]],
+                        [collection["row_state"].get(meta["id"], {}).get("text", "") for meta in collection["metadata"]]
+                    )
+                self.lexical_indexes[user_id] = index
+            return index
+
+    def _drop_user_indexes(self, user_id: str):
+        """Descarta os índices de busca do usuário; são reconstruídos na próxima consulta."""
+        with self._index_lock:
+            self.indexes.pop(user_id, None)
+            self.index_metadata.pop(user_id, None)
+            self.index_positions.pop(user_id, None)
+            self.lexical_indexes.pop(user_id, None)
+            self._bump_index_version(user_id)
+
+    def _bump_index_version(self, user_id: str):
+        """Incrementa a versão do índice do usuário e descarta seus contextos em cache."""
+        with self._index_lock:
+            self.index_versions[user_id] = self.index_versions.get(user_id, 0) + 1
+        self.context_cache.invalidate_user(user_id)
+
+    def _exact_vectors(self, user_id: str, keys: List[str]) -> np.ndarray:
+        """
+        Vetores float32 originais (memory-mapped após o primeiro salvamento) das chaves de
+        trechos informadas, usados no rescoring de índices quantizados.
+        """
+        stores = {name: store for name, store, _, _ in self._collection_specs()}
+        positions = self.index_positions[user_id]
+        rows = []
+        for key in keys:
+            name, row_id = key.split(":", 1)
+            rows.append(stores[name][user_id]["vectors"][positions[name][row_id]])
+        return np.stack(rows).astype(np.float32, copy=False)
+
+    def _get_user_index(self, user_id: str) -> VectorIndex:
+        """Retorna o índice do usuário, construindo-o na primeira consulta."""
+        with self._index_lock:
+            index = self.indexes.get(user_id)
+            if index is None:
+                index = self._build_user_index(user_id)
+            return index
+
+    def _apply_index_changes(self, user_id: str, collection: str, changes: Dict[str, Any]):
+        """
+        Aplica incrementalmente as alterações de uma coleção ao índice do usuário.
+        Se o índice ainda não foi construído, ele será montado na próxima consulta.
+        """
+        with self._index_lock:
+            index = self.indexes.get(user_id)
+            if index is None:
+                return
+            self._apply_changes_to_index(index, self.index_metadata[user_id], collection, changes)
+
+    def _apply_changes_to_index(self, index: VectorIndex, metadata_by_key: Dict[str, Dict[str, Any]],
+                                collection: str, changes: Dict[str, Any]):
+        """Remove, atualiza e adiciona as entradas (trechos) de uma coleção no índice."""
+        index.remove([self._index_key(collection, chunk_id) for chunk_id in changes["stale_chunks"]])
+        for row_id in changes["removed"]:
+            metadata_by_key.pop(self._index_key(collection, row_id), None)
+        
+        for row_id, metadata in changes["metadata"].items():
+            metadata_by_key[self._index_key(collection, row_id)] = metadata
+        
+        if changes["vectors"]:
+            keys = [
+                self._index_key(collection, f"{row_id}#{chunk}")
+                for row_id, block in changes["vectors"].items() for chunk in range(len(block))
+            ]
+            index.add(keys, np.vstack(list(changes["vectors"].values())))
+
+    def _user_lock(self, user_id: str) -> threading.Lock:
+        """Lock que serializa as atualizações do vectorstore de um usuário."""
+        with self._user_locks_guard:
+            return self._user_locks.setdefault(user_id, threading.Lock())
+
     def update_user_vectorstore(self, user_id: str, db: Session, force: bool = False):
         """
         Atualiza o armazenamento de vetores para um usuário específico.
         Coleta tarefas, projetos e histórico de chat recentes e cria embeddings.
         
+        No modo incremental (padrão), apenas linhas novas ou alteradas são re-embedadas e
+        os vetores de linhas excluídas são removidos, de modo que o custo de cada
+        atualização é proporcional ao número de linhas modificadas.
+        
         Args:
             user_id: ID do usuário
             db: Sessão do banco de dados
             force: Se True, força atualização mesmo se cache for recente
         """
+        self.update_users_vectorstores([(user_id, force)], db)
+
+    def update_users_vectorstores(self, requests: List[Tuple[str, bool]], db: Session) -> Dict[str, Optional[Exception]]:
+        """
+        Atualiza o vectorstore de vários usuários com uma única passada de embedding.
+        
+        Os textos pendentes de todos os usuários e coleções são reunidos e codificados
+        juntos (em lotes dimensionados por tokens) e depois redistribuídos por usuário.
+        
+        Args:
+            requests: Lista de (user_id, force)
+            db: Sessão do banco de dados
+            
+        Returns:
+            Erro de cada usuário (None quando a atualização foi concluída)
+        """
+        errors: Dict[str, Optional[Exception]] = {}
+        forces: Dict[str, bool] = {}
+        for user_id, force in requests:
+            forces[user_id] = forces.get(user_id, False) or force
+        
+        # Locks adquiridos em ordem fixa para evitar deadlock entre threads do worker
+        user_ids = sorted(forces)
+        locks = [self._user_lock(user_id) for user_id in user_ids]
+        for lock in locks:
+            lock.acquire()
+        try:
+            plans = []
+            for user_id in user_ids:
+                try:
+                    plan = self._prepare_user_update(user_id, db, forces[user_id])
+                    errors[user_id] = None
+                    if plan is not None:
+                        plans.append(plan)
+                except Exception as e:
+                    logger.error(f"Erro ao atualizar vectorstore: {str(e)}")
+                    self._ensure_user_structures(user_id)
+                    errors[user_id] = e
+            
+            if not plans:
+                return errors
+            
+            # Uma única chamada de embedding para todos os usuários e coleções
+            texts = [
+                text for plan in plans if not plan["lexical_only"]
+                for collection in plan["collections"] for text in collection["texts"]
+            ]
+            try:
+                vectors = self._encode_texts(texts) if texts else np.zeros((0, self.embedding_dim), dtype=np.float32)
+            except Exception as e:
+                logger.error(f"Erro ao atualizar vectorstore: {str(e)}")
+                for plan in plans:
+                    errors[plan["user_id"]] = e
+                return errors
+            
+            offset = 0
+            for plan in plans:
+                user_vectors = []
+                for collection in plan["collections"]:
+                    if plan["lexical_only"]:
+                        user_vectors.append(np.zeros((len(collection["texts"]), self.embedding_dim), dtype=np.float32))
+                        continue
+                    user_vectors.append(vectors[offset:offset + len(collection["texts"])])
+                    offset += len(collection["texts"])
+                try:
+                    self._complete_user_update(plan, user_vectors)
+                except Exception as e:
+                    logger.error(f"Erro ao atualizar vectorstore: {str(e)}")
+                    # Garantir que há uma entrada vazia para evitar erros futuros
+                    self._ensure_user_structures(plan["user_id"])
+                    errors[plan["user_id"]] = e
+            return errors
+        finally:
+            for lock in reversed(locks):
+                lock.release()
+
+    def _prepare_user_update(self, user_id: str, db: Session, force: bool) -> Optional[Dict[str, Any]]:
+        """
+        Verifica o TTL e planeja a atualização do usuário (deve ser chamado com o lock do usuário).
+        
+        Returns:
+            Plano da atualização ou None se o cache ainda é válido
+        """
         # Garantir que as estruturas de dados do usuário estão inicializadas
         self._ensure_user_structures(user_id)
         
@@ -166,145 +1121,173 @@ class VectorStoreService:
             last_update_time = self.last_update.get(user_id, 0)
             if current_time - last_update_time < self.cache_ttl:
                 logger.info(f"Usando cache de vetores para o usuário {user_id} (atualizado há {current_time - last_update_time:.1f}s)")
-                return
+                return None
         
         logger.info(f"Atualizando vectorstore para o usuário {user_id}")
-        start_time = time.time()
         
+        # Garantir que o modelo de embedding está disponível (roda na thread do worker;
+        # aguarda o aquecimento se ele estiver em andamento)
+        self._load_model()
+        # A troca para o backend de fallback descarta os usuários residentes
+        self._ensure_user_structures(user_id)
+        
+        lexical_only = self.embedding_model is None
+        if lexical_only:
+            logger.warning(f"Modelo de embedding indisponível: atualizando apenas o índice lexical do usuário {user_id}")
+        
+        # Sem o modo incremental, descartar o estado e reconstruir tudo
+        if not self.incremental_indexing:
+            with self._index_lock:
+                for _, store, _, _ in self._collection_specs():
+                    store[user_id] = self._empty_collection()
+                self._drop_user_indexes(user_id)
+        
+        return {
+            "user_id": user_id,
+            "start_time": current_time,
+            "lexical_only": lexical_only,
+            "collections": [
+                self._plan_collection(name, store, user_id, model, build_document, db)
+                for name, store, model, build_document in self._collection_specs()
+            ]
+        }
+
+    def _complete_user_update(self, plan: Dict[str, Any], vectors: List[np.ndarray]):
+        """Aplica os vetores calculados ao plano do usuário e persiste o resultado."""
+        user_id = plan["user_id"]
+        summary = {}
+        for collection, collection_vectors in zip(plan["collections"], vectors):
+            summary[collection["name"]] = self._apply_collection(
+                user_id, collection, collection_vectors, lexical_only=plan["lexical_only"]
+            )
+        
+        # Atualizar timestamp
+        self.last_update[user_id] = plan["start_time"]
+        
+        # Salvar em disco apenas as coleções alteradas (e, nelas, o estado das linhas alteradas)
+        self._save_user_vectors(user_id, {
+            collection["name"]: list(collection["changes"]["metadata"])
+            for collection in plan["collections"] if not collection["unchanged"]
+        })
+        self._save_embeddings_to_disk()
+        self._touch_user(user_id)
+        
+        logger.info(f"Vectorstore atualizado para usuário {user_id}. "
+                   f"Tarefas: {summary['tasks']}, Projetos: {summary['projects']}, "
+                   f"Chats: {summary['chats']}. "
+                   f"Cache de embeddings: {self.embedding_cache.stats()}. "
+                   f"Tempo: {time.time() - plan['start_time']:.2f}s")
+    
+    def _user_resident_bytes(self, user_id: str) -> int:
+        """
+        Memória anônima ocupada pelo usuário: matrizes em RAM e o índice de busca.
+        Vetores memory-mapped não contam, pois vivem no page cache e podem ser descartados.
+        """
+        total = 0
+        for _, store, _, _ in self._collection_specs():
+            vectors = store.get(user_id, {}).get("vectors")
+            if vectors is not None and not isinstance(vectors, np.memmap):
+                total += vectors.nbytes
+        index = self.indexes.get(user_id)
+        if index is not None:
+            total += index.nbytes
+        return total
+
+    def _touch_user(self, user_id: str):
+        """Marca o usuário como usado recentemente e aplica o orçamento de memória."""
+        with self._index_lock:
+            self._access_order[user_id] = None
+            self._access_order.move_to_end(user_id)
+        if self.max_resident_users or self.max_resident_mb:
+            self._enforce_memory_budget(keep=user_id)
+
+    @contextmanager
+    def _pin_user(self, user_id: str):
+        """Impede a evicção do usuário enquanto uma consulta lê suas estruturas."""
+        with self._index_lock:
+            self._pinned_users[user_id] = self._pinned_users.get(user_id, 0) + 1
         try:
-            # Buscar tarefas do usuário
-            tasks = db.query(Task).filter(Task.user_id == user_id).all()
-            
-            # Buscar projetos do usuário
-            projects = db.query(Project).filter(Project.user_id == user_id).all()
-            
-            # Buscar histórico de chat recente
-            chat_history = db.query(ChatHistory).filter(
-                ChatHistory.user_id == user_id
-            ).order_by(ChatHistory.created_at.desc()).limit(50).all()
-            
-            # Processar tarefas
-            task_texts = []
-            task_metadata = []
-            for task in tasks:
-                text = f"Tarefa: {task.title}. "
-                if task.description:
-                    text += f"Descrição: {task.description}. "
-                text += f"Status: {task.status}. Prioridade: {task.priority}."
-                
-                task_texts.append(text)
-                task_metadata.append({
-                    "id": str(task.id),
-                    "title": task.title,
-                    "status": task.status,
-                    "priority": task.priority,
-                    "type": "task"
-                })
-            
-            # Processar projetos
-            project_texts = []
-            project_metadata = []
-            for project in projects:
-                text = f"Projeto: {project.title}. "
-                if project.description:
-                    text += f"Descrição: {project.description}. "
-                
-                project_texts.append(text)
-                project_metadata.append({
-                    "id": str(project.id),
-                    "name": project.title,
-                    "type": "project"
-                })
-            
-            # Processar histórico de chat
-            chat_texts = []
-            chat_metadata = []
-            for chat in chat_history:
-                # Combinar pergunta e resposta em um único texto para contexto
-                text = f"Pergunta: {chat.user_message} Resposta: {chat.ai_response}"
-                
-                chat_texts.append(text)
-                chat_metadata.append({
-                    "id": str(chat.id),
-                    "tags": chat.tags,
-                    "created_at": chat.created_at.isoformat() if hasattr(chat.created_at, 'isoformat') else str(chat.created_at),
-                    "type": "chat"
-                })
-            
-            # Garantir que o modelo de embedding está disponível
-            if self.embedding_model is None:
-                try:
-                    from sentence_transformers import SentenceTransformer
-                    self.embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
-                    logger.info("Modelo de embedding inicializado com sucesso.")
-                except Exception as e:
-                    logger.warning(f"Erro ao inicializar modelo de embedding: {str(e)}")
-                    self.embedding_model = None
-             
-            # Processar embeddings com ou sem modelo
-            if self.embedding_model:
-                # Processar tarefas
-                if task_texts:
-                    task_vectors = self.embedding_model.encode(task_texts)
-                    self.task_embeddings[user_id] = {
-                        "vectors": task_vectors,
-                        "metadata": task_metadata
-                    }
+            yield
+        finally:
+            with self._index_lock:
+                remaining = self._pinned_users[user_id] - 1
+                if remaining:
+                    self._pinned_users[user_id] = remaining
                 else:
-                    self.task_embeddings[user_id] = {"vectors": np.array([]), "metadata": []}
-
-                # Processar projetos
-                if project_texts:
-                    project_vectors = self.embedding_model.encode(project_texts)
-                    self.project_embeddings[user_id] = {
-                        "vectors": project_vectors,
-                        "metadata": project_metadata
-                    }
-                else:
-                    self.project_embeddings[user_id] = {"vectors": np.array([]), "metadata": []}
-                
-                if chat_texts and self.embedding_model is not None:
-                    chat_vectors = self.embedding_model.encode(chat_texts)
-                    self.chat_embeddings[user_id] = {
-                        "vectors": chat_vectors,
-                        "metadata": chat_metadata
-                    }
-                else:
-                    self.chat_embeddings[user_id] = {"vectors": np.array([]), "metadata": chat_metadata if chat_metadata else []}
-            
-            # Atualizar timestamp
-            self.last_update[user_id] = current_time
-            
-            # Salvar cache em disco
-            self._save_embeddings_to_disk()
-            
-            logger.info(f"Vectorstore atualizado para usuário {user_id}. "
-                       f"Tarefas: {len(task_texts)}, Projetos: {len(project_texts)}, "
-                       f"Chats: {len(chat_texts)}. "
-                       f"Tempo: {time.time() - start_time:.2f}s")
-                
-        except Exception as e:
-            logger.error(f"Erro ao atualizar vectorstore: {str(e)}")
-            # Garantir que há uma entrada vazia para evitar erros futuros
-            self._ensure_user_structures(user_id)
-            
-    def _ensure_user_structures(self, user_id: str):
+                    del self._pinned_users[user_id]
+
+    def _enforce_memory_budget(self, keep: str):
         """
-        Garante que as estruturas básicas existem para um usuário.
+        Remove da memória os usuários menos consultados recentemente até caber no orçamento.
+        Usuários com atualização (lock ocupado) ou consulta (fixados) em andamento e o
+        usuário atual são preservados. A memória total é somada uma única vez e descontada
+        a cada evicção.
         """
-        if user_id not in self.task_embeddings:
-            self.task_embeddings[user_id] = {"vectors": np.array([]), "metadata": []}
-        
-        if user_id not in self.project_embeddings:
-            self.project_embeddings[user_id] = {"vectors": np.array([]), "metadata": []}
-            
-        if user_id not in self.chat_embeddings:
-            self.chat_embeddings[user_id] = {"vectors": np.array([]), "metadata": []}
-    
+        budget_bytes = self.max_resident_mb * 1024 * 1024 if self.max_resident_mb else None
+        with self._index_lock:
+            total_bytes = (sum(self._user_resident_bytes(user_id) for user_id in self._access_order)
+                           if budget_bytes is not None else 0)
+            for user_id in list(self._access_order):
+                over_users = bool(self.max_resident_users) and len(self._access_order) > self.max_resident_users
+                over_bytes = budget_bytes is not None and total_bytes > budget_bytes
+                if not over_users and not over_bytes:
+                    break
+                if user_id == keep or user_id in self._pinned_users:
+                    continue
+                lock = self._user_lock(user_id)
+                if not lock.acquire(blocking=False):
+                    continue
+                try:
+                    user_bytes = self._user_resident_bytes(user_id) if budget_bytes is not None else 0
+                    self._evict_user(user_id)
+                    total_bytes -= user_bytes
+                finally:
+                    lock.release()
+
+    def _evict_user(self, user_id: str):
+        """
+        Descarta os vetores e o índice do usuário da memória. Os vetores já estão
+        persistidos em disco e são recarregados por _ensure_user_structures no próximo acesso.
+        """
+        for _, store, _, _ in self._collection_specs():
+            store.pop(user_id, None)
+        self._drop_user_indexes(user_id)
+        self._access_order.pop(user_id, None)
+        self.evictions += 1
+        logger.info(f"Vetores do usuário {user_id} removidos da memória (orçamento de memória)")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Estatísticas de memória do vectorstore: usuários residentes, bytes e evicções."""
+        with self._index_lock:
+            resident_users = list(self._access_order)
+            resident_bytes = sum(self._user_resident_bytes(user_id) for user_id in resident_users)
+            return {
+                "resident_users": len(resident_users),
+                "resident_bytes": resident_bytes,
+                "resident_mb": round(resident_bytes / (1024 * 1024), 3),
+                "max_resident_users": self.max_resident_users,
+                "max_resident_mb": self.max_resident_mb,
+                "evictions": self.evictions,
+                "embedding_backend": self.model_name,
+                "embedding_fallback": self.fallback_active,
+                "index_backend": self.index_backend,
+                "hybrid_retrieval": self.hybrid_retrieval,
+                "chunking": dict(zip(["max_tokens", "overlap_tokens", "max_chunks"], self.chunker.config)),
+                "storage_dtype": self.storage_dtype,
+                "rescore": self.rescore_enabled,
+                "embedding_cache": self.embedding_cache.stats(),
+                "query_cache": self.query_cache.stats(),
+                "context_cache": self.context_cache.stats()
+            }
+
     def retrieve_relevant_context(self, user_id: str, query: str, max_results: int = 5) -> List[Dict[str, Any]]:
         """
         Recupera contexto relevante para uma consulta.
         
+        A busca vetorial é combinada com o BM25 por fusão de postos recíprocos (RRF), e o
+        "score" de cada resultado passa a ser o score fundido. Sem modelo de embedding,
+        os resultados vêm apenas do BM25.
+        
         Args:
             user_id: ID do usuário
             query: Consulta para buscar contexto relevante
@@ -313,70 +1296,63 @@ class VectorStoreService:
         Returns:
             Lista de metadados de documentos relevantes
         """
+        # Fixado durante a consulta: a evicção por outro usuário não remove as estruturas
+        # entre o carregamento e a leitura do índice
+        with self._pin_user(user_id):
+            return self._retrieve_pinned(user_id, query, max_results)
+
+    def _retrieve_pinned(self, user_id: str, query: str, max_results: int) -> List[Dict[str, Any]]:
+        """Corpo de retrieve_relevant_context, executado com o usuário fixado."""
         # Garantir que as estruturas existem
         self._ensure_user_structures(user_id)
+        self._touch_user(user_id)
         
-        # Se não temos modelo de embedding, retornar alguns metadados sem vetorização
-        if self.embedding_model is None:
-            logger.warning("Modelo de embedding não disponível. Retornando contexto limitado sem similaridade.")
-            # Retornar alguns metadados sem vetorização (limitado por max_results)
-            results = []
-            
-            # Adicionar tarefas se disponíveis
-            if user_id in self.task_embeddings and self.task_embeddings[user_id]["metadata"]:
-                results.extend(self.task_embeddings[user_id]["metadata"][:max_results//2])
-                
-            # Adicionar projetos se disponíveis e ainda há espaço
-            if user_id in self.project_embeddings and self.project_embeddings[user_id]["metadata"]:
-                remaining = max_results - len(results)
-                results.extend(self.project_embeddings[user_id]["metadata"][:remaining])
-                
-            return results[:max_results]
-            
         if user_id not in self.task_embeddings:
             logger.warning(f"Nenhum dado de embedding encontrado para o usuário {user_id}")
             return []
             
         try:
-            # Criar embedding para a consulta
-            query_vector = self._create_embedding(query)
-            
-            # Combinar todos os vetores e metadados
-            all_vectors = []
-            all_metadata = []
-            
-            if user_id in self.task_embeddings and len(self.task_embeddings[user_id]["vectors"]) > 0:
-                all_vectors.append(self.task_embeddings[user_id]["vectors"])
-                all_metadata.extend(self.task_embeddings[user_id]["metadata"])
-                
-            if user_id in self.project_embeddings and len(self.project_embeddings[user_id]["vectors"]) > 0:
-                all_vectors.append(self.project_embeddings[user_id]["vectors"])
-                all_metadata.extend(self.project_embeddings[user_id]["metadata"])
-                
-            if user_id in self.chat_embeddings and len(self.chat_embeddings[user_id]["vectors"]) > 0:
-                all_vectors.append(self.chat_embeddings[user_id]["vectors"])
-                all_metadata.extend(self.chat_embeddings[user_id]["metadata"])
-            
-            if not all_vectors:
+            # O índice vetorial também mantém o mapa chave -> metadados do usuário
+            index = self._get_user_index(user_id)
+            if len(index) == 0:
                 return []
-                
-            # Concatenar todos os vetores
-            combined_vectors = np.vstack(all_vectors)
             
-            # Calcular similaridade de cosseno
-            similarity_scores = np.dot(combined_vectors, query_vector) / (
-                np.linalg.norm(combined_vectors, axis=1) * np.linalg.norm(query_vector)
-            )
+            # Se não temos modelo de embedding, ranquear apenas por BM25 (e iniciar o carregamento)
+            if self.embedding_model is None:
+                logger.warning("Modelo de embedding não disponível. Usando apenas a busca lexical (BM25).")
+                if self.model_status == "not_loaded":
+                    self.start_warmup()
+                with self._index_lock:
+                    metadata_by_key = self.index_metadata[user_id]
+                    matches = self._get_lexical_index(user_id).search(query, max_results)
+                    return [{**metadata_by_key[key], "score": score} for key, score in matches]
             
-            # Ordenar por similaridade e pegar os top N
-            top_indices = np.argsort(similarity_scores)[::-1][:max_results]
+            # Criar embedding para a consulta
+            query_vector = self._embed_query(query)
             
-            # Criar resultado com metadados e scores
-            results = [
-                {**all_metadata[idx], "score": float(similarity_scores[idx])}
-                for idx in top_indices
-                if similarity_scores[idx] > 0.3  # Threshold mínimo de similaridade
-            ]
+            # O threshold é aplicado no índice, antes de materializar os metadados
+            with self._index_lock:
+                metadata_by_key = self.index_metadata[user_id]
+                rescore = None
+                if self.rescore_enabled and index.quantized:
+                    rescore = lambda keys: self._exact_vectors(user_id, keys)
+                limit = self.hybrid_candidates if self.hybrid_retrieval else max_results
+                chunk_matches = index.search(
+                    query_vector, limit * self.chunk_search_factor,
+                    min_score=self.similarity_threshold, rescore=rescore
+                )
+                # Um documento longo aparece uma vez, com o score do seu melhor trecho
+                matches = self._aggregate_chunks(chunk_matches)[:limit]
+                
+                # Busca híbrida: fundir o ranking vetorial com o BM25 (termos exatos, datas, códigos)
+                if self.hybrid_retrieval:
+                    lexical_matches = self._get_lexical_index(user_id).search(query, self.hybrid_candidates)
+                    matches = reciprocal_rank_fusion(
+                        [[key for key, _ in matches], [key for key, _ in lexical_matches]], k=self.rrf_k
+                    )[:max_results]
+                
+                # Criar resultado com metadados e scores
+                results = [{**metadata_by_key[key], "score": score} for key, score in matches]
             
             logger.info(f"Consulta '{query[:30]}...': Encontrados {len(results)} resultados relevantes")
             return results
@@ -385,19 +1361,55 @@ class VectorStoreService:
             logger.error(f"Erro ao recuperar contexto: {str(e)}")
             return []
     
-    def get_formatted_context(self, user_id: str, query: str) -> str:
+    def _query_bucket(self, query: str) -> str:
         """
-        Retorna contexto formatado para uso em prompts do LLM.
+        Bucket de uma consulta para o cache de contexto: SimHash do embedding (sinais das
+        projeções em hiperplanos aleatórios fixos), de modo que consultas equivalentes com
+        grafias diferentes caem no mesmo bucket. Sem modelo, usa o texto normalizado.
         
         Args:
-            user_id: ID do usuário
-            query: Consulta para buscar contexto relevante
+            query: Texto da consulta
             
         Returns:
-            String formatada com contexto relevante
+            Identificador do bucket
         """
-        results = self.retrieve_relevant_context(user_id, query)
+        if self.embedding_model is None:
+            return "t:" + self._normalize_query(query)
         
+        query_vector = self._embed_query(query)
+        planes = self._bucket_planes
+        if planes is None or planes.shape[1] != len(query_vector):
+            planes = np.random.default_rng(0).standard_normal(
+                (self.context_bucket_bits, len(query_vector))
+            ).astype(np.float32)
+            self._bucket_planes = planes
+        return "v:" + np.packbits(planes @ query_vector > 0).tobytes().hex()
+
+    def _cached_context(self, user_id: str, query: str, kind: str) -> str:
+        """
+        Retorna o contexto formatado ("context") ou o prefixo já montado da mensagem
+        ("prefix"), reaproveitando o cache enquanto a versão do índice não muda.
+        """
+        # Carregar os vetores do disco antes de ler a versão (o carregamento a incrementa)
+        with self._pin_user(user_id):
+            self._ensure_user_structures(user_id)
+            version = self.index_versions.get(user_id, 0)
+            key = (user_id, version, self._query_bucket(query), kind)
+            cached = self.context_cache.get(key)
+            if cached is not None:
+                self._touch_user(user_id)
+                return cached
+        
+        context = self._format_context(self.retrieve_relevant_context(user_id, query))
+        value = f"{context}\n\nPergunta: " if kind == "prefix" and context else context
+        # Contexto vazio não é armazenado: pode ser resultado de um erro na busca
+        if value:
+            self.context_cache.put(key, value)
+        return value
+
+    @staticmethod
+    def _format_context(results: List[Dict[str, Any]]) -> str:
+        """Formata os resultados da busca como bloco de contexto para o prompt."""
         if not results:
             return ""
             
@@ -419,6 +1431,33 @@ class VectorStoreService:
                 )
         
         return "\n".join(context_parts)
+
+    def get_formatted_context(self, user_id: str, query: str) -> str:
+        """
+        Retorna contexto formatado para uso em prompts do LLM.
+        
+        Args:
+            user_id: ID do usuário
+            query: Consulta para buscar contexto relevante
+            
+        Returns:
+            String formatada com contexto relevante
+        """
+        return self._cached_context(user_id, query, "context")
+
+    def get_context_prefix(self, user_id: str, query: str) -> str:
+        """
+        Retorna o prefixo da mensagem do usuário já montado (contexto + "Pergunta: "),
+        para o streaming apenas concatenar o conteúdo original.
+        
+        Args:
+            user_id: ID do usuário
+            query: Consulta para buscar contexto relevante
+            
+        Returns:
+            Prefixo pronto ou string vazia se não há contexto relevante
+        """
+        return self._cached_context(user_id, query, "prefix")
     
     def healthcheck(self) -> bool:
         """Verifica se o serviço está funcionando corretamente."""
@@ -427,5 +1466,10 @@ class VectorStoreService:
             
         return True
 
-# Instância global para uso em toda a aplicação
-vector_store_service = VectorStoreService()
+# Instância global para uso em toda a aplicação. Com VECTOR_STORE_URL, o vectorstore roda
+# em processos próprios (app.vector_store_server) e os workers da API usam um cliente leve
+if os.getenv("VECTOR_STORE_URL"):
+    from app.services.vector_store_client import RemoteVectorStore
+    vector_store_service = RemoteVectorStore(os.getenv("VECTOR_STORE_URL"))
+else:
+    vector_store_service = VectorStoreService()
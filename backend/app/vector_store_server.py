@@ -0,0 +1,162 @@
+"""
+Servidor de vectorstore compartilhado pelos workers da API.
+
+Cada shard é um processo próprio que carrega o modelo de embedding uma única vez e
+mantém os vetores e índices dos usuários cujo hash do user_id cai nele. Os workers
+da API usam app.services.vector_store_client.RemoteVectorStore (VECTOR_STORE_URL),
+de modo que a memória não cresce com o número de workers do uvicorn.
+
+Uso (a partir de backend/):
+    python -m app.vector_store_server --shards 2 --socket-dir /tmp/orga-vectors
+    python -m app.vector_store_server --shards 2 --host 127.0.0.1 --port 8601
+
+O comando imprime o valor de VECTOR_STORE_URL a configurar nos workers da API.
+"""
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+# Os shards sempre usam o vectorstore local (nunca o cliente remoto) e recebem as
+# atualizações da captura de alterações de todos os workers da API (TTL longo)
+os.environ.pop("VECTOR_STORE_URL", None)
+os.environ["VECTOR_STORE_SHARED_SERVER"] = "true"
+
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+from app.models.all_models import *  # Registra todos os modelos (relacionamentos do ORM)
+from app.services.vector_store_service import vector_store_service
+from app.services.embedding_worker import embedding_worker
+
+logger = logging.getLogger("Orga.AI.vector_store")
+
+app = FastAPI(title="Orga.AI Vector Store", docs_url=None, redoc_url=None)
+
+class RefreshRequest(BaseModel):
+    users: List[Tuple[str, bool]]
+
+class QueryItem(BaseModel):
+    user_id: str
+    query: str
+    max_results: int = 5
+    kind: str = "results"  # "results", "context" (formatado) ou "prefix" (prefixo da mensagem)
+
+class QueryRequest(BaseModel):
+    queries: List[QueryItem]
+
+@app.on_event("startup")
+async def warmup_embedding_model():
+    """Carrega o modelo de embedding em segundo plano"""
+    vector_store_service.start_warmup()
+
+@app.on_event("shutdown")
+async def shutdown_embedding_worker():
+    """Encerra o pool de threads do worker de embeddings"""
+    embedding_worker.shutdown()
+
+@app.post("/refresh")
+async def refresh(request: RefreshRequest) -> Dict[str, Dict[str, Optional[str]]]:
+    """
+    Atualiza o vectorstore dos usuários informados pelo worker de embeddings do shard
+    (pedidos concorrentes são coalescidos e embedados em lote).
+    """
+    user_ids = [user_id for user_id, _ in request.users]
+    outcomes = await asyncio.gather(
+        *(embedding_worker.refresh(user_id, force=force) for user_id, force in request.users),
+        return_exceptions=True
+    )
+    return {"errors": {
+        user_id: str(outcome) if isinstance(outcome, BaseException) else None
+        for user_id, outcome in zip(user_ids, outcomes)
+    }}
+
+def _run_queries(queries: List[QueryItem]) -> List[Any]:
+    """Executa um lote de consultas (fora do event loop)."""
+    results = []
+    for item in queries:
+        if item.kind == "context":
+            results.append(vector_store_service.get_formatted_context(item.user_id, item.query))
+        elif item.kind == "prefix":
+            results.append(vector_store_service.get_context_prefix(item.user_id, item.query))
+        else:
+            results.append(vector_store_service.retrieve_relevant_context(item.user_id, item.query, item.max_results))
+    return results
+
+@app.post("/query")
+async def query(request: QueryRequest) -> Dict[str, List[Any]]:
+    """Executa um lote de consultas enviado por um cliente."""
+    return {"results": await asyncio.to_thread(_run_queries, request.queries)}
+
+@app.get("/ready")
+async def ready():
+    """Readiness do shard: 200 com o modelo carregado, 503 enquanto não está"""
+    readiness = vector_store_service.readiness()
+    return JSONResponse(status_code=200 if readiness["ready"] else 503, content=readiness)
+
+@app.get("/stats")
+async def stats() -> Dict[str, Any]:
+    """Estatísticas de memória, caches e fila de embeddings do shard"""
+    return {**vector_store_service.get_stats(), "embedding_worker": embedding_worker.stats()}
+
+@app.get("/health")
+async def health() -> Dict[str, str]:
+    return {"status": "healthy"}
+
+def _serve_shard(shard: int, shards: int, uds: Optional[str], host: str, port: int):
+    """Executa um shard (processo filho)."""
+    import uvicorn
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format=f'%(asctime)s - shard {shard}/{shards} - %(name)s - %(levelname)s - %(message)s'
+    )
+    if uds:
+        uvicorn.run(app, uds=uds, log_level="info")
+    else:
+        uvicorn.run(app, host=host, port=port, log_level="info")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--shards", type=int, default=int(os.getenv("VECTOR_STORE_SHARDS", "1")))
+    parser.add_argument("--socket-dir", help="Diretório dos Unix sockets (um por shard)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8601, help="Porta do primeiro shard (os demais usam as seguintes)")
+    args = parser.parse_args()
+
+    if args.socket_dir:
+        os.makedirs(args.socket_dir, exist_ok=True)
+    targets = []
+    for shard in range(args.shards):
+        if args.socket_dir:
+            uds = os.path.join(args.socket_dir, f"shard-{shard}.sock")
+            if os.path.exists(uds):
+                os.remove(uds)
+            targets.append((uds, f"unix://{uds}"))
+        else:
+            targets.append((None, f"http://{args.host}:{args.port + shard}"))
+    print(f"VECTOR_STORE_URL={','.join(url for _, url in targets)}", flush=True)
+
+    # "spawn": cada shard importa a aplicação do zero (sem herdar estado do processo pai)
+    context = multiprocessing.get_context("spawn")
+    processes = [
+        context.Process(
+            target=_serve_shard, args=(shard, args.shards, uds, args.host, args.port + shard),
+            name=f"vector-store-shard-{shard}"
+        )
+        for shard, (uds, _) in enumerate(targets)
+    ]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.terminate()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+"""
+Benchmark do limite de concorrência das gerações: limites fixos x limite adaptativo.
+
+Sobe um servidor Ollama simulado (aiohttp, /api/chat sem streaming) que reproduz o
+comportamento de um host real:
+- até num_parallel gerações são processadas ao mesmo tempo (OLLAMA_NUM_PARALLEL); as
+  demais aguardam na fila interna do Ollama
+- a vazão agregada com n gerações ativas é single_tps * n ** batch_exponent, repartida
+  igualmente entre elas (expoente perto de 1: GPU que ganha com lotes; perto de 0: CPU
+  saturada, em que gerações paralelas só dividem o mesmo processador)
+- cada geração processa o prompt (prefill) antes do primeiro token e depois gera um
+  número aleatório de tokens; a resposta traz eval_count/eval_duration como o Ollama
+
+Clientes em malha fechada (cada um envia a próxima requisição ao receber a anterior)
+passam pelo QueueService, com a mesma chamada e o mesmo registro de métricas de
+AIService._agenerate. Para cada perfil de host, compara os limites fixos com o
+AdaptiveConcurrencyLimiter: vazão (tokens/s), latência de ponta a ponta, TTFT e limite
+médio. O tempo é comprimido por --time-scale; os valores são reportados em segundos
+simulados.
+
+Uso (a partir de backend/):
+    python3 -m benchmarks.bench_concurrency
+    python3 -m benchmarks.bench_concurrency --profiles cpu --fixed 1 2 3 4 --duration 1200
+    python3 -m benchmarks.bench_concurrency --output concurrency.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import platform
+import random
+import subprocess
+import time
+from collections import deque
+from datetime import datetime, timezone
+
+import httpx
+from aiohttp import web
+
+from app.services.concurrency_limiter import AdaptiveConcurrencyLimiter, ollama_generation_metrics
+from app.services.queue_service import QueueService
+
+# Perfis de host: (num_parallel, tokens/s de uma geração isolada, expoente de lote, prefill em s)
+PROFILES = {
+    "gpu": {"num_parallel": 4, "single_tps": 60.0, "batch_exponent": 0.75, "prefill_seconds": 0.3},
+    "cpu": {"num_parallel": 4, "single_tps": 12.0, "batch_exponent": 0.15, "prefill_seconds": 1.0},
+    "wide": {"num_parallel": 8, "single_tps": 40.0, "batch_exponent": 0.9, "prefill_seconds": 0.5},
+}
+
+class SimulatedOllama:
+    """
+    Simulação por eventos de um servidor Ollama com compartilhamento de processamento.
+
+    O trabalho de cada geração é medido em "tokens equivalentes": o prefill vale
+    prefill_seconds * single_tps e cada token gerado vale 1. Todas as gerações ativas
+    avançam à mesma taxa (vazão agregada / n).
+    """
+
+    def __init__(self, profile, time_scale, min_tokens, max_tokens, seed):
+        self.num_parallel = profile["num_parallel"]
+        self.single_tps = profile["single_tps"]
+        self.batch_exponent = profile["batch_exponent"]
+        self.prefill_work = profile["prefill_seconds"] * profile["single_tps"]
+        self.time_scale = time_scale
+        self.min_tokens = min_tokens
+        self.max_tokens = max_tokens
+        self.rng = random.Random(seed)
+        self.active = []
+        self.waiting = deque()
+        self._arrival = asyncio.Event()
+        self._last = time.monotonic()
+        self._runner = None
+
+    def _rate(self, n):
+        """Tokens equivalentes por segundo real para cada uma das n gerações ativas."""
+        return self.single_tps * n ** self.batch_exponent / n * self.time_scale
+
+    def _advance(self, now):
+        elapsed = now - self._last
+        self._last = now
+        progress = self._rate(len(self.active)) * elapsed if self.active else 0.0
+        for job in list(self.active):
+            job["done"] += progress
+            if job["first_token"] is None and job["done"] >= self.prefill_work:
+                job["first_token"] = now
+            if job["done"] >= self.prefill_work + job["tokens"] - 1e-9:
+                self.active.remove(job)
+                job["finished"] = now
+                job["future"].set_result(job)
+        while self.waiting and len(self.active) < self.num_parallel:
+            job = self.waiting.popleft()
+            job["started"] = now
+            self.active.append(job)
+
+    async def _run(self):
+        while True:
+            self._advance(time.monotonic())
+            if self.active:
+                rate = self._rate(len(self.active))
+                timeout = min(
+                    ((self.prefill_work if job["first_token"] is None else self.prefill_work + job["tokens"])
+                     - job["done"]) / rate
+                    for job in self.active
+                )
+            else:
+                timeout = None
+            self._arrival.clear()
+            try:
+                await asyncio.wait_for(self._arrival.wait(), timeout=max(timeout, 0.0) if timeout is not None else None)
+            except asyncio.TimeoutError:
+                pass
+
+    async def chat(self, request):
+        await request.json()
+        now = time.monotonic()
+        self._advance(now)
+        job = {
+            "tokens": self.rng.randint(self.min_tokens, self.max_tokens), "done": 0.0, "first_token": None,
+            "arrived": now, "started": None, "future": asyncio.get_running_loop().create_future()
+        }
+        self.waiting.append(job)
+        self._advance(now)  # Admite a geração se houver vaga
+        self._arrival.set()
+        await job["future"]
+        # Durações em nanossegundos de tempo real (o cliente as compara com o próprio relógio)
+        return web.json_response({
+            "model": "simulated",
+            "message": {"role": "assistant", "content": "ok"},
+            "done": True,
+            "total_duration": int((job["finished"] - job["arrived"]) * 1e9),
+            "prompt_eval_duration": int((job["first_token"] - job["started"]) * 1e9),
+            "eval_count": job["tokens"],
+            "eval_duration": int((job["finished"] - job["first_token"]) * 1e9),
+        })
+
+    async def start(self, port):
+        self._runner_task = asyncio.create_task(self._run())
+        app = web.Application()
+        app.router.add_post("/api/chat", self.chat)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", port)
+        await site.start()
+        return site._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self._runner_task.cancel()
+        await self._runner.cleanup()
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+async def run_scenario(profile_name, limit, args):
+    """Executa um cenário (limit = inteiro para limite fixo ou "adaptive") e retorna as métricas."""
+    scale = args.time_scale
+    server = SimulatedOllama(PROFILES[profile_name], scale, args.min_tokens, args.max_tokens, args.seed)
+    port = await server.start(0)
+    limiter = None
+    if limit == "adaptive":
+        limiter = AdaptiveConcurrencyLimiter(
+            initial_limit=args.initial_limit, min_limit=1, max_limit=args.max_limit,
+            window_seconds=args.window / scale
+        )
+    queue = QueueService(max_concurrent=limit if limiter is None else 1, timeout_seconds=3600,
+                         max_backlog=args.clients, max_per_user=args.clients, limiter=limiter)
+    client = httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}",
+                               limits=httpx.Limits(max_connections=args.clients))
+
+    async def generate():
+        # Mesma chamada e registro de métricas de AIService._agenerate
+        start_time = time.monotonic()
+        response = await client.post("/api/chat", json={
+            "model": "simulated", "messages": [{"role": "user", "content": "..."}], "stream": False
+        }, timeout=None)
+        response.raise_for_status()
+        payload = response.json()
+        metrics = ollama_generation_metrics(payload, time.monotonic() - start_time)
+        if metrics is not None:
+            queue.observe_generation(*metrics)
+        return metrics
+
+    samples = []  # (instante de conclusão, latência, ttft, tokens)
+    limit_samples = []
+    start = time.monotonic()
+    deadline = start + args.duration / scale
+
+    async def client_loop(index):
+        while time.monotonic() < deadline:
+            requested = time.monotonic()
+            metrics = await queue.run(generate, user_id=f"user-{index % args.users}", priority="batch")
+            finished = time.monotonic()
+            if metrics is not None and finished <= deadline:
+                samples.append((finished - start, finished - requested, metrics[0], metrics[1]))
+
+    async def sample_limit():
+        while True:
+            limit_samples.append(queue.max_concurrent)
+            await asyncio.sleep(0.05)
+
+    sampler = asyncio.create_task(sample_limit())
+    await asyncio.gather(*(client_loop(i) for i in range(args.clients)))
+    sampler.cancel()
+    await client.aclose()
+    await server.stop()
+
+    half = args.duration / scale / 2
+    tokens = sum(sample[3] for sample in samples)
+    tokens_second_half = sum(sample[3] for sample in samples if sample[0] >= half)
+    latencies = [sample[1] * scale for sample in samples]
+    ttfts = [sample[2] * scale for sample in samples]
+    return {
+        "profile": profile_name,
+        "limit": limit,
+        "requests": len(samples),
+        "tokens_per_second": round(tokens / args.duration, 2),
+        "tokens_per_second_second_half": round(tokens_second_half / (args.duration / 2), 2),
+        "latency_seconds": {"p50": round(percentile(latencies, 50), 2), "p95": round(percentile(latencies, 95), 2)},
+        "ttft_seconds": {"p50": round(percentile(ttfts, 50), 2), "p95": round(percentile(ttfts, 95), 2)},
+        "mean_limit": round(sum(limit_samples) / max(len(limit_samples), 1), 2),
+        "final_limit": queue.max_concurrent,
+        "limiter": limiter.stats() if limiter is not None else None,
+    }
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except Exception:
+        return None
+
+async def run(args):
+    logging.basicConfig(level=logging.WARNING)
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "duration": args.duration,
+            "time_scale": args.time_scale,
+            "clients": args.clients,
+            "users": args.users,
+            "tokens": [args.min_tokens, args.max_tokens],
+            "seed": args.seed,
+        },
+        "results": []
+    }
+
+    for profile_name in args.profiles:
+        profile = PROFILES[profile_name]
+        print(f"\nPerfil {profile_name}: num_parallel={profile['num_parallel']}, "
+              f"{profile['single_tps']} tokens/s isolado, expoente de lote {profile['batch_exponent']}, "
+              f"prefill {profile['prefill_seconds']}s")
+        print(f"{'limite':>9} {'reqs':>6} {'tokens/s':>9} {'2ª metade':>10} {'lat p50':>8} {'lat p95':>8} "
+              f"{'ttft p50':>9} {'limite médio':>13}")
+        for limit in [*args.fixed, "adaptive"]:
+            result = await run_scenario(profile_name, limit, args)
+            report["results"].append(result)
+            print(f"{str(limit):>9} {result['requests']:>6} {result['tokens_per_second']:>9.1f} "
+                  f"{result['tokens_per_second_second_half']:>10.1f} {result['latency_seconds']['p50']:>8.1f} "
+                  f"{result['latency_seconds']['p95']:>8.1f} {result['ttft_seconds']['p50']:>9.2f} "
+                  f"{result['mean_limit']:>13.2f}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"\nResultados salvos em {args.output}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--profiles", nargs="+", choices=sorted(PROFILES), default=["gpu", "cpu"])
+    parser.add_argument("--fixed", type=int, nargs="+", default=[1, 2, 4, 8], help="Limites fixos a comparar")
+    parser.add_argument("--initial-limit", type=int, default=2, help="Limite inicial do adaptativo")
+    parser.add_argument("--max-limit", type=int, default=8)
+    parser.add_argument("--window", type=float, default=10.0, help="Janela do limitador (segundos simulados)")
+    parser.add_argument("--duration", type=float, default=900.0, help="Duração de cada cenário (segundos simulados)")
+    parser.add_argument("--time-scale", type=float, default=50.0, help="Segundos simulados por segundo real")
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--users", type=int, default=4)
+    parser.add_argument("--min-tokens", type=int, default=80)
+    parser.add_argument("--max-tokens", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Arquivo JSON de saída")
+    asyncio.run(run(parser.parse_args()))
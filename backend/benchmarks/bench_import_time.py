@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Guarda de tempo de importação dos módulos que a API carrega na inicialização.
+
+Executa `python -X importtime -c "import <módulo>"` em um processo limpo e falha
+(código de saída 1) se:
+- o tempo cumulativo de importação de algum módulo exceder o orçamento, ou
+- algum módulo pesado (torch, sentence_transformers, transformers) for importado:
+  eles devem ser carregados apenas no aquecimento/primeiro uso do modelo de embedding.
+
+Uso (a partir de backend/):
+    python3 -m benchmarks.bench_import_time
+    python3 -m benchmarks.bench_import_time --budget-ms 1500 --top 15
+    python3 -m benchmarks.bench_import_time --module app.services.vector_store_service app.main
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+DEFAULT_MODULES = ["app.services.vector_store_service", "app.services.embedding_worker"]
+FORBIDDEN_MODULES = ("torch", "sentence_transformers", "transformers")
+
+def measure(module):
+    """
+    Importa o módulo em um subprocesso com -X importtime.
+
+    Returns:
+        Lista de (módulo importado, self em µs, cumulativo em µs) na ordem do relatório
+    """
+    env = dict(os.environ)
+    # database.py exige DATABASE_URL; create_engine não abre conexão na importação
+    env.setdefault("DATABASE_URL", "sqlite://")
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, env=env
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Falha ao importar {module}:\n{result.stderr[-2000:]}")
+
+    entries = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        entries.append((name.strip(), int(self_us), int(cumulative_us)))
+    return entries
+
+def run(modules, budget_ms, top):
+    failures = []
+    for module in modules:
+        entries = measure(module)
+        total_ms = next(cumulative for name, _, cumulative in entries if name == module) / 1000
+        heavy = sorted({name for name, _, _ in entries if name.split(".")[0] in FORBIDDEN_MODULES})
+
+        print(f"\n{module}: {total_ms:.1f} ms (orçamento {budget_ms:.0f} ms), {len(entries)} módulos importados")
+        print(f"{'self (ms)':>10} {'cumulativo (ms)':>16}  módulo")
+        for name, self_us, cumulative_us in sorted(entries, key=lambda entry: entry[1], reverse=True)[:top]:
+            print(f"{self_us / 1000:>10.1f} {cumulative_us / 1000:>16.1f}  {name}")
+
+        if total_ms > budget_ms:
+            failures.append(f"{module} levou {total_ms:.1f} ms (orçamento {budget_ms:.0f} ms)")
+        if heavy:
+            failures.append(f"{module} importou módulos pesados na inicialização: {', '.join(heavy[:5])}")
+
+    if failures:
+        print("\nFALHOU:\n- " + "\n- ".join(failures))
+        return 1
+    print("\nOK")
+    return 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", nargs="+", default=DEFAULT_MODULES)
+    parser.add_argument("--budget-ms", type=float, default=2000)
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+    sys.exit(run(args.module, args.budget_ms, args.top))
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Benchmark do armazenamento quantizado dos índices vetoriais.
+
+Compara o FlatIndex em float32 (referência) com int8 (escala por vetor),
+com e sem o rescoring em float32 dos melhores candidatos, medindo:
+- recall@5: fração dos 5 vizinhos exatos (float32) recuperados
+- memória do índice (matriz + escalas)
+- tempo médio por consulta
+
+Uso (a partir de backend/):
+    python3 -m benchmarks.bench_quantization
+    python3 -m benchmarks.bench_quantization --sizes 10000 100000 --queries 200
+"""
+import argparse
+import time
+
+import numpy as np
+
+from app.services.vector_index import FlatIndex, normalize_rows
+
+DIM = 384
+TOP_K = 5
+
+def build_corpus(size, rng):
+    """Gera vetores agrupados (como embeddings reais) e suas chaves."""
+    centers = rng.normal(size=(max(size // 50, 1), DIM))
+    vectors = centers[rng.integers(0, len(centers), size)] + 0.5 * rng.normal(size=(size, DIM))
+    return [str(i) for i in range(size)], normalize_rows(vectors)
+
+def recall_at_k(expected, actual):
+    """Fração média dos vizinhos esperados presentes nos resultados."""
+    hits = sum(len(set(e) & set(a)) for e, a in zip(expected, actual))
+    return hits / max(sum(len(e) for e in expected), 1)
+
+def run_queries(index, queries, rescore):
+    """Executa as consultas e retorna (chaves por consulta, ms por consulta)."""
+    start = time.perf_counter()
+    results = [[key for key, _ in index.search(query, TOP_K, rescore=rescore)] for query in queries]
+    return results, (time.perf_counter() - start) / len(queries) * 1000
+
+def run(sizes, num_queries, seed):
+    rng = np.random.default_rng(seed)
+    print(f"{'vetores':>10} {'armazenamento':>16} {'recall@5':>9} {'memória (MB)':>13} {'ms/consulta':>12}")
+    for size in sizes:
+        keys, vectors = build_corpus(size, rng)
+        row_of = {key: row for row, key in enumerate(keys)}
+        queries = vectors[rng.integers(0, size, num_queries)] + 0.3 * rng.normal(size=(num_queries, DIM))
+        queries = queries.astype(np.float32)
+        # Os vetores float32 originais, como as matrizes memory-mapped do VectorStoreService
+        exact_vectors = lambda batch: vectors[[row_of[key] for key in batch]]
+
+        baseline = FlatIndex(DIM)
+        baseline.add(keys, vectors)
+        expected, baseline_ms = run_queries(baseline, queries, None)
+        print(f"{size:>10} {'float32':>16} {1.0:>9.3f} {baseline.nbytes / 2**20:>13.1f} {baseline_ms:>12.3f}")
+
+        index = FlatIndex(DIM, storage="int8")
+        index.add(keys, vectors)
+        for label, rescore in (("int8", None), ("int8+rescore", exact_vectors)):
+            actual, ms = run_queries(index, queries, rescore)
+            print(f"{size:>10} {label:>16} {recall_at_k(expected, actual):>9.3f} "
+                  f"{index.nbytes / 2**20:>13.1f} {ms:>12.3f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    run(args.sizes, args.queries, args.seed)
@@ -0,0 +1,379 @@
+#!/usr/bin/env python3
+"""
+Benchmark de ponta a ponta do caminho de RAG (VectorStoreService).
+
+Gera um corpus sintético em português (tarefas, projetos e conversas) por usuário em
+várias escalas e mede, para cada uma:
+- build: update_user_vectorstore completo (planejamento, embeddings, matrizes e disco)
+- construção do índice vetorial e do índice lexical (primeira consulta)
+- latência de retrieve_relevant_context: média, p50 e p99
+- memória residente do usuário (get_stats) e pico de RSS do processo
+- recall@k do índice configurado (ivf, int8) contra a busca exata em float32
+- acerto@k no conjunto de ouro: cada consulta é uma variação do título de um documento
+  conhecido, que deve aparecer entre os k resultados
+
+Roda offline: o encoder padrão é determinístico (soma de vetores aleatórios fixos por
+termo, sem modelo). Com --encoder hashed, usa o backend de n-gramas de caracteres do
+serviço; com --encoder model, o modelo configurado a partir do cache local do Hugging
+Face (HF_HUB_OFFLINE=1). Os resultados saem em JSON para comparação
+entre commits (--output / --compare).
+
+Uso (a partir de backend/):
+    python3 -m benchmarks.bench_rag
+    python3 -m benchmarks.bench_rag --sizes 100 1000 10000 100000 --output rag.json
+    python3 -m benchmarks.bench_rag --index-backend ivf --storage int8 --compare rag.json
+"""
+import argparse
+import atexit
+import json
+import logging
+import os
+import platform
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+import zlib
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import numpy as np
+
+# database.py exige DATABASE_URL; create_engine não abre conexão na importação
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+# Os serviços do benchmark (inclusive a instância global) não tocam no cache da aplicação
+WORK_DIR = tempfile.mkdtemp(prefix="bench-rag-")
+atexit.register(shutil.rmtree, WORK_DIR, ignore_errors=True)
+os.environ["VECTOR_STORE_CACHE_DIR"] = os.path.join(WORK_DIR, "global")
+os.environ.pop("VECTOR_STORE_URL", None)
+
+from sqlalchemy.sql import operators
+
+from app.services.embedding_backends import EmbeddingBackend
+from app.services.lexical_index import tokenize
+
+DIM = 384
+TOP_K = 5
+USER_ID = "bench-user"
+
+VERBS = ["Revisar", "Preparar", "Enviar", "Atualizar", "Agendar", "Corrigir", "Organizar",
+         "Finalizar", "Planejar", "Analisar", "Documentar", "Validar", "Migrar", "Contratar"]
+OBJECTS = ["relatório financeiro", "apresentação do cliente", "orçamento trimestral", "reunião com a equipe",
+           "contrato de fornecedor", "plano de marketing", "backlog da sprint", "pesquisa de usuários",
+           "notas fiscais", "campanha de e-mail", "documentação da API", "treinamento interno",
+           "inventário do estoque", "proposta comercial", "cronograma de entregas", "painel de métricas"]
+QUALIFIERS = ["para a diretoria", "do projeto {project}", "até sexta-feira", "com o time de vendas",
+              "antes da auditoria", "do segundo semestre", "para o cliente {surname}", "da filial de {city}"]
+SURNAMES = ["Silva", "Souza", "Oliveira", "Santos", "Pereira", "Costa", "Rodrigues", "Almeida",
+            "Nascimento", "Lima", "Araújo", "Fernandes", "Carvalho", "Gomes", "Martins", "Rocha"]
+CITIES = ["São Paulo", "Recife", "Curitiba", "Belém", "Florianópolis", "Salvador", "Manaus", "Goiânia"]
+PROJECT_NAMES = ["Alfa", "Aurora", "Horizonte", "Ipê", "Jangada", "Mandacaru", "Pitanga", "Sabiá",
+                 "Tucano", "Vitória-régia", "Cerrado", "Pantanal"]
+DETAILS = ["Verificar os números com o financeiro.", "Incluir os indicadores do último trimestre.",
+           "Alinhar prazos com os responsáveis.", "Revisar pendências da semana anterior.",
+           "Confirmar a agenda com os participantes.", "Separar os anexos necessários.",
+           "Registrar as decisões na ata.", "Priorizar os itens bloqueantes."]
+QUESTIONS = ["Como organizo {object}?", "Qual o prazo ideal para {object}?",
+             "Pode me ajudar a priorizar {object}?", "O que falta para concluir {object}?"]
+
+class HashingEncoder(EmbeddingBackend):
+    """
+    Encoder determinístico para benchmarks offline: cada termo recebe um vetor aleatório
+    fixo (semente = crc32 do termo) e o texto é a média normalizada dos seus termos.
+    Textos com termos em comum ficam próximos, como em um modelo real (em escala menor).
+    """
+
+    def __init__(self, dim: int = DIM):
+        self.dim = dim
+        self.name = f"bench-hashed-terms-{dim}"
+        self._term_vectors = {}
+
+    def _term_vector(self, term: str) -> np.ndarray:
+        vector = self._term_vectors.get(term)
+        if vector is None:
+            vector = np.random.default_rng(zlib.crc32(term.encode("utf-8"))).standard_normal(self.dim)
+            self._term_vectors[term] = vector.astype(np.float32)
+            vector = self._term_vectors[term]
+        return vector
+
+    def encode(self, texts, batch_size: int = 32, **kwargs) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for position, text in enumerate(texts):
+            terms = tokenize(text)
+            if terms:
+                vectors[position] = np.sum([self._term_vector(term) for term in terms], axis=0)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+class CorpusQuery:
+    """Consulta em memória com o subconjunto da API do SQLAlchemy usado pelo VectorStoreService."""
+
+    def __init__(self, rows, columns):
+        self.rows = rows
+        self.columns = columns
+
+    def filter(self, *criteria):
+        for criterion in criteria:
+            # O corpus tem um único usuário: apenas o filtro por IDs (in_) é aplicado
+            if getattr(criterion, "operator", None) is operators.in_op:
+                ids = {str(value) for value in criterion.right.value}
+                self.rows = [row for row in self.rows if str(row.id) in ids]
+        return self
+
+    def order_by(self, *clauses):
+        # As conversas do corpus já estão da mais recente para a mais antiga
+        return self
+
+    def limit(self, count):
+        self.rows = self.rows[:count]
+        return self
+
+    def all(self):
+        if self.columns:
+            return [SimpleNamespace(id=row.id, updated_at=row.updated_at) for row in self.rows]
+        return list(self.rows)
+
+class CorpusSession:
+    """Sessão em memória que atende às consultas feitas pelo VectorStoreService."""
+
+    def __init__(self, rows_by_model):
+        self.rows_by_model = rows_by_model
+
+    def query(self, *entities):
+        model = getattr(entities[0], "class_", entities[0])
+        return CorpusQuery(self.rows_by_model.get(model.__name__, []), columns=len(entities) > 1)
+
+def generate_corpus(size, rng, chat_limit):
+    """
+    Gera um corpus com `size` documentos: ~10% projetos, até chat_limit conversas
+    (o serviço indexa apenas as mais recentes) e o restante em tarefas.
+
+    Returns:
+        Linhas por nome do modelo (Task, Project, ChatHistory)
+    """
+    now = datetime.now(timezone.utc)
+    projects = []
+    for i in range(max(size // 10, 1)):
+        name = f"{rng.choice(PROJECT_NAMES)} {i}"
+        projects.append(SimpleNamespace(
+            id=uuid.UUID(int=rng.getrandbits(128)), title=name, updated_at=now,
+            description=f"Projeto de {rng.choice(OBJECTS)} {rng.choice(QUALIFIERS)}".format(
+                project=name, surname=rng.choice(SURNAMES), city=rng.choice(CITIES))
+        ))
+
+    chats = []
+    for i in range(min(size // 5, chat_limit)):
+        subject = rng.choice(OBJECTS)
+        # Algumas respostas longas exercitam a divisão em trechos
+        answer_sentences = rng.randint(2, 60)
+        chats.append(SimpleNamespace(
+            id=uuid.UUID(int=rng.getrandbits(128)), tags=[subject.split()[0], "produtividade"],
+            user_message=rng.choice(QUESTIONS).format(object=subject),
+            ai_response=" ".join(rng.choice(DETAILS) for _ in range(answer_sentences)),
+            created_at=now - timedelta(minutes=i), updated_at=now - timedelta(minutes=i)
+        ))
+
+    tasks = []
+    for i in range(max(size - len(projects) - len(chats), 0)):
+        project = rng.choice(projects)
+        title = "{} {} {} #{}".format(
+            rng.choice(VERBS), rng.choice(OBJECTS), rng.choice(QUALIFIERS), i
+        ).format(project=project.title, surname=rng.choice(SURNAMES), city=rng.choice(CITIES))
+        tasks.append(SimpleNamespace(
+            id=uuid.UUID(int=rng.getrandbits(128)), title=title, updated_at=now,
+            description=" ".join(rng.sample(DETAILS, rng.randint(0, 3))),
+            status=rng.choice(["todo", "in_progress", "done"]),
+            priority=rng.choice(["low", "medium", "high"])
+        ))
+
+    return {"Task": tasks, "Project": projects, "ChatHistory": chats}
+
+def golden_queries(rows_by_model, count, rng):
+    """Consultas de ouro: títulos de tarefas em minúsculas, sem uma palavra e sem acentos."""
+    tasks = rows_by_model["Task"]
+    queries = []
+    for task in rng.sample(tasks, min(count, len(tasks))):
+        words = task.title.lower().split()
+        del words[rng.randrange(len(words) - 1)]  # Mantém o número (#i), que identifica a tarefa
+        queries.append((" ".join(words), str(task.id)))
+    return queries
+
+def exact_top_chunks(service, query_vector, k):
+    """Busca exata em float32 sobre todos os trechos do usuário (referência do recall)."""
+    keys, blocks = [], []
+    for name, store, _, _ in service._collection_specs():
+        collection = store[USER_ID]
+        keys.extend(service._index_key(name, chunk_id) for chunk_id in collection["chunks"])
+        blocks.append(np.asarray(collection["vectors"], dtype=np.float32))
+    matrix = np.vstack(blocks)
+    norms = np.linalg.norm(matrix, axis=1) * np.linalg.norm(query_vector)
+    scores = matrix @ query_vector / np.maximum(norms, 1e-12)
+    top = np.argsort(-scores)[:k]
+    return [keys[i] for i in top]
+
+def percentile(values, q):
+    return float(np.percentile(values, q)) if values else 0.0
+
+def peak_rss_mb():
+    """Pico de RSS do processo (ru_maxrss é em KB no Linux e em bytes no macOS)."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def create_service(args):
+    """Cria um VectorStoreService isolado (diretório temporário) com o encoder escolhido."""
+    from app.services.vector_store_service import VectorStoreService
+
+    os.environ["VECTOR_STORE_CACHE_DIR"] = tempfile.mkdtemp(dir=WORK_DIR)
+    os.environ["VECTOR_INDEX_BACKEND"] = args.index_backend
+    os.environ["VECTOR_STORAGE_DTYPE"] = args.storage
+    os.environ["VECTOR_STORE_HYBRID"] = "true" if args.hybrid else "false"
+    os.environ["EMBEDDING_BACKEND"] = "hashed" if args.encoder == "hashed" else "sentence-transformers"
+    os.environ["EMBEDDING_FALLBACK"] = "none"
+    os.environ.setdefault("HF_HUB_OFFLINE", "1")
+    service = VectorStoreService()
+
+    if args.encoder == "fake":
+        encoder = HashingEncoder()
+        service.embedding_backend = encoder
+        service.model_name = encoder.name
+    if not service._load_model():
+        raise RuntimeError(f"Modelo {service.model_name} indisponível no cache local: {service.model_error}")
+    return service
+
+def run_size(size, args):
+    """Executa o benchmark de uma escala e retorna as métricas."""
+    rng = random.Random(args.seed + size)
+    service = create_service(args)
+    rows_by_model = generate_corpus(size, rng, service.chat_history_limit)
+    session = CorpusSession(rows_by_model)
+    queries = golden_queries(rows_by_model, args.queries, rng)
+
+    start = time.perf_counter()
+    service.update_user_vectorstore(USER_ID, session, force=True)
+    build_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    index = service._get_user_index(USER_ID)
+    index_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    service._get_lexical_index(USER_ID)
+    lexical_seconds = time.perf_counter() - start
+
+    # Mesmo caminho do serviço: com armazenamento quantizado, rescoring em float32 (VECTOR_RESCORE)
+    rescore = None
+    if service.rescore_enabled and index.quantized:
+        rescore = lambda keys: service._exact_vectors(USER_ID, keys)
+
+    latencies, golden_hits, recall_hits = [], 0, 0
+    for query, expected_id in queries:
+        start = time.perf_counter()
+        results = service.retrieve_relevant_context(USER_ID, query, TOP_K)
+        latencies.append((time.perf_counter() - start) * 1000)
+        golden_hits += any(item["id"] == expected_id for item in results)
+
+        # Recall do índice configurado contra a busca exata, no nível dos trechos
+        query_vector = service._embed_query(query)
+        approximate = [key for key, _ in index.search(query_vector, TOP_K, rescore=rescore)]
+        recall_hits += len(set(approximate) & set(exact_top_chunks(service, query_vector, TOP_K)))
+
+    stats = service.get_stats()
+    documents = sum(len(rows) for rows in rows_by_model.values())
+    return {
+        "documents": documents,
+        "chunks": len(index),
+        "queries": len(queries),
+        "build_seconds": round(build_seconds, 4),
+        "build_docs_per_second": round(documents / build_seconds, 1) if build_seconds else None,
+        "index_build_ms": round(index_seconds * 1000, 3),
+        "lexical_build_ms": round(lexical_seconds * 1000, 3),
+        "query_ms": {
+            "mean": round(float(np.mean(latencies)), 4) if latencies else 0.0,
+            "p50": round(percentile(latencies, 50), 4),
+            "p99": round(percentile(latencies, 99), 4),
+        },
+        f"recall@{TOP_K}": round(recall_hits / max(len(queries) * TOP_K, 1), 4),
+        f"golden_hit@{TOP_K}": round(golden_hits / max(len(queries), 1), 4),
+        "resident_mb": stats["resident_mb"],
+        "index_mb": round(index.nbytes / (1024 * 1024), 3),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except Exception:
+        return None
+
+def compare(report, baseline):
+    """Imprime a variação das métricas principais em relação a um relatório anterior."""
+    previous = {entry["size"]: entry for entry in baseline.get("results", [])}
+    print(f"\nComparação com {baseline['meta'].get('commit')} ({baseline['meta'].get('timestamp')}):")
+    print(f"{'docs':>8} {'métrica':>16} {'antes':>12} {'agora':>12} {'variação':>10}")
+    for entry in report["results"]:
+        before = previous.get(entry["size"])
+        if before is None:
+            continue
+        for label, getter in [("build_seconds", lambda e: e["build_seconds"]),
+                              ("query_p50_ms", lambda e: e["query_ms"]["p50"]),
+                              ("query_p99_ms", lambda e: e["query_ms"]["p99"]),
+                              ("resident_mb", lambda e: e["resident_mb"]),
+                              (f"recall@{TOP_K}", lambda e: e[f"recall@{TOP_K}"])]:
+            old, new = getter(before), getter(entry)
+            change = f"{(new - old) / old * 100:+.1f}%" if old else "-"
+            print(f"{entry['size']:>8} {label:>16} {old:>12} {new:>12} {change:>10}")
+
+def run(args):
+    logging.basicConfig(level=logging.WARNING)
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "encoder": args.encoder,
+            "index_backend": args.index_backend,
+            "storage": args.storage,
+            "hybrid": args.hybrid,
+            "seed": args.seed,
+            "top_k": TOP_K,
+        },
+        "results": []
+    }
+
+    print(f"{'docs':>8} {'trechos':>8} {'build (s)':>10} {'índice (ms)':>12} {'p50 (ms)':>9} "
+          f"{'p99 (ms)':>9} {'recall@5':>9} {'ouro@5':>7} {'MB':>8}")
+    for size in args.sizes:
+        result = {"size": size, **run_size(size, args)}
+        report["results"].append(result)
+        print(f"{result['documents']:>8} {result['chunks']:>8} {result['build_seconds']:>10.2f} "
+              f"{result['index_build_ms']:>12.1f} {result['query_ms']['p50']:>9.2f} {result['query_ms']['p99']:>9.2f} "
+              f"{result[f'recall@{TOP_K}']:>9.3f} {result[f'golden_hit@{TOP_K}']:>7.3f} {result['resident_mb']:>8.2f}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"\nResultados salvos em {args.output}")
+    else:
+        print("\n" + json.dumps(report, indent=2, ensure_ascii=False))
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--encoder", choices=["fake", "hashed", "model"], default="fake")
+    parser.add_argument("--index-backend", choices=["flat", "ivf"], default="flat")
+    parser.add_argument("--storage", choices=["float32", "int8"], default="float32")
+    parser.add_argument("--no-hybrid", dest="hybrid", action="store_false")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Arquivo JSON de saída")
+    parser.add_argument("--compare", help="Relatório JSON anterior para comparação")
+    run(parser.parse_args())
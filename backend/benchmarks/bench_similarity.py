@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark do caminho de similaridade do RAG (retrieve_relevant_context).
+
+Compara, por consulta, o caminho antigo (np.vstack das coleções + normas de todo o
+corpus + np.argsort completo + metadados antes do threshold) com o FlatIndex
+(vetores pré-normalizados, um produto matriz-vetor e top-k via np.argpartition,
+com o threshold aplicado antes de materializar metadados).
+
+Uso (a partir de backend/):
+    python3 -m benchmarks.bench_similarity
+    python3 -m benchmarks.bench_similarity --sizes 1000 10000 100000 --queries 200
+"""
+import argparse
+import time
+
+import numpy as np
+
+from app.services.vector_index import FlatIndex
+
+DIM = 384
+TOP_K = 5
+THRESHOLD = 0.3
+
+def legacy_search(collections, query_vector):
+    """Reproduz o caminho de similaridade anterior ao índice vetorial."""
+    all_vectors = []
+    all_metadata = []
+    for vectors, metadata in collections:
+        all_vectors.append(vectors)
+        all_metadata.extend(metadata)
+
+    combined_vectors = np.vstack(all_vectors)
+    similarity_scores = np.dot(combined_vectors, query_vector) / (
+        np.linalg.norm(combined_vectors, axis=1) * np.linalg.norm(query_vector)
+    )
+    top_indices = np.argsort(similarity_scores)[::-1][:TOP_K]
+    return [
+        {**all_metadata[idx], "score": float(similarity_scores[idx])}
+        for idx in top_indices
+        if similarity_scores[idx] > THRESHOLD
+    ]
+
+def indexed_search(index, metadata_by_key, query_vector):
+    """Caminho atual: FlatIndex com threshold antes dos metadados."""
+    matches = index.search(query_vector, TOP_K, min_score=THRESHOLD)
+    return [{**metadata_by_key[key], "score": score} for key, score in matches]
+
+def build_corpus(size, rng):
+    """Gera vetores agrupados (como embeddings reais) divididos em três coleções."""
+    centers = rng.normal(size=(max(size // 50, 1), DIM))
+    vectors = centers[rng.integers(0, len(centers), size)] + 0.5 * rng.normal(size=(size, DIM))
+    vectors = vectors.astype(np.float32)
+    metadata = [{"id": str(i), "title": f"Documento {i}", "type": "task"} for i in range(size)]
+    bounds = [0, int(size * 0.6), int(size * 0.8), size]
+    collections = [
+        (vectors[bounds[i]:bounds[i + 1]], metadata[bounds[i]:bounds[i + 1]])
+        for i in range(3)
+    ]
+    return vectors, metadata, collections
+
+def time_per_query(search, queries):
+    """Tempo médio por consulta, em milissegundos."""
+    start = time.perf_counter()
+    for query in queries:
+        search(query)
+    return (time.perf_counter() - start) / len(queries) * 1000
+
+def run(sizes, num_queries, seed):
+    rng = np.random.default_rng(seed)
+    print(f"{'vetores':>10} {'antigo (ms)':>12} {'índice (ms)':>12} {'speedup':>8}")
+    for size in sizes:
+        vectors, metadata, collections = build_corpus(size, rng)
+        index = FlatIndex(DIM)
+        keys = [meta["id"] for meta in metadata]
+        index.add(keys, vectors)
+        metadata_by_key = dict(zip(keys, metadata))
+
+        queries = vectors[rng.integers(0, size, num_queries)] + 0.1 * rng.normal(size=(num_queries, DIM))
+        queries = queries.astype(np.float32)
+
+        # Os dois caminhos devem retornar os mesmos documentos
+        for query in queries[:10]:
+            expected = [item["id"] for item in legacy_search(collections, query)]
+            actual = [item["id"] for item in indexed_search(index, metadata_by_key, query)]
+            assert expected == actual, f"Resultados divergentes para {size} vetores"
+
+        legacy_ms = time_per_query(lambda q: legacy_search(collections, q), queries)
+        indexed_ms = time_per_query(lambda q: indexed_search(index, metadata_by_key, q), queries)
+        print(f"{size:>10} {legacy_ms:>12.3f} {indexed_ms:>12.3f} {legacy_ms / indexed_ms:>7.1f}x")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    run(args.sizes, args.queries, args.seed)